@@ -83,3 +83,37 @@ class TestTest(CovidcastBase):
 
         # verify old issue is no longer in latest table
         self.assertIsNone(self._find_matches_for_row(base_row)[latest_view])
+
+    def test_compute_covidcast_meta_incremental(self):
+        # the incremental metadata must equal the full recomputation after loads, reissues and deletions
+        def compare():
+            incremental = self._db.compute_covidcast_meta_incremental()
+            self._db.update_covidcast_meta_cache(incremental)
+            self._db._connection.commit()
+            full = self._db.compute_covidcast_meta()
+            self.assertEqual(len(incremental), len(full))
+            for inc, ful in zip(incremental, full):
+                for key in ful:
+                    if isinstance(ful[key], float):
+                        self.assertAlmostEqual(inc[key], ful[key], places=6, msg=key)
+                    else:
+                        self.assertEqual(inc[key], ful[key], key)
+
+        rows = [
+            CovidcastTestRow.make_default_row(geo_type='state', geo_value=geo_value, time_value=time_value, value=value)
+            for geo_value, value in (('ca', 1.5), ('tx', 4.0), ('pa', None))
+            for time_value in (2020_02_02, 2020_02_03)
+        ]
+        self._insert_rows(rows)
+        self._insert_rows([CovidcastTestRow.make_default_row(signal='other', geo_type='state', geo_value='ca', value=7.0)])
+        compare()
+
+        # a reissue with another value
+        reissue = CovidcastTestRow.make_default_row(geo_type='state', geo_value='tx', time_value=2020_02_02, value=10.0)
+        reissue.issue += 1
+        self._insert_rows([reissue])
+        compare()
+
+        # deleting the reissue restores the previous value
+        self._db.delete_batch([(reissue.geo_value, None, None, None, reissue.issue, reissue.time_value, reissue.geo_type, reissue.signal, reissue.source, reissue.time_type)])
+        compare()
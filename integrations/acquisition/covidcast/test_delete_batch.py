@@ -51,7 +51,12 @@ class DeleteBatch(unittest.TestCase):
         rows = [r + ["day"] for r in rows[1:]]
         self._test_delete_batch(rows)
 
-    def _test_delete_batch(self, cc_deletions):
+    def test_delete_from_tuples_in_chunks(self):
+        with open(path.join(path.dirname(__file__), "delete_batch.csv")) as f:
+            rows = [line.strip().split(",") + ["day"] for line in f][1:]
+        self._test_delete_batch(rows, chunk_rows=1)
+
+    def _test_delete_batch(self, cc_deletions, **kwargs):
         # load sample data
         rows = covidcast_rows_from_args(
             time_value = [0] * 5 + [1] * 5 + [0],
@@ -63,7 +68,7 @@ class DeleteBatch(unittest.TestCase):
         self._db.insert_or_update_bulk(rows)
 
         # delete entries
-        self._db.delete_batch(cc_deletions)
+        self._db.delete_batch(cc_deletions, **kwargs)
 
         cur = self._db._cursor
 
@@ -294,3 +294,22 @@ class CovidcastEndpointTests(CovidcastBase):
         with self.subTest("invalid geo_type"):
             out = self._fetch("/coverage", signal=first.signal_pair(), geo_type="doesnt_exist", format="json")
             self.assertEqual(len(out), 0)
+
+    def test_coverage_only_county(self):
+        """Request the counties without the megacounties from the /coverage endpoint."""
+
+        dates = [2020_04_01, 2020_04_02]
+        geo_values = [["01001", "01003", "01000"], ["01001", "42000", "42003", "42005"]]
+        rows = [
+            CovidcastTestRow.make_default_row(geo_type="county", time_value=date, geo_value=geo_value, value=i)
+            for date, date_geo_values in zip(dates, geo_values)
+            for i, geo_value in enumerate(date_geo_values)
+        ]
+        self._insert_rows(rows)
+        first = rows[0]
+
+        out = self._fetch("/coverage", signal=first.signal_pair(), geo_type="only-county", window=f"{dates[0]}-{dates[1]}", format="json")
+        self.assertEqual([o["time_value"] for o in out], dates)
+        self.assertEqual([o["count"] for o in out], [2, 3])
+        out = self._fetch("/coverage", signal=first.signal_pair(), geo_type="county", window=f"{dates[0]}-{dates[1]}", format="json")
+        self.assertEqual([o["count"] for o in out], [3, 4])
@@ -0,0 +1,74 @@
+"""Measures the time CsvImporter takes to load and validate a county CSV file.
+
+"per-row" emulates the previous behavior of validating each row of the table with `extract_and_check_row`,
+"vectorized" is `load_csv`, which validates whole columns at once. Both build the same `CovidcastRow`s.
+
+usage (with the delphi.epidata package on the PYTHONPATH):
+  python scripts/benchmark_csv_importer.py [--rows 3200] [--repeat 20]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from delphi.epidata.acquisition.covidcast.csv_importer import CsvImporter, PathDetails
+from delphi.epidata.common.covidcast_row import CovidcastRow
+
+
+def write_csv(path: str, n: int):
+    rng = np.random.default_rng(0)
+    value = rng.uniform(0, 100, n)
+    stderr = rng.uniform(0, 5, n)
+    sample_size = rng.integers(50, 5000, n).astype(float)
+    # some missing values with their missingness codes
+    missing = rng.random(n) < 0.05
+    value[missing] = np.nan
+    pd.DataFrame({
+        "geo_id": [f"{1001 + i:05d}" for i in range(n)],
+        "val": value,
+        "se": stderr,
+        "sample_size": sample_size,
+        "missing_val": np.where(missing, 5, 0),
+        "missing_se": 0,
+        "missing_sample_size": 0,
+    }).to_csv(path, index=False)
+
+
+def load_per_row(path: str, details: PathDetails):
+    table = pd.read_csv(path, dtype=CsvImporter.DTYPES)
+    table.rename(columns={"val": "value", "se": "stderr", "missing_val": "missing_value", "missing_se": "missing_stderr"}, inplace=True)
+    for row in table.itertuples(index=False):
+        values, error = CsvImporter.extract_and_check_row(row, details.geo_type, path)
+        if error:
+            yield None
+            continue
+        yield CovidcastRow(
+            details.source, details.signal, details.time_type, details.geo_type, details.time_value,
+            values.geo_value, values.value, values.stderr, values.sample_size,
+            values.missing_value, values.missing_stderr, values.missing_sample_size,
+            details.issue, details.lag,
+        )
+
+
+def main(args):
+    details = PathDetails(20200102, 1, "src", "sig", "day", 20200101, "county")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "20200101_county_sig.csv")
+        write_csv(path, args.rows)
+        for name, load in (("per-row", load_per_row), ("vectorized", CsvImporter.load_csv)):
+            rows = list(load(path, details))
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = list(load(path, details))
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{name:<10} {elapsed * 1000:8.2f} ms/file {len(rows) / elapsed:12,.0f} rows/s {sum(r is None for r in rows)} invalid")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3200)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
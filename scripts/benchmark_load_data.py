@@ -0,0 +1,71 @@
+"""Measures how fast Database.insert_or_update_batch loads rows into epimetric_load, in rows/s.
+
+"insert" uses the multi-row INSERT of executemany, "load_data" uses LOAD DATA LOCAL INFILE from a temporary TSV file.
+Only the load table and the is_latest_issue fix-up are measured (the dbjobs are suppressed),
+and every run is rolled back, so the database is left unchanged.
+
+Needs a database with the v4 schema and `local_infile` enabled, e.g. the one of the local development containers
+(`make db` in dev/local), and the secrets pointing to it.
+
+usage (with the delphi.epidata package on the PYTHONPATH):
+  python scripts/benchmark_load_data.py [--rows 200000] [--repeat 3]
+"""
+import argparse
+import time
+
+from delphi.epidata.acquisition.covidcast.database import Database
+from delphi.epidata.common.covidcast_row import CovidcastRow
+
+
+def make_rows(n: int):
+    return [
+        CovidcastRow(
+            "benchmark-src",
+            "benchmark_sig",
+            "day",
+            "county",
+            20200101 + i // 3200,
+            f"{1001 + i % 3200:05d}",
+            i * 0.37,
+            0.1,
+            100.0,
+            0,
+            0,
+            0,
+            20200601,
+            150,
+        )
+        for i in range(n)
+    ]
+
+
+def run(rows, load_data_infile: bool, repeat: int) -> float:
+    database = Database()
+    database.connect(load_data_infile=load_data_infile)
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            database.insert_or_update_batch(rows, suppress_jobs=True)
+            best = min(best, time.perf_counter() - start)
+            database.rollback()
+        # a refused LOAD DATA LOCAL INFILE silently falls back to INSERT
+        if load_data_infile and not database._load_data_infile:
+            print("LOAD DATA LOCAL INFILE was refused, the numbers are the ones of INSERT")
+        return best
+    finally:
+        database.disconnect(False)
+
+
+def main(args):
+    rows = make_rows(args.rows)
+    for name, load_data_infile in (("insert", False), ("load_data", True)):
+        elapsed = run(rows, load_data_infile, args.repeat)
+        print(f"{name:<10} {elapsed:7.3f}s {len(rows) / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,71 @@
+"""Microbenchmark of the per row `parse_row` against the batched `RowParser` of `_query.py`.
+
+Rows are streamed from an in-memory SQLite table shaped like the /covidcast response.
+
+usage (with the delphi.epidata package on the PYTHONPATH):
+  python scripts/benchmark_parse_row.py [--rows 100000] [--batch-size 1000]
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+from delphi.epidata.server._query import ROW_BATCH_SIZE, iter_parsed_rows, parse_row
+
+FIELDS_STRING = ["geo_value", "signal", "source", "geo_type", "time_type"]
+FIELDS_INT = ["time_value", "direction", "issue", "lag", "missing_value", "missing_stderr", "missing_sample_size"]
+FIELDS_FLOAT = ["value", "stderr", "sample_size"]
+
+
+def create_table(conn, n: int):
+    conn.execute(
+        text(
+            """CREATE TABLE epimetric (geo_value TEXT, signal TEXT, source TEXT, geo_type TEXT, time_type TEXT,
+            time_value INTEGER, direction INTEGER, issue INTEGER, lag INTEGER,
+            missing_value INTEGER, missing_stderr INTEGER, missing_sample_size INTEGER,
+            value REAL, stderr REAL, sample_size REAL)"""
+        )
+    )
+    rows = [
+        dict(geo_value=f"{i % 3000:05d}", time_value=20200101 + i // 3000, value=i * 0.5, stderr=None if i % 7 else 0.1, sample_size=float(i % 100))
+        for i in range(n)
+    ]
+    conn.execute(
+        text(
+            """INSERT INTO epimetric VALUES (:geo_value, 'sig', 'src', 'county', 'day', :time_value, NULL, :time_value, 0,
+            0, 0, 0, :value, :stderr, :sample_size)"""
+        ),
+        rows,
+    )
+
+
+def bench(name: str, conn, n: int, consume) -> float:
+    result = conn.execution_options(stream_results=True).execute(text("SELECT * FROM epimetric"))
+    start = time.perf_counter()
+    count = consume(result)
+    elapsed = time.perf_counter() - start
+    assert count == n
+    print(f"{name:<10} {elapsed:7.3f}s {n / elapsed:12,.0f} rows/s {elapsed / n * 1e9:8.0f} ns/row")
+    return elapsed
+
+
+def main(args):
+    conn = create_engine("sqlite://").connect()
+    create_table(conn, args.rows)
+
+    def per_row(result):
+        return sum(1 for row in result if parse_row(row, FIELDS_STRING, FIELDS_INT, FIELDS_FLOAT) is not None)
+
+    def batched(result):
+        return sum(1 for _ in iter_parsed_rows(result, FIELDS_STRING, FIELDS_INT, FIELDS_FLOAT, batch_size=args.batch_size))
+
+    baseline = bench("parse_row", conn, args.rows, per_row)
+    compiled = bench("RowParser", conn, args.rows, batched)
+    print(f"speedup: {baseline / compiled:.2f}x (includes fetching the rows from SQLite)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=ROW_BATCH_SIZE)
+    main(parser.parse_args())
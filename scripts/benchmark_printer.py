@@ -0,0 +1,77 @@
+"""Measures the throughput of the response printers in rows/s and MB/s.
+
+"per-row" emulates the previous behavior of one serialization call and one WSGI chunk per row,
+"batched" uses the configured batch size and flush threshold. The columnar formats are only run batched.
+
+usage (with the delphi.epidata package on the PYTHONPATH):
+  python scripts/benchmark_printer.py [--rows 200000] [--formats classic json jsonl csv tree arrow parquet]
+"""
+import argparse
+import time
+
+from delphi.epidata.server._common import app
+from delphi.epidata.server._printer import create_printer
+
+FIELDS_STRING = ["geo_value", "signal", "source", "geo_type", "time_type"]
+FIELDS_INT = ["time_value", "direction", "issue", "lag", "missing_value", "missing_stderr", "missing_sample_size"]
+FIELDS_FLOAT = ["value", "stderr", "sample_size"]
+# a record batch / row group per row is not a meaningful baseline
+COLUMNAR_FORMATS = ["arrow", "parquet"]
+
+
+def make_rows(n: int):
+    return [
+        dict(
+            geo_value=f"{i % 3000:05d}",
+            signal="smoothed_cli",
+            source="fb-survey",
+            geo_type="county",
+            time_type="day",
+            time_value=20200101 + i // 3000,
+            direction=None,
+            issue=20200101 + i // 3000,
+            lag=0,
+            missing_value=0,
+            missing_stderr=0,
+            missing_sample_size=0,
+            value=i * 0.37,
+            stderr=0.1,
+            sample_size=100.0,
+        )
+        for i in range(n)
+    ]
+
+
+def run(format: str, rows, per_row: bool):
+    with app.test_request_context("/"):
+        p = create_printer(None if format == "classic" else format)
+        p.set_fields(FIELDS_STRING, FIELDS_INT, FIELDS_FLOAT)
+        if per_row:
+            p._batch_rows = 1
+            p._flush_bytes = 0
+        start = time.perf_counter()
+        size = chunks = 0
+        # copies, since the tree printer modifies the rows
+        for chunk in p(dict(r) for r in rows).response:
+            size += len(chunk)
+            chunks += 1
+        return time.perf_counter() - start, size, chunks
+
+
+def main(args):
+    rows = make_rows(args.rows)
+    for format in args.formats:
+        modes = (("batched", False),) if format in COLUMNAR_FORMATS else (("per-row", True), ("batched", False))
+        for name, per_row in modes:
+            elapsed, size, chunks = run(format, rows, per_row)
+            print(
+                f"{format:<8} {name:<8} {elapsed:7.3f}s {len(rows) / elapsed:12,.0f} rows/s "
+                f"{size / elapsed / 1e6:8.1f} MB/s {chunks:8d} chunks"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--formats", nargs="+", default=["classic", "json", "jsonl", "csv", "tree", "arrow", "parquet"])
+    main(parser.parse_args())
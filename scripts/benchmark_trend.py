@@ -0,0 +1,77 @@
+"""Compares the per-series trend computation (`compute_trends` / `compute_trend`) with the vectorized `TrendSeries`.
+
+Uses the shape of a nationwide /trendseries (or /trend) request: every county over a window of days,
+starting from the result rows, as the endpoints do, and checking that both give the same records.
+The records are timed as they are streamed to the printer by the endpoints, i.e. without keeping all of them.
+
+usage (with the delphi.epidata package on the PYTHONPATH):
+  python scripts/benchmark_trend.py [--counties 3200] [--days 90] [--repeat 3]
+"""
+import argparse
+import random
+import time
+from collections import deque
+from itertools import groupby
+
+from delphi.epidata.server.endpoints.covidcast_utils.trend import TrendSeries, compute_trend, compute_trends
+from delphi.epidata.server.utils import shift_day_value
+
+
+def make_rows(counties: int, days: int):
+    random.seed(0)
+    first_day = 20210101
+    time_values = [shift_day_value(first_day, i) for i in range(days)]
+    return [
+        ("county", f"{1000 + c:05d}", "src", "sig", t, random.random() * 100)
+        for c in range(counties)
+        for t in time_values
+    ]
+
+
+def per_series_trends(rows, shifter):
+    return (
+        t.asdict()
+        for (geo_type, geo_value, source, signal), group in groupby(rows, lambda row: row[:4])
+        for t in compute_trends(geo_type, geo_value, source, signal, shifter, ((row[4], row[5]) for row in group))
+    )
+
+
+def per_series_trend(rows, current_time, basis_time):
+    return (
+        compute_trend(geo_type, geo_value, source, signal, current_time, basis_time, ((row[4], row[5]) for row in group)).asdict()
+        for (geo_type, geo_value, source, signal), group in groupby(rows, lambda row: row[:4])
+    )
+
+
+def best_of(repeat: int, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        deque(fn(), maxlen=0)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    rows = make_rows(args.counties, args.days)
+    shifter = lambda x: shift_day_value(x, -7)
+    current_time = rows[-1][4]
+    basis_time = shifter(current_time)
+    cases = [
+        ("trendseries", lambda: per_series_trends(rows, shifter), lambda: TrendSeries.from_rows(rows).trends(shifter)),
+        ("trend", lambda: per_series_trend(rows, current_time, basis_time), lambda: TrendSeries.from_rows(rows).trend(current_time, basis_time)),
+    ]
+    print(f"{len(rows):,} rows")
+    for name, reference, vectorized in cases:
+        assert list(vectorized()) == list(reference()), f"{name}: different trends"
+        reference_elapsed = best_of(args.repeat, reference)
+        vectorized_elapsed = best_of(args.repeat, vectorized)
+        print(f"{name:<12} per series {reference_elapsed:7.3f}s  vectorized {vectorized_elapsed:7.3f}s  {reference_elapsed / vectorized_elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counties", type=int, default=3200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -16,6 +16,7 @@ def get_argument_parser():
   parser = argparse.ArgumentParser()
   parser.add_argument("--log_file", help="filename for log output")
   parser.add_argument("--num_threads", type=int, help="number of worker threads to spawn for processing source/signal pairs")
+  parser.add_argument("--incremental", action="store_true", help="only recompute the metadata of data changed since the last update")
   return parser
 
 
@@ -26,9 +27,11 @@ def main(args, epidata_impl=Epidata, database_impl=Database):
   """
   log_file = None
   num_threads = None
+  incremental = False
   if (args):
     log_file = args.log_file
     num_threads = args.num_threads
+    incremental = args.incremental
 
   logger = get_structured_logger(
       "metadata_cache_updater",
@@ -40,7 +43,12 @@ def main(args, epidata_impl=Epidata, database_impl=Database):
   # fetch metadata
   try:
     metadata_calculation_start_time = time.time()
-    metadata = database.compute_covidcast_meta(n_threads=num_threads)
+    if incremental:
+      metadata = database.compute_covidcast_meta_incremental()
+    else:
+      # the groups changed before the full computation don't need to be recomputed incrementally anymore
+      dirty = database.read_meta_dirty()
+      metadata = database.compute_covidcast_meta(n_threads=num_threads)
     metadata_calculation_interval_in_seconds = time.time() - metadata_calculation_start_time
   except:
     # clean up before failing
@@ -58,15 +66,20 @@ def main(args, epidata_impl=Epidata, database_impl=Database):
     return False
 
   # update the cache
+  updated = False
   try:
     metadata_update_start_time = time.time()
     database.update_covidcast_meta_cache(metadata)
+    if not incremental:
+      database.clear_meta_dirty(dirty)
     metadata_update_interval_in_seconds = time.time() - metadata_update_start_time
     logger.info('successfully cached epidata')
+    updated = True
   finally:
     # no catch block so that an exception above will cause the program to
     # fail after the following cleanup
-    database.disconnect(True)
+    # (without the cache, the incremental changes must not be committed either)
+    database.disconnect(updated)
 
   logger.info(
       "Generated and updated covidcast metadata",
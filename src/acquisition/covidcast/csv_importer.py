@@ -10,6 +10,7 @@ from typing import Iterator, NamedTuple, Optional, Tuple
 
 # third party
 import epiweeks as epi
+import numpy as np
 import pandas as pd
 
 # first party
@@ -366,15 +367,158 @@ class CsvImporter:
     return (CsvRowValue(geo_id, value, stderr, sample_size, missing_value, missing_stderr, missing_sample_size), None)
 
 
+  # null-ish quantities, see `maybe_apply`
+  NULL_STRINGS = ['', 'na', 'nan', 'none']
+  INF_STRINGS = ['inf', '-inf']
+
+  # geo_id string bounds and integer bounds of each geo_type, see `extract_and_check_row`
+  GEO_ID_STRING_BOUNDS = {
+    'county': (5, '01000', '80000'),
+    'msa': (5, '10000', '99999'),
+    'state': (2, 'aa', 'zz'),
+    'nation': (2, 'aa', 'zz'),
+  }
+  GEO_ID_INT_BOUNDS = {
+    'hrr': (1, 500),
+    'msa': (None, None),
+    'dma': (450, 950),
+    'hhs': (1, 10),
+  }
+
+  # the validated columns and the CSV column for their missingness code
+  QUANTITY_COLUMNS = [
+    ('value', 'missing_value'),
+    ('stderr', 'missing_stderr'),
+    ('sample_size', 'missing_sample_size'),
+  ]
+
+
   @staticmethod
-  def load_csv(filepath: str, details: PathDetails) -> Iterator[Optional[CovidcastRow]]:
-    """Load, validate, and yield data as `RowValues` from a CSV file.
+  def parse_quantities(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply `maybe_apply(float, ...)` to a whole column.
 
-    filepath: the CSV file to be loaded
-    geo_type: the geographic resolution (e.g. county)
+    Returns the float values, NaN for null-ish quantities, and a mask of the
+    quantities which are not numbers or are infinite.
+    """
 
-    In case of a validation error, `None` is yielded for the offending row,
-    including the header.
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+      values = column.to_numpy(dtype=float, na_value=np.nan)
+      return values, np.isinf(values)
+
+    text = column.astype(str).str.lower()
+    null = text.isin(CsvImporter.NULL_STRINGS).to_numpy()
+    inf = text.isin(CsvImporter.INF_STRINGS).to_numpy()
+    values = pd.to_numeric(column.where(~(null | inf)), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    # whatever pandas could not parse gets a second chance with the python parser, as in `maybe_apply`
+    errors = inf.copy()
+    for i in np.flatnonzero(np.isnan(values) & ~null & ~inf):
+      try:
+        values[i] = float(column.iat[i])
+      except (ValueError, TypeError):
+        errors[i] = True
+    return values, errors
+
+
+  @staticmethod
+  def parse_integers(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply `floaty_int` to a whole column.
+
+    Returns the integers and a mask of the entries which are not integers.
+    """
+
+    values, errors = CsvImporter.parse_quantities(column)
+    # beyond that, floats are not exact and do not fit into int64 anyway
+    errors |= ~(np.abs(values) < 2 ** 53)
+    errors[~errors] = values[~errors] != np.floor(values[~errors])
+    return np.where(errors, 0, values).astype(np.int64), errors
+
+
+  @staticmethod
+  def check_geo_ids(geo_ids: pd.Series, geo_type: str) -> Tuple[pd.Series, pd.Series]:
+    """Apply the geo_id sanity checks of `extract_and_check_row` to a whole column.
+
+    Returns the normalized geo values and the name of the field which failed
+    the sanity check (or None) for each row.
+    """
+
+    try:
+      # use consistent capitalization (e.g. for states), non-strings become NaN
+      geo_values = geo_ids.astype(object).str.lower()
+    except AttributeError:
+      # no strings at all
+      geo_values = pd.Series(np.nan, index=geo_ids.index, dtype=object)
+    invalid = geo_values.isna().to_numpy()
+
+    if geo_type not in CsvImporter.GEOGRAPHIC_RESOLUTIONS:
+      return geo_values, pd.Series(np.where(invalid, 'geo_id', 'geo_type'), index=geo_ids.index, dtype=object)
+
+    if geo_type in CsvImporter.GEO_ID_INT_BOUNDS:
+      # these particular ids are prone to be written as ints -- and floats
+      numbers, not_integers = CsvImporter.parse_integers(geo_values.where(~invalid, 'na'))
+      invalid |= not_integers
+      low, high = CsvImporter.GEO_ID_INT_BOUNDS[geo_type]
+      if low is not None:
+        invalid |= (numbers < low) | (numbers > high)
+      geo_values = pd.Series(numbers.astype(str), index=geo_ids.index, dtype=object)
+
+    if geo_type in CsvImporter.GEO_ID_STRING_BOUNDS:
+      length, low, high = CsvImporter.GEO_ID_STRING_BOUNDS[geo_type]
+      strings = geo_values.where(~invalid, '')
+      invalid |= ~(strings.str.len().eq(length) & (strings >= low) & (strings <= high)).to_numpy()
+
+    return geo_values, pd.Series(np.where(invalid, 'geo_id', None), index=geo_ids.index, dtype=object)
+
+
+  @staticmethod
+  def validate_table(table: pd.DataFrame, geo_type: str, filepath: Optional[str] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    """Vectorized `extract_and_check_row` over all rows of a CSV table.
+
+    Returns a table with the `CsvRowValue` columns (NaN for missing quantities)
+    and the name of the field which failed the sanity checks (or None) for each
+    row, the values of rows with an error are undefined.
+
+    table: the CSV table, with columns renamed as in `load_csv`
+    geo_type: the geographic resolution of the file
+    """
+    logger = get_structured_logger('load_csv')
+
+    geo_values, errors = CsvImporter.check_geo_ids(table['geo_id'], geo_type)
+    values = pd.DataFrame({'geo_value': geo_values}, index=table.index)
+    for name, _ in CsvImporter.QUANTITY_COLUMNS:
+      quantities, invalid = CsvImporter.parse_quantities(table[name])
+      if name != 'value':
+        # stderr and sample_size can not be negative
+        invalid |= quantities < 0
+      # only the first failed check is reported
+      errors = errors.where(~invalid | errors.notna(), name)
+      values[name] = quantities
+
+    # reconcile the missingness codes with the presence of the quantities
+    valid = errors.isna().to_numpy()
+    for name, missing_name in CsvImporter.QUANTITY_COLUMNS:
+      present = ~np.isnan(values[name].to_numpy())
+      if missing_name in table.columns:
+        codes, unknown = CsvImporter.parse_integers(table[missing_name])
+      else:
+        codes, unknown = np.zeros(len(table), dtype=np.int64), np.ones(len(table), dtype=bool)
+      contradicting = ~unknown & ((present & (codes != Nans.NOT_MISSING.value)) | (~present & (codes == Nans.NOT_MISSING.value)))
+      for row in table[contradicting & valid].itertuples(index=False):
+        logger.warning(event = f"{missing_name} column contradicting {name} presence.", detail = (str(row)), file = filepath)
+      values[missing_name] = np.where(
+        unknown | contradicting,
+        np.where(present, Nans.NOT_MISSING.value, Nans.OTHER.value),
+        codes,
+      )
+
+    return values, errors
+
+
+  @staticmethod
+  def read_and_validate_csv(filepath: str, details: PathDetails) -> Optional[Tuple[pd.DataFrame, np.ndarray]]:
+    """Load and validate a CSV file with `validate_table`.
+
+    Returns the validated values and the mask of the valid rows, or None if
+    the header is invalid. Invalid rows are logged.
     """
     logger = get_structured_logger('load_csv')
 
@@ -386,32 +530,86 @@ class CsvImporter:
 
     if not CsvImporter.is_header_valid(table.columns):
       logger.warning(event='invalid header', detail=table.columns, file=filepath)
+      return None
+
+    table.rename(columns={"val": "value", "se": "stderr", "missing_val": "missing_value", "missing_se": "missing_stderr"}, inplace=True)
+
+    values, errors = CsvImporter.validate_table(table, details.geo_type, filepath)
+    valid = errors.isna().to_numpy()
+    for row, error in zip(table[~valid].itertuples(index=False), errors[~valid]):
+      logger.warning(event = 'invalid value for row', detail=(str(row), error), file=filepath)
+    return values, valid
+
+
+  @staticmethod
+  def iter_rows(values: pd.DataFrame, details: PathDetails, chunk_rows: int = 10000) -> Iterator[CovidcastRow]:
+    """Yield a `CovidcastRow` for each row of validated values.
+
+    The values are converted to python values (None for missing quantities)
+    `chunk_rows` at a time.
+    """
+
+    for start in range(0, len(values), chunk_rows):
+      columns = []
+      for name in ('geo_value', 'value', 'stderr', 'sample_size', 'missing_value', 'missing_stderr', 'missing_sample_size'):
+        column = values[name].to_numpy()[start:start + chunk_rows]
+        if column.dtype.kind == 'f':
+          column = np.where(np.isnan(column), None, column.astype(object))
+        columns.append(column.tolist())
+
+      for geo_value, value, stderr, sample_size, missing_value, missing_stderr, missing_sample_size in zip(*columns):
+        yield CovidcastRow(
+          details.source,
+          details.signal,
+          details.time_type,
+          details.geo_type,
+          details.time_value,
+          geo_value,
+          value,
+          stderr,
+          sample_size,
+          missing_value,
+          missing_stderr,
+          missing_sample_size,
+          details.issue,
+          details.lag,
+        )
+
+
+  @staticmethod
+  def load_csv(filepath: str, details: PathDetails) -> Iterator[Optional[CovidcastRow]]:
+    """Load, validate, and yield data as `RowValues` from a CSV file.
+
+    filepath: the CSV file to be loaded
+    geo_type: the geographic resolution (e.g. county)
+
+    In case of a validation error, `None` is yielded for the offending row,
+    including the header.
+    """
+
+    validated = CsvImporter.read_and_validate_csv(filepath, details)
+    if validated is None:
       yield None
       return
 
-    table.rename(columns={"val": "value", "se": "stderr", "missing_val": "missing_value", "missing_se": "missing_stderr"}, inplace=True)
+    values, valid = validated
+    valid_rows = CsvImporter.iter_rows(values[valid], details)
+    for is_valid in valid:
+      yield next(valid_rows) if is_valid else None
 
-    for row in table.itertuples(index=False):
-      csv_row_values, error = CsvImporter.extract_and_check_row(row, details.geo_type, filepath)
 
-      if error:
-        logger.warning(event = 'invalid value for row', detail=(str(row), error), file=filepath)
-        yield None
-        continue
+  @staticmethod
+  def load_valid_csv(filepath: str, details: PathDetails) -> Optional[Iterator[CovidcastRow]]:
+    """Load and validate a CSV file, like `load_csv` but all or nothing.
 
-      yield CovidcastRow(
-        details.source,
-        details.signal,
-        details.time_type,
-        details.geo_type,
-        details.time_value,
-        csv_row_values.geo_value,
-        csv_row_values.value,
-        csv_row_values.stderr,
-        csv_row_values.sample_size,
-        csv_row_values.missing_value,
-        csv_row_values.missing_stderr,
-        csv_row_values.missing_sample_size,
-        details.issue,
-        details.lag,
-      )
+    Returns an iterator over the rows, which are created as they are consumed,
+    if the file has at least one row and all of them are valid, None otherwise.
+    """
+
+    validated = CsvImporter.read_and_validate_csv(filepath, details)
+    if validated is None:
+      return None
+    values, valid = validated
+    if not valid.size or not valid.all():
+      return None
+    return CsvImporter.iter_rows(values, details)
@@ -4,15 +4,21 @@
 import argparse
 import os
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from logging import Logger
-from typing import Callable, Iterable, Optional, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
 # first party
 from delphi.epidata.acquisition.covidcast.csv_importer import CsvImporter, PathDetails
-from delphi.epidata.acquisition.covidcast.database import Database, DBLoadStateException
-from delphi.epidata.acquisition.covidcast.file_archiver import FileArchiver
+from delphi.epidata.acquisition.covidcast.database import Database, DBLoadStateException, LoadSession
+from delphi.epidata.acquisition.covidcast.file_archiver import CODECS, BackgroundArchiver, FileArchiver
+from delphi.epidata.common.covidcast_row import CovidcastRow
 from delphi.epidata.common.logger import get_structured_logger
 
+# (path, details, rows) of a parsed file, rows are None if any of them is invalid
+ParsedFile = Tuple[str, Optional[PathDetails], Optional[List[CovidcastRow]]]
+
 
 def get_argument_parser():
   """Define command line arguments."""
@@ -33,6 +39,43 @@ def get_argument_parser():
     nargs='?',
     default='*',
     help='Name of one indicator directory to run acquisition on')
+  parser.add_argument(
+    '--workers',
+    type=int,
+    default=0,
+    help='number of processes parsing CSVs, which enables the pipelined mode inserting many files at once (defaults to 0, one file at a time)')
+  parser.add_argument(
+    '--batch_rows',
+    type=int,
+    default=500000,
+    help='maximum number of rows inserted at once in pipelined mode')
+  parser.add_argument(
+    '--batch_seconds',
+    type=float,
+    default=60.0,
+    help='maximum number of seconds rows are staged before being inserted in pipelined mode')
+  parser.add_argument(
+    '--load_data_infile',
+    action='store_true',
+    help='load rows with LOAD DATA LOCAL INFILE instead of INSERT statements, falling back to the latter if the server refuses')
+  parser.add_argument(
+    '--key_cache',
+    action='store_true',
+    help='resolve dimension keys from an in-memory cache, only if no other process writes to the dimension tables (e.g. no concurrent --indicator_name runs)')
+  parser.add_argument(
+    '--archive_codec',
+    choices=sorted(CODECS),
+    default='gzip',
+    help='compression codec of the archived successful CSVs (zstd requires the zstandard package)')
+  parser.add_argument(
+    '--archive_level',
+    type=int,
+    help='compression level of the archived successful CSVs (defaults to 9 for gzip and 3 for zstd)')
+  parser.add_argument(
+    '--archive_threads',
+    type=int,
+    default=4,
+    help='number of threads archiving CSVs in the background (0 archives them before handling the next one)')
   return parser
 
 
@@ -47,7 +90,7 @@ def collect_files(data_dir: str, specific_issue_date: bool, indicator_name="*"):
   return results
 
 
-def make_handlers(data_dir: str, specific_issue_date: bool):
+def make_handlers(data_dir: str, specific_issue_date: bool, codec: str = 'gzip', level: Optional[int] = None):
   if specific_issue_date:
     # issue-specific uploads are always one-offs, so we can leave all
     # files in place without worrying about cleaning up
@@ -56,7 +99,7 @@ def make_handlers(data_dir: str, specific_issue_date: bool):
 
     def handle_successful(path_src, filename, source, logger):
       logger.info(event='archiving as successful',file=filename)
-      FileArchiver.archive_inplace(path_src, filename)
+      FileArchiver.archive_inplace(path_src, filename, codec=codec, level=level)
   else:
     # normal automation runs require some shuffling to remove files
     # from receiving and place them in the archive
@@ -75,16 +118,49 @@ def make_handlers(data_dir: str, specific_issue_date: bool):
       logger.info(event='archiving as successful',file=filename)
       path_dst = os.path.join(archive_successful_dir, source)
       compress = True
-      FileArchiver.archive_file(path_src, path_dst, filename, compress)
+      FileArchiver.archive_file(path_src, path_dst, filename, compress, codec=codec, level=level)
 
   return handle_successful, handle_failed
 
 
+def load_file(path_details: Tuple[str, Optional[PathDetails]]) -> ParsedFile:
+  """Parse and validate a CSV file, keeping its rows only if all of them are valid."""
+  path, details = path_details
+  if not details:
+    return path, details, None
+  rows = CsvImporter.load_valid_csv(path, details)
+  return path, details, list(rows) if rows is not None else None
+
+
+def parse_files(path_details: Iterable[Tuple[str, Optional[PathDetails]]], workers: int) -> Iterator[ParsedFile]:
+  """Yield the parsed files in order, parsing up to `2 * workers` files ahead in a process pool."""
+  if not workers:
+    yield from map(load_file, path_details)
+    return
+  with ProcessPoolExecutor(workers) as pool:
+    pending = deque()
+    try:
+      for item in path_details:
+        pending.append(pool.submit(load_file, item))
+        if len(pending) >= 2 * workers:
+          yield pending.popleft().result()
+      while pending:
+        yield pending.popleft().result()
+    finally:
+      # stopped early, don't wait for files which are not needed anymore
+      for future in pending:
+        future.cancel()
+
+
 def upload_archive(
   path_details: Iterable[Tuple[str, Optional[PathDetails]]],
   database: Database,
   handlers: Tuple[Callable],
-  logger: Logger
+  logger: Logger,
+  workers: int = 0,
+  batch_rows: int = 500000,
+  batch_seconds: float = 60.0,
+  archive_threads: int = 4,
   ):
   """Upload CSVs to the database and archive them using the specified handlers.
 
@@ -94,9 +170,36 @@ def upload_archive(
 
   :handlers: functions for archiving (successful, failed) files
 
+  :workers: if positive, use `upload_archive_pipelined` with that many parsing processes
+
+  :batch_rows: maximum number of rows inserted at once in pipelined mode
+
+  :batch_seconds: maximum number of seconds rows are staged before being inserted in pipelined mode
+
+  :archive_threads: number of threads archiving the files in the background, so that the insertions don't wait for them
+
   :return: the number of modified rows
   """
-  archive_as_successful, archive_as_failed = handlers
+  if workers:
+    return upload_archive_pipelined(path_details, database, handlers, logger, workers, batch_rows, batch_seconds, archive_threads)
+
+  with BackgroundArchiver(archive_threads) as archiver:
+    return _upload_archive_files(path_details, database, handlers, logger, archiver)
+
+
+def _upload_archive_files(
+  path_details: Iterable[Tuple[str, Optional[PathDetails]]],
+  database: Database,
+  handlers: Tuple[Callable],
+  logger: Logger,
+  archiver: BackgroundArchiver,
+  ):
+  """Upload CSVs to the database one at a time, as `upload_archive`."""
+  def archive_as_successful(*args):
+    archiver.submit(handlers[0], *args)
+  def archive_as_failed(*args):
+    archiver.submit(handlers[1], *args)
+
   total_modified_row_count = 0
   # iterate over each file
   for path, details in path_details:
@@ -108,12 +211,12 @@ def upload_archive(
       archive_as_failed(path_src, filename, 'unknown',logger)
       continue
 
-    csv_rows = CsvImporter.load_csv(path, details)
-    rows_list = list(csv_rows)
-    all_rows_valid = rows_list and all(r is not None for r in rows_list)
+    # rows are streamed into the database rather than held in memory
+    csv_rows = CsvImporter.load_valid_csv(path, details)
+    all_rows_valid = csv_rows is not None
     if all_rows_valid:
       try:
-        modified_row_count = database.insert_or_update_bulk(rows_list)
+        modified_row_count = database.insert_or_update_bulk(csv_rows)
         logger.info(f"insert_or_update_bulk {filename} returned {modified_row_count}")
         logger.info(
           "Inserted database rows",
@@ -146,6 +249,56 @@ def upload_archive(
   return total_modified_row_count
 
 
+def upload_archive_pipelined(
+  path_details: Iterable[Tuple[str, Optional[PathDetails]]],
+  database: Database,
+  handlers: Tuple[Callable],
+  logger: Logger,
+  workers: int,
+  batch_rows: int = 500000,
+  batch_seconds: float = 60.0,
+  archive_threads: int = 4,
+  ):
+  """Upload CSVs to the database and archive them like `upload_archive`, in a pipeline.
+
+  The files are parsed and validated by `workers` processes, and staged in a
+  `LoadSession`, which dispatches them into the fact tables once per
+  `batch_rows` rows or `batch_seconds` seconds. A file whose rows cannot be
+  staged or dispatched is rolled back and archived as failed on its own, the others are
+  archived by `archive_threads` threads once their batch is committed.
+
+  :return: the number of modified rows
+  """
+  archive_as_successful, archive_as_failed = handlers
+
+  with BackgroundArchiver(archive_threads) as archiver:
+
+    def archive(handler: Callable, path: str, source: str):
+      path_src, filename = os.path.split(path)
+      archiver.submit(handler, path_src, filename, source, logger)
+
+    def on_commit(files: List[Tuple[str, PathDetails]]):
+      for path, details in files:
+        archive(archive_as_successful, path, details.source)
+
+    def on_rollback(files: List[Tuple[str, PathDetails]], e: Exception):
+      for path, details in files:
+        archive(archive_as_failed, path, details.source)
+
+    # errors of the archiving are reported once it is done
+    session = LoadSession(database, on_commit, on_rollback, batch_rows, batch_seconds, logger)
+    with session:
+      for path, details, rows in parse_files(path_details, workers):
+        logger.info(event='handling', dest=path)
+        if not details:
+          # file path or name was invalid, source is unknown
+          archive(archive_as_failed, path, 'unknown')
+        elif rows is None or not session.stage((path, details), rows):
+          archive(archive_as_failed, path, details.source)
+
+  return session.modified_row_count
+
+
 def main(args):
   """Find, parse, and upload covidcast signals."""
 
@@ -160,14 +313,18 @@ def main(args):
   logger.info("Ingesting CSVs", csv_count = len(path_details))
 
   database = Database()
-  database.connect()
+  database.connect(load_data_infile=args.load_data_infile, key_cache=args.key_cache)
 
   try:
     modified_row_count = upload_archive(
       path_details,
       database,
-      make_handlers(args.data_dir, args.specific_issue_date),
-      logger
+      make_handlers(args.data_dir, args.specific_issue_date, args.archive_codec, args.archive_level),
+      logger,
+      args.workers,
+      args.batch_rows,
+      args.batch_seconds,
+      args.archive_threads,
     )
     logger.info("Finished inserting/updating database rows", row_count = modified_row_count)
   finally:
@@ -2,11 +2,15 @@
 
 See src/ddl/covidcast.sql for an explanation of each field.
 """
+import math
+import os
+import tempfile
 import threading
-from math import ceil
+import time
+from itertools import islice
 from multiprocessing import cpu_count
 from queue import Queue, Empty
-from typing import List
+from typing import Any, Callable, Iterable, List, Sequence, Tuple
 
 # third party
 import json
@@ -22,6 +26,99 @@ class DBLoadStateException(Exception):
   pass
 
 
+# mysql error numbers of a refused LOAD DATA LOCAL INFILE:
+# ER_NOT_ALLOWED_COMMAND, ER_CLIENT_LOCAL_FILES_DISABLED, CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+LOAD_DATA_LOCAL_INFILE_REFUSED = {1148, 3948, 2068}
+
+
+def _tsv_value(value: Any) -> str:
+  """Format a value as a field of LOAD DATA's default (tab separated) format."""
+  if value is None:
+    return '\\N'
+  if isinstance(value, str):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+  if isinstance(value, int):
+    # also for IntEnums
+    return str(int(value))
+  return repr(float(value))
+
+
+class DimensionKeyCache:
+  """The ids of the `signal_dim` and `geo_dim` keys, so that loaded rows can carry them.
+
+  The maps are warmed with the whole dimension tables once, and extended as new keys are added
+  to them. Keys added since the last commit are forgotten when their transaction (or savepoint)
+  is rolled back, since their ids are then gone.
+  A key whose id cannot be resolved exactly (e.g. equal to an existing one only through the
+  collation of the table) is None, and left to be resolved by `run_dbjobs`.
+  """
+
+  # (table, key columns, id column) of each dimension
+  SIGNAL = ('signal_dim', ('source', 'signal'), 'signal_key_id')
+  GEO = ('geo_dim', ('geo_type', 'geo_value'), 'geo_key_id')
+  # number of keys looked up at once
+  chunk_size = 1000
+
+  def __init__(self):
+    self.ids = None
+    # (dimension, key) added since the last commit
+    self._added = []
+
+  def _warm(self, cursor):
+    self.ids = {}
+    for dimension in (self.SIGNAL, self.GEO):
+      table, (a, b), key_id = dimension
+      cursor.execute(f'SELECT `{a}`, `{b}`, `{key_id}` FROM `{table}`')
+      self.ids[dimension] = {(x, y): i for x, y, i in cursor}
+
+  def _add(self, cursor, dimension, keys: List[Tuple[str, str]]):
+    table, (a, b), key_id = dimension
+    ids = self.ids[dimension]
+    # a no-op update rather than IGNORE, which would also turn errors (e.g. too long values) into warnings
+    cursor.executemany(f'''
+      INSERT INTO `{table}` (`{a}`, `{b}`) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE `{key_id}` = `{key_id}`
+    ''', keys)
+    for start in range(0, len(keys), self.chunk_size):
+      chunk = keys[start:start + self.chunk_size]
+      placeholders = ', '.join(['(%s, %s)'] * len(chunk))
+      cursor.execute(
+        f'SELECT `{a}`, `{b}`, `{key_id}` FROM `{table}` WHERE (`{a}`, `{b}`) IN ({placeholders})',
+        [v for key in chunk for v in key])
+      for x, y, i in cursor:
+        if (x, y) not in ids:
+          ids[(x, y)] = i
+          self._added.append((dimension, (x, y)))
+
+  def resolve(self, cursor, rows: Sequence[CovidcastRow]) -> List[Tuple[Any, Any]]:
+    """Return the (signal_key_id, geo_key_id) of each row, adding the keys missing from the dimension tables."""
+
+    if self.ids is None:
+      self._warm(cursor)
+    signal_ids, geo_ids = self.ids[self.SIGNAL], self.ids[self.GEO]
+    new_signals = sorted({(row.source, row.signal) for row in rows} - signal_ids.keys())
+    if new_signals:
+      self._add(cursor, self.SIGNAL, new_signals)
+    new_geos = sorted({(row.geo_type, row.geo_value) for row in rows} - geo_ids.keys())
+    if new_geos:
+      self._add(cursor, self.GEO, new_geos)
+    return [(signal_ids.get((row.source, row.signal)), geo_ids.get((row.geo_type, row.geo_value))) for row in rows]
+
+  def mark(self) -> int:
+    return len(self._added)
+
+  def commit(self):
+    self._added.clear()
+
+  def rollback(self, mark: int = 0):
+    """Forget the keys added since `mark`."""
+    if self.ids is None:
+      return
+    for dimension, key in self._added[mark:]:
+      self.ids[dimension].pop(key, None)
+    del self._added[mark:]
+
+
 class Database:
   """A collection of covidcast database operations."""
 
@@ -37,24 +134,50 @@ class Database:
   # TODO: consider using class variables like this for dimension table names too
   # TODO: also consider that for composite key tuples, like short_comp_key and long_comp_key as used in delete_batch()
 
-
-  def connect(self, connector_impl=mysql.connector):
-    """Establish a connection to the database."""
+  # columns of the load table given for each row by `insert_or_update_batch`
+  load_columns = [
+    'source', 'signal', 'time_type', 'geo_type', 'time_value', 'geo_value',
+    'value', 'stderr', 'sample_size', 'issue', 'lag',
+    'missing_value', 'missing_stderr', 'missing_sample_size',
+    'signal_key_id', 'geo_key_id',
+  ]
+  _load_data_infile = False
+  _key_cache = None
+
+
+  def connect(self, connector_impl=mysql.connector, load_data_infile=False, key_cache=False):
+    """Establish a connection to the database.
+
+    load_data_infile: if true, rows are loaded with `LOAD DATA LOCAL INFILE`
+      (which requires `local_infile` on the server) instead of INSERT statements
+    key_cache: if true, the dimension keys of loaded rows are resolved with a `DimensionKeyCache`,
+      so that `run_dbjobs` does not join the load table with the dimension tables
+      (only for connections which are the only ones writing to the dimension tables)
+    """
 
     u, p = secrets.db.epi
     self._connector_impl = connector_impl
+    self._load_data_infile = load_data_infile
+    self._key_cache = DimensionKeyCache() if key_cache else None
+    self._savepoints = {}
+    extra_args = dict(allow_local_infile=True) if load_data_infile else {}
     self._connection = self._connector_impl.connect(
         host=secrets.db.host,
         user=u,
         password=p,
-        database=Database.DATABASE_NAME)
+        database=Database.DATABASE_NAME,
+        **extra_args)
     self._cursor = self._connection.cursor()
 
   def commit(self):
     self._connection.commit()
+    if self._key_cache:
+      self._key_cache.commit()
 
   def rollback(self):
     self._connection.rollback()
+    if self._key_cache:
+      self._key_cache.rollback()
 
   def disconnect(self, commit):
     """Close the database connection.
@@ -64,7 +187,7 @@ class Database:
 
     self._cursor.close()
     if commit:
-      self._connection.commit()
+      self.commit()
     self._connection.close()
 
 
@@ -104,32 +227,110 @@ class Database:
     output = [self._cursor.column_names] + self._cursor.fetchall()
     get_structured_logger('do_analyze').info("ANALYZE results", results=str(output))
 
+  def _load_data_infile_rows(self, args: Sequence[Tuple]) -> int:
+    """Load rows into the load table with `LOAD DATA LOCAL INFILE` from a temporary TSV file."""
+
+    columns = ', '.join(f'`{c}`' for c in self.load_columns)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'epimetric_load.tsv')
+      with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.writelines('\t'.join(map(_tsv_value, row)) + '\n' for row in args)
+      # NOTE: `value_update_timestamp` and `is_latest_issue` as in `insert_or_update_batch`
+      self._cursor.execute(f'''
+        LOAD DATA LOCAL INFILE %s
+          INTO TABLE `{self.load_table}`
+          CHARACTER SET utf8mb4
+          ({columns})
+          SET `value_updated_timestamp` = UNIX_TIMESTAMP(NOW()), `is_latest_issue` = 1
+      ''', (path,))
+    return self._cursor.rowcount
+
+  def _load_rows(self, insert_sql: str, args: Sequence[Tuple]) -> int:
+    """Load rows into the load table, with `LOAD DATA LOCAL INFILE` if enabled and an INSERT otherwise."""
+
+    if self._load_data_infile:
+      try:
+        return self._load_data_infile_rows(args)
+      except Exception as e:
+        if getattr(e, 'errno', None) not in LOAD_DATA_LOCAL_INFILE_REFUSED:
+          raise e
+        get_structured_logger('insert_or_update_batch').warning('LOAD DATA LOCAL INFILE refused, falling back to INSERT', error=str(e))
+        self._load_data_infile = False
+    self._cursor.executemany(insert_sql, args)
+    return self._cursor.rowcount
+
   def insert_or_update_bulk(self, cc_rows):
     return self.insert_or_update_batch(cc_rows)
 
-  def insert_or_update_batch(self, cc_rows: List[CovidcastRow], batch_size=2**20, commit_partial=False, suppress_jobs=False):
-    """
-    Insert new rows into the load table and dispatch into dimension and fact tables.
-    """
-
+  def _check_load_table_empty(self, logger_name):
     if 0 != self.count_all_load_rows():
       err_msg = "Non-zero count in the load table!!!  This indicates a previous acquisition run may have failed, another acquisition is in progress, or this process does not otherwise have exclusive access to the db!"
-      get_structured_logger("insert_or_update_batch").fatal(err_msg)
+      get_structured_logger(logger_name).fatal(err_msg)
       raise DBLoadStateException(err_msg)
 
+  def _stage_batch(self, batch: Sequence[CovidcastRow]):
+    """Insert a batch of rows into the load table, returning the number of modified rows (None if unknown)."""
+
     # NOTE: `value_update_timestamp` is hardcoded to "NOW" (which is appropriate) and 
-    #       `is_latest_issue` is hardcoded to 1 (which is temporary and addressed later in this method)
+    #       `is_latest_issue` is hardcoded to 1 (which is temporary and addressed later by `fix_is_latest_issue`)
     insert_into_loader_sql = f'''
       INSERT INTO `{self.load_table}`
         (`source`, `signal`, `time_type`, `geo_type`, `time_value`, `geo_value`,
         `value_updated_timestamp`, `value`, `stderr`, `sample_size`, `issue`, `lag`, 
-        `is_latest_issue`, `missing_value`, `missing_stderr`, `missing_sample_size`)
+        `is_latest_issue`, `missing_value`, `missing_stderr`, `missing_sample_size`,
+        `signal_key_id`, `geo_key_id`)
       VALUES
         (%s, %s, %s, %s, %s, %s, 
         UNIX_TIMESTAMP(NOW()), %s, %s, %s, %s, %s, 
-        1, %s, %s, %s)
+        1, %s, %s, %s,
+        %s, %s)
     '''
 
+    # without the key cache, the dimension keys are resolved by `run_dbjobs`
+    key_ids = self._key_cache.resolve(self._cursor, batch) if self._key_cache else [(None, None)] * len(batch)
+    args = [(
+      row.source,
+      row.signal,
+      row.time_type,
+      row.geo_type,
+      row.time_value,
+      row.geo_value,
+      row.value,
+      row.stderr,
+      row.sample_size,
+      row.issue,
+      row.lag,
+      row.missing_value,
+      row.missing_stderr,
+      row.missing_sample_size,
+      signal_key_id,
+      geo_key_id
+    ) for row, (signal_key_id, geo_key_id) in zip(batch, key_ids)]
+
+    modified_row_count = self._load_rows(insert_into_loader_sql, args)
+    if modified_row_count is None or modified_row_count == -1:
+      # the SQL connector does not support returning number of rows affected (see PEP 249)
+      return None
+    return modified_row_count
+
+  def stage_rows(self, cc_rows: Iterable[CovidcastRow], batch_size=2**20):
+    """
+    Insert rows into the load table, without dispatching them into dimension and fact tables.
+
+    The rows are consumed `batch_size` at a time (all at once if `batch_size` is falsy).
+    Returns the number of modified rows, None if the connector does not report it.
+    """
+
+    rows = iter(cc_rows)
+    total = 0
+    while True:
+      batch = list(islice(rows, batch_size)) if batch_size else list(rows)
+      if not batch:
+        return total
+      modified_row_count = self._stage_batch(batch)
+      total = None if total is None or modified_row_count is None else total + modified_row_count
+
+  def fix_is_latest_issue(self):
     # all load table entries are already marked "is_latest_issue".
     # if an entry in the load table is NOT in the latest table, it is clearly now the latest value for that key (so we do nothing (thanks to INNER join)).
     # if an entry *IS* in both load and latest tables, but latest table issue is newer, unmark is_latest_issue in load.
@@ -140,55 +341,74 @@ class Database:
             SET `{self.load_table}`.`is_latest_issue`=0 
             WHERE `{self.load_table}`.`issue` < `{self.latest_view}`.`issue` 
     '''
+    self._cursor.execute(fix_is_latest_issue_sql)
+
+  def savepoint(self, name):
+    self._cursor.execute(f'SAVEPOINT `{name}`')
+    if self._key_cache:
+      self._savepoints[name] = self._key_cache.mark()
+
+  def rollback_to_savepoint(self, name):
+    self._cursor.execute(f'ROLLBACK TO SAVEPOINT `{name}`')
+    if self._key_cache:
+      self._key_cache.rollback(self._savepoints.get(name, 0))
+
+  def insert_or_update_batch(self, cc_rows: Iterable[CovidcastRow], batch_size=2**20, commit_partial=False, suppress_jobs=False):
+    """
+    Insert new rows into the load table and dispatch into dimension and fact tables.
 
-    # TODO: consider handling cc_rows as a generator instead of a list
+    The rows can be any iterable, they are consumed `batch_size` at a time (all at once if `batch_size` is falsy).
+    Returns the number of modified rows, None if the connector does not report it.
+    See `LoadSession` to dispatch the rows of many calls at once.
+    """
+
+    self._check_load_table_empty("insert_or_update_batch")
 
     try:
-      num_rows = len(cc_rows)
+      rows = iter(cc_rows)
       total = 0
-      if not batch_size:
-        batch_size = num_rows
-      num_batches = ceil(num_rows/batch_size)
-      for batch_num in range(num_batches):
-        start = batch_num * batch_size
-        end = min(num_rows, start + batch_size)
-
-        args = [(
-          row.source,
-          row.signal,
-          row.time_type,
-          row.geo_type,
-          row.time_value,
-          row.geo_value,
-          row.value,
-          row.stderr,
-          row.sample_size,
-          row.issue,
-          row.lag,
-          row.missing_value,
-          row.missing_stderr,
-          row.missing_sample_size
-        ) for row in cc_rows[start:end]]
-
-
-        self._cursor.executemany(insert_into_loader_sql, args)
-        modified_row_count = self._cursor.rowcount
-        self._cursor.execute(fix_is_latest_issue_sql)
+      while True:
+        batch = list(islice(rows, batch_size)) if batch_size else list(rows)
+        if not batch:
+          break
+
+        modified_row_count = self._stage_batch(batch)
+        del batch
+        self.fix_is_latest_issue()
         if not suppress_jobs:
           self.run_dbjobs() # TODO: incorporate the logic of dbjobs() into this method [once calls to dbjobs() are no longer needed for migrations]
 
-        if modified_row_count is None or modified_row_count == -1:
-          # the SQL connector does not support returning number of rows affected (see PEP 249)
+        if total is None or modified_row_count is None:
           total = None
         else:
           total += modified_row_count
         if commit_partial:
-          self._connection.commit()
+          self.commit()
     except Exception as e:
       # rollback is handled in csv_to_database; if you're calling this yourself, handle your own rollback
       raise e
     return total
 
+  def _summary_load_sql(self, partitions: str) -> str:
+    """Return the SQL aggregating `epimetric_latest` into `epimetric_summary`.
+
+    Only the (signal_key_id, time_type, geo_type, time_value) partitions selected by `partitions` are aggregated.
+    """
+    return f'''
+        REPLACE INTO epimetric_summary
+            (signal_key_id, time_type, geo_type, time_value, row_count, megacounty_count, value_count, value_sum, value_sumsq,
+             min_value, max_value, max_issue, last_update, min_lag, max_lag)
+        SELECT
+            p.signal_key_id, p.time_type, p.geo_type, p.time_value,
+            COUNT(1), SUM(RIGHT(g.geo_value, 3) = '000'), COUNT(l.`value`), SUM(l.`value`), SUM(l.`value` * l.`value`), MIN(l.`value`), MAX(l.`value`),
+            MAX(l.issue), MAX(l.value_updated_timestamp), MIN(l.`lag`), MAX(l.`lag`)
+        FROM ({partitions}) p
+            JOIN geo_dim g ON g.geo_type = p.geo_type
+            JOIN {self.latest_table} l ON l.signal_key_id = p.signal_key_id AND l.time_type = p.time_type
+                AND l.time_value = p.time_value AND l.geo_key_id = g.geo_key_id
+        GROUP BY p.signal_key_id, p.time_type, p.geo_type, p.time_value
+    '''
+
   def run_dbjobs(self):
 
     # we do this LEFT JOIN trick because mysql cant do set difference (aka EXCEPT or MINUS)
@@ -210,18 +430,39 @@ class Database:
                 WHERE gd.geo_type IS NULL
     '''
 
+    if self._key_cache:
+      # the rows carry their dimension keys (see `DimensionKeyCache`), which also added the new ones;
+      # the few keys it could not resolve exactly are filled in below
+      keys_from = f"`{self.load_table}` sl"
+      signal_key_id, geo_key_id = "sl.signal_key_id", "sl.geo_key_id"
+    else:
+      keys_from = f'''`{self.load_table}` sl
+                INNER JOIN signal_dim sd USING (source, `signal`)
+                INNER JOIN geo_dim gd USING (geo_type, geo_value)'''
+      signal_key_id, geo_key_id = "sd.signal_key_id", "gd.geo_key_id"
+
+    signal_key_fill_missing = f'''
+        UPDATE `{self.load_table}` sl JOIN signal_dim sd USING (source, `signal`)
+            SET sl.signal_key_id = sd.signal_key_id
+            WHERE sl.signal_key_id IS NULL
+    '''
+
+    geo_key_fill_missing = f'''
+        UPDATE `{self.load_table}` sl JOIN geo_dim gd USING (geo_type, geo_value)
+            SET sl.geo_key_id = gd.geo_key_id
+            WHERE sl.geo_key_id IS NULL
+    '''
+
     epimetric_full_load = f'''
         INSERT INTO {self.history_table}
             (epimetric_id, signal_key_id, geo_key_id, issue, data_as_of_dt,
              time_type, time_value, `value`, stderr, sample_size, `lag`, value_updated_timestamp,
              computation_as_of_dt, missing_value, missing_stderr, missing_sample_size)
         SELECT
-            epimetric_id, sd.signal_key_id, gd.geo_key_id, issue, data_as_of_dt,
+            epimetric_id, {signal_key_id}, {geo_key_id}, issue, data_as_of_dt,
                 time_type, time_value, `value`, stderr, sample_size, `lag`, value_updated_timestamp,
                 computation_as_of_dt, missing_value, missing_stderr, missing_sample_size
-            FROM `{self.load_table}` sl
-                INNER JOIN signal_dim sd USING (source, `signal`)
-                INNER JOIN geo_dim gd USING (geo_type, geo_value)
+            FROM {keys_from}
         ON DUPLICATE KEY UPDATE
             `epimetric_id` = sl.`epimetric_id`,
             `value_updated_timestamp` = sl.`value_updated_timestamp`,
@@ -240,12 +481,10 @@ class Database:
              time_type, time_value, `value`, stderr, sample_size, `lag`, value_updated_timestamp,
              computation_as_of_dt, missing_value, missing_stderr, missing_sample_size)
         SELECT
-            epimetric_id, sd.signal_key_id, gd.geo_key_id, issue, data_as_of_dt,
+            epimetric_id, {signal_key_id}, {geo_key_id}, issue, data_as_of_dt,
                 time_type, time_value, `value`, stderr, sample_size, `lag`, value_updated_timestamp,
                 computation_as_of_dt, missing_value, missing_stderr, missing_sample_size
-            FROM `{self.load_table}` sl
-                INNER JOIN signal_dim sd USING (source, `signal`)
-                INNER JOIN geo_dim gd USING (geo_type, geo_value)
+            FROM {keys_from}
             WHERE is_latest_issue = 1
         ON DUPLICATE KEY UPDATE
             `epimetric_id` = sl.`epimetric_id`,
@@ -260,6 +499,31 @@ class Database:
             `missing_sample_size` = sl.`missing_sample_size`
     '''
 
+    # invalidates the cached API results of the loaded signals
+    signal_update_load = f'''
+        INSERT INTO signal_update (signal_key_id, version)
+            SELECT DISTINCT {signal_key_id}, 1
+                FROM {keys_from}
+        ON DUPLICATE KEY UPDATE
+            `version` = `version` + 1
+    '''
+
+    # the partitions of the new latest rows only gain rows, so they are simply aggregated again
+    epimetric_summary_load = self._summary_load_sql(f'''
+            SELECT DISTINCT {signal_key_id} AS signal_key_id, sl.time_type, sl.geo_type, sl.time_value
+                FROM {keys_from}
+                WHERE is_latest_issue = 1''')
+
+    # marks the changed summary groups for `compute_covidcast_meta_incremental`
+    meta_dirty_load = f'''
+        INSERT INTO epimetric_meta_dirty (signal_key_id, time_type, geo_type)
+            SELECT DISTINCT {signal_key_id}, sl.time_type, sl.geo_type
+                FROM {keys_from}
+                WHERE is_latest_issue = 1
+        ON DUPLICATE KEY UPDATE
+            `version` = `version` + 1
+    '''
+
     # NOTE: DO NOT `TRUNCATE` THIS TABLE!  doing so will ruin the AUTO_INCREMENT counter that the history and latest tables depend on...
     epimetric_load_delete_processed = f'''
         DELETE FROM `{self.load_table}`
@@ -270,13 +534,22 @@ class Database:
     time_q = [time.time()]
 
     try:
-      self._cursor.execute(signal_dim_add_new_load)
-      time_q.append(time.time())
-      logger.debug('signal_dim_add_new_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+      if self._key_cache:
+        self._cursor.execute(signal_key_fill_missing)
+        time_q.append(time.time())
+        logger.debug('signal_key_fill_missing', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+
+        self._cursor.execute(geo_key_fill_missing)
+        time_q.append(time.time())
+        logger.debug('geo_key_fill_missing', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+      else:
+        self._cursor.execute(signal_dim_add_new_load)
+        time_q.append(time.time())
+        logger.debug('signal_dim_add_new_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
 
-      self._cursor.execute(geo_dim_add_new_load)
-      time_q.append(time.time())
-      logger.debug('geo_dim_add_new_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+        self._cursor.execute(geo_dim_add_new_load)
+        time_q.append(time.time())
+        logger.debug('geo_dim_add_new_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
 
       self._cursor.execute(epimetric_full_load)
       time_q.append(time.time())
@@ -286,6 +559,18 @@ class Database:
       time_q.append(time.time())
       logger.debug('epimetric_latest_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
 
+      self._cursor.execute(signal_update_load)
+      time_q.append(time.time())
+      logger.debug('signal_update_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+
+      self._cursor.execute(epimetric_summary_load)
+      time_q.append(time.time())
+      logger.debug('epimetric_summary_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+
+      self._cursor.execute(meta_dirty_load)
+      time_q.append(time.time())
+      logger.debug('meta_dirty_load', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
+
       self._cursor.execute(epimetric_load_delete_processed)
       time_q.append(time.time())
       logger.debug('epimetric_load_delete_processed', rows=self._cursor.rowcount, elapsed=time_q[-1]-time_q[-2])
@@ -295,7 +580,26 @@ class Database:
     return self
 
 
-  def delete_batch(self, cc_deletions):
+  def _load_data_infile_deletions(self, table_name: str, cc_deletions: Iterable[Sequence]) -> int:
+    """Load deletion tuples (as given to `delete_batch`) into a table with `LOAD DATA LOCAL INFILE`."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, f'{table_name}.tsv')
+      with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        # the ignored value, stderr and sample size are not loaded
+        f.writelines(
+          '\t'.join(map(_tsv_value, (geo_value, issue, time_value, geo_type, signal, source, time_type))) + '\n'
+          for geo_value, _, _, _, issue, time_value, geo_type, signal, source, time_type in cc_deletions)
+      self._cursor.execute(f'''
+        LOAD DATA LOCAL INFILE %s
+          INTO TABLE `{table_name}`
+          CHARACTER SET utf8mb4
+          (`geo_value`, `issue`, `time_value`, `geo_type`, `signal`, `source`, `time_type`)
+          SET `value_updated_timestamp` = 0, `lag` = 0, `is_latest_issue` = 0
+      ''', (path,))
+    return self._cursor.rowcount
+
+  def delete_batch(self, cc_deletions, chunk_rows=1000000, commit_chunks=False):
     """
     Remove rows specified by a csv file or list of tuples.
 
@@ -321,12 +625,23 @@ class Database:
     - signal
     - source
     - time_type
+    The tuples are loaded with `LOAD DATA LOCAL INFILE` if enabled by `connect`, and with INSERT statements otherwise.
+
+    The rows are then removed (and the latest ones replaced by their previous issues) in chunks of signals
+    of about `chunk_rows` deletions, with the row count and duration of each step logged.
+
+    By default, all chunks are committed at once. With `commit_chunks`, each chunk is committed on its own,
+    which bounds the lock time and undo log size of large deletions, but a failure leaves the chunks before it
+    deleted; deleting the same rows again is harmless, so the deletions can just be run again.
     """
 
+    logger = get_structured_logger("delete_batch")
     tmp_table_name = "tmp_delete_table"
     # composite keys:
     short_comp_key = "`source`, `signal`, `time_type`, `geo_type`, `time_value`, `geo_value`"
     long_comp_key = short_comp_key + ", `issue`"
+    # the deletions of a chunk, as the `signal_key_id` range given as arguments
+    in_chunk = "d.signal_key_id BETWEEN %s AND %s"
 
     create_tmp_table_sql = f'''
 CREATE TABLE {tmp_table_name} LIKE {self.load_table};
@@ -335,7 +650,8 @@ CREATE TABLE {tmp_table_name} LIKE {self.load_table};
     amend_tmp_table_sql = f'''
 ALTER TABLE {tmp_table_name} ADD COLUMN delete_history_id BIGINT UNSIGNED,
                              ADD COLUMN delete_latest_id BIGINT UNSIGNED,
-                             ADD COLUMN update_latest BINARY(1) DEFAULT 0;
+                             ADD COLUMN update_latest BINARY(1) DEFAULT 0,
+                             ADD INDEX (signal_key_id);
 '''
 
     load_tmp_table_infile_sql = f'''
@@ -354,26 +670,42 @@ INSERT INTO {tmp_table_name}
 VALUES
 (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
 0, 0, 0)
+'''
+
+    # deletions of signals missing from `signal_dim` keep a NULL key, and are in no chunk since they match no row
+    add_signal_key_id_sql = f'''
+UPDATE {tmp_table_name} d INNER JOIN signal_dim sd USING (`source`, `signal`)
+SET d.signal_key_id=sd.signal_key_id;
+'''
+
+    count_signal_deletions_sql = f'''
+SELECT signal_key_id, COUNT(1) FROM {tmp_table_name}
+WHERE signal_key_id IS NOT NULL
+GROUP BY signal_key_id ORDER BY signal_key_id;
 '''
 
     add_history_id_sql = f'''
 UPDATE {tmp_table_name} d INNER JOIN {self.history_view} h USING ({long_comp_key})
-SET d.delete_history_id=h.epimetric_id;
+SET d.delete_history_id=h.epimetric_id
+WHERE {in_chunk};
 '''
 
     # if a row we are deleting also appears in the 'latest' table (with a matching 'issue')...
     mark_for_update_latest_sql = f'''
 UPDATE {tmp_table_name} d INNER JOIN {self.latest_view} ell USING ({long_comp_key})
-SET d.update_latest=1, d.delete_latest_id=ell.epimetric_id;
+SET d.update_latest=1, d.delete_latest_id=ell.epimetric_id
+WHERE {in_chunk};
 '''
 
     delete_history_sql = f'''
-DELETE h FROM {tmp_table_name} d INNER JOIN {self.history_table} h ON d.delete_history_id=h.epimetric_id;
+DELETE h FROM {tmp_table_name} d INNER JOIN {self.history_table} h ON d.delete_history_id=h.epimetric_id
+WHERE {in_chunk};
 '''
 
     # ...remove it from 'latest'...
     delete_latest_sql = f'''
-DELETE ell FROM {tmp_table_name} d INNER JOIN {self.latest_table} ell ON d.delete_latest_id=ell.epimetric_id;
+DELETE ell FROM {tmp_table_name} d INNER JOIN {self.latest_table} ell ON d.delete_latest_id=ell.epimetric_id
+WHERE {in_chunk};
 '''
 
     # ...and re-write that record with its next-latest issue (from 'history') instead.
@@ -392,46 +724,107 @@ SELECT
   h.missing_value, h.missing_stderr, h.missing_sample_size
 FROM {self.history_view} h JOIN (
     SELECT {short_comp_key}, MAX(hh.issue) AS issue
-    FROM {self.history_view} hh JOIN {tmp_table_name} dd USING ({short_comp_key})
-    WHERE dd.update_latest=1 GROUP BY {short_comp_key}
+    FROM {self.history_view} hh JOIN {tmp_table_name} d USING ({short_comp_key})
+    WHERE d.update_latest=1 AND {in_chunk} GROUP BY {short_comp_key}
   ) d USING ({long_comp_key});
 '''
 
+    # invalidates the cached API results of the affected signals
+    update_signal_version_sql = f'''
+INSERT INTO signal_update (signal_key_id, version)
+SELECT DISTINCT d.signal_key_id, 1
+FROM {tmp_table_name} d
+WHERE d.delete_history_id IS NOT NULL AND {in_chunk}
+ON DUPLICATE KEY UPDATE `version` = `version` + 1;
+'''
+
+    # the summary partitions of the removed latest rows, which may have lost all of their rows...
+    summary_partitions = f'''
+SELECT DISTINCT d.signal_key_id, d.time_type, d.geo_type, d.time_value
+FROM {tmp_table_name} d
+WHERE d.update_latest=1 AND {in_chunk}'''
+
+    # ...are removed before being aggregated again
+    delete_summary_sql = f'''
+DELETE s FROM epimetric_summary s JOIN ({summary_partitions}) p USING (signal_key_id, time_type, geo_type, time_value);
+'''
+
+    update_summary_sql = self._summary_load_sql(summary_partitions)
+
+    # marks the changed summary groups for `compute_covidcast_meta_incremental`
+    update_meta_dirty_sql = f'''
+INSERT INTO epimetric_meta_dirty (signal_key_id, time_type, geo_type)
+SELECT DISTINCT d.signal_key_id, d.time_type, d.geo_type
+FROM {tmp_table_name} d
+WHERE d.update_latest=1 AND {in_chunk}
+ON DUPLICATE KEY UPDATE `version` = `version` + 1;
+'''
+
     drop_tmp_table_sql = f'DROP TABLE IF EXISTS {tmp_table_name}'
 
+    def run_step(step, sql, args=None, **kwargs):
+      start = time.time()
+      self._cursor.execute(sql, args)
+      logger.info(step, rows=self._cursor.rowcount, elapsed=round(time.time() - start, 3), **kwargs)
+      return self._cursor.rowcount
+
     total = None
     try:
       self._cursor.execute(drop_tmp_table_sql)
       self._cursor.execute(create_tmp_table_sql)
       self._cursor.execute(amend_tmp_table_sql)
+      start = time.time()
       if isinstance(cc_deletions, str):
         self._cursor.execute(load_tmp_table_infile_sql)
+        loaded = self._cursor.rowcount
       elif isinstance(cc_deletions, list):
-        def split_list(lst, n):
-          for i in range(0, len(lst), n):
-            yield lst[i:(i+n)]
-        for deletions_batch in split_list(cc_deletions, 100000):
-          self._cursor.executemany(load_tmp_table_insert_sql, deletions_batch)
-          print(f"load_tmp_table_insert_sql:{self._cursor.rowcount}")
+        loaded = None
+        if self._load_data_infile:
+          try:
+            loaded = self._load_data_infile_deletions(tmp_table_name, cc_deletions)
+          except Exception as e:
+            if getattr(e, 'errno', None) not in LOAD_DATA_LOCAL_INFILE_REFUSED:
+              raise e
+            logger.warning('LOAD DATA LOCAL INFILE refused, falling back to INSERT', error=str(e))
+            self._load_data_infile = False
+        if loaded is None:
+          loaded = 0
+          for start_index in range(0, len(cc_deletions), 100000):
+            self._cursor.executemany(load_tmp_table_insert_sql, cc_deletions[start_index:start_index + 100000])
+            loaded += self._cursor.rowcount
       else:
         raise Exception(f"Bad deletions argument: need a filename or a list of tuples; got a {type(cc_deletions)}")
-      self._cursor.execute(add_history_id_sql)
-      print(f"add_history_id_sql:{self._cursor.rowcount}")
-      self._cursor.execute(mark_for_update_latest_sql)
-      print(f"mark_for_update_latest_sql:{self._cursor.rowcount}")
-      self._cursor.execute(delete_history_sql)
-      print(f"delete_history_sql:{self._cursor.rowcount}")
-      total = self._cursor.rowcount
-      # TODO: consider reporting rows removed and/or replaced in latest table as well
-      self._cursor.execute(delete_latest_sql)
-      print(f"delete_latest_sql:{self._cursor.rowcount}")
-      self._cursor.execute(update_latest_sql)
-      print(f"update_latest_sql:{self._cursor.rowcount}")
-      self._connection.commit()
-
-      if total == -1:
-        # the SQL connector does not support returning number of rows affected (see PEP 249)
-        total = None
+      logger.info("load_tmp_table", rows=loaded, elapsed=round(time.time() - start, 3))
+      run_step("add_signal_key_id", add_signal_key_id_sql)
+
+      # consecutive signals are grouped in chunks of about `chunk_rows` deletions
+      self._cursor.execute(count_signal_deletions_sql)
+      chunks = []
+      for signal_key_id, count in self._cursor.fetchall():
+        if chunks and chunks[-1][2] < chunk_rows:
+          chunks[-1][1:] = [signal_key_id, chunks[-1][2] + count]
+        else:
+          chunks.append([signal_key_id, signal_key_id, count])
+      logger.info("deleting in chunks", chunk_count=len(chunks))
+
+      total = 0
+      for first, last, _ in chunks:
+        chunk = (first, last)
+        kwargs = dict(first_signal_key_id=first, last_signal_key_id=last)
+        run_step("add_history_id", add_history_id_sql, chunk, **kwargs)
+        run_step("mark_for_update_latest", mark_for_update_latest_sql, chunk, **kwargs)
+        deleted = run_step("delete_history", delete_history_sql, chunk, **kwargs)
+        if total is not None:
+          total = None if deleted == -1 else total + deleted
+        run_step("delete_latest", delete_latest_sql, chunk, **kwargs)
+        run_step("update_latest", update_latest_sql, chunk, **kwargs)
+        run_step("update_signal_version", update_signal_version_sql, chunk, **kwargs)
+        run_step("delete_summary", delete_summary_sql, chunk, **kwargs)
+        run_step("update_summary", update_summary_sql, chunk, **kwargs)
+        run_step("update_meta_dirty", update_meta_dirty_sql, chunk, **kwargs)
+        if commit_chunks:
+          self.commit()
+      self.commit()
     except Exception as e:
       raise e
     finally:
@@ -536,6 +929,110 @@ FROM {self.history_view} h JOIN (
 
     return meta
 
+  @staticmethod
+  def merge_meta_partials(
+    data_source, signal, time_type, geo_type, min_time, max_time, num_locations,
+    value_count, value_sum, value_sumsq, min_value, max_value, last_update, max_issue, min_lag, max_lag):
+    """Return the metadata of a group (as in `compute_covidcast_meta`) from the merged aggregates of its partitions."""
+
+    mean_value = stdev_value = None
+    if value_count:
+      mean = value_sum / value_count
+      mean_value = round(mean, 7)
+      # population standard deviation, as mysql's STD
+      stdev_value = round(math.sqrt(max(0.0, value_sumsq / value_count - mean * mean)), 7)
+    return {
+      'data_source': data_source,
+      'signal': signal,
+      'time_type': time_type,
+      'geo_type': geo_type,
+      'min_time': min_time,
+      'max_time': max_time,
+      'num_locations': num_locations,
+      'min_value': min_value,
+      'max_value': max_value,
+      'mean_value': mean_value,
+      'stdev_value': stdev_value,
+      'last_update': last_update,
+      'max_issue': max_issue,
+      'min_lag': min_lag,
+      'max_lag': max_lag,
+    }
+
+  def compute_covidcast_meta_incremental(self, previous_meta=None):
+    """Compute and return metadata on all COVIDcast signals, recomputing only what changed.
+
+    `run_dbjobs` and `delete_batch` keep `epimetric_summary` up to date, and mark the
+    (signal, time type, geo type) groups they change in `epimetric_meta_dirty`. Only those are
+    merged again from their summary partitions (count, sum, sum of squares, min and max), the
+    other groups are kept from `previous_meta` (by default the current metadata cache).
+
+    Nothing is committed, so that the caller can commit the changes together with the new cache.
+    """
+    logger = get_structured_logger("compute_covidcast_meta_incremental")
+
+    if previous_meta is None:
+      previous_meta = list(self.retrieve_covidcast_meta_cache().values())
+
+    dirty = self.read_meta_dirty()
+    logger.info("recomputing groups", group_count=len(dirty))
+
+    meta = []
+    recomputed = set()
+    for signal_key_id, time_type, geo_type, _ in dirty:
+      group = (signal_key_id, time_type, geo_type)
+      self._cursor.execute('SELECT `source`, `signal` FROM `signal_dim` WHERE `signal_key_id` = %s', (signal_key_id,))
+      source, signal = self._cursor.fetchone()
+      recomputed.add((source, signal, time_type, geo_type))
+
+      self._cursor.execute('''
+        SELECT
+          MIN(`time_value`), MAX(`time_value`), SUM(`value_count`), SUM(`value_sum`), SUM(`value_sumsq`),
+          MIN(`min_value`), MAX(`max_value`), MAX(`last_update`), MAX(`max_issue`), MIN(`min_lag`), MAX(`max_lag`)
+        FROM `epimetric_summary`
+        WHERE `signal_key_id` = %s AND `time_type` = %s AND `geo_type` = %s
+      ''', group)
+      min_time, max_time, value_count, value_sum, value_sumsq, *rest = self._cursor.fetchone()
+      if min_time is None:
+        # all of the rows of the group were deleted
+        continue
+
+      # the number of locations can not be merged from the partitions
+      self._cursor.execute(f'''
+        SELECT COUNT(DISTINCT l.`geo_key_id`)
+        FROM `{self.latest_table}` l JOIN `geo_dim` g USING (`geo_key_id`)
+        WHERE l.`signal_key_id` = %s AND l.`time_type` = %s AND g.`geo_type` = %s
+      ''', group)
+      (num_locations,) = self._cursor.fetchone()
+      meta.append(Database.merge_meta_partials(
+        source, signal, time_type, geo_type, min_time, max_time, num_locations,
+        int(value_count), value_sum, value_sumsq, *rest))
+
+    meta.extend(
+      entry for entry in previous_meta
+      if (entry['data_source'], entry['signal'], entry['time_type'], entry['geo_type']) not in recomputed
+    )
+    meta.sort(key=lambda x: (x['data_source'], x['signal'], x['time_type'], x['geo_type']))
+
+    self.clear_meta_dirty(dirty)
+    return meta
+
+  def read_meta_dirty(self):
+    """Return the (signal_key_id, time_type, geo_type, version) groups marked in `epimetric_meta_dirty`."""
+
+    self._cursor.execute('SELECT `signal_key_id`, `time_type`, `geo_type`, `version` FROM `epimetric_meta_dirty`')
+    return self._cursor.fetchall()
+
+  def clear_meta_dirty(self, dirty):
+    """Unmark the groups read by `read_meta_dirty` once their metadata was computed.
+
+    Groups changed again in the meantime have a newer version, and stay dirty.
+    """
+
+    self._cursor.executemany('''
+      DELETE FROM `epimetric_meta_dirty`
+      WHERE `signal_key_id` = %s AND `time_type` = %s AND `geo_type` = %s AND `version` = %s
+    ''', dirty)
 
   def update_covidcast_meta_cache(self, metadata):
     """Updates the `covidcast_meta_cache` table."""
@@ -567,3 +1064,147 @@ FROM {self.history_view} h JOIN (
     for entry in cache:
       cache_hash[(entry['data_source'], entry['signal'], entry['time_type'], entry['geo_type'])] = entry
     return cache_hash
+
+
+class LoadSession:
+  """Stage the rows of many files in the load table, and dispatch them into dimension and fact tables at once.
+
+  `Database.insert_or_update_batch` runs the `is_latest_issue` fix-up and `run_dbjobs` for every call,
+  which dominates the cost of small files. A session defers them until `max_rows` rows are staged or
+  `max_seconds` passed since the first staged file (checked when a file is staged), then commits.
+
+  Each file is staged after a savepoint, so that a file whose rows cannot be loaded is rolled back alone.
+  Files with the same source, signal, time type, geo type and time value (e.g. different issues of a day)
+  are never dispatched together, so that the latest issue is determined as with one file at a time.
+
+  The tags of the staged files are passed to `on_commit` once their rows are committed, or to
+  `on_rollback` (with the exception) if their rows were rolled back. If the dispatch of several files
+  fails, they are staged and dispatched again one at a time, so that only the failing files are rolled
+  back; the rows of the staged files are kept in memory until they are committed for that.
+  """
+
+  SAVEPOINT = 'load_session_file'
+
+  def __init__(
+    self,
+    database: Database,
+    on_commit: Callable[[List[Any]], None],
+    on_rollback: Callable[[List[Any], Exception], None],
+    max_rows: int = 500000,
+    max_seconds: float = 60.0,
+    logger=None,
+  ):
+    self.database = database
+    self.on_commit = on_commit
+    self.on_rollback = on_rollback
+    self.max_rows = max_rows
+    self.max_seconds = max_seconds
+    self.logger = logger or get_structured_logger('load_session')
+    # number of committed modified rows, unknown counts are not included
+    self.modified_row_count = 0
+    self._checked_load_table = False
+    self._reset()
+
+  def _reset(self):
+    self._tags: List[Any] = []
+    # the rows of each staged file, to dispatch them one at a time if the batch fails
+    self._rows: List[List[CovidcastRow]] = []
+    self._keys = set()
+    self._row_count = 0
+    self._modified_row_count = 0
+    self._started = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.flush()
+    else:
+      # staged files are neither committed nor reported
+      self.database.rollback()
+      self._reset()
+
+  def stage(self, tag: Any, cc_rows: Iterable[CovidcastRow]) -> bool:
+    """Stage the rows of a file, returning False if they were rolled back because they could not be loaded."""
+
+    if not self._checked_load_table:
+      self.database._check_load_table_empty("load_session")
+      self._checked_load_table = True
+
+    rows = list(cc_rows)
+    first = rows[0] if rows else None
+    key = first and (first.source, first.signal, first.time_type, first.geo_type, first.time_value)
+    # (empty files have no key, and never conflict)
+    if self._tags and (key in self._keys or time.time() - self._started >= self.max_seconds):
+      self.flush()
+
+    self.database.savepoint(self.SAVEPOINT)
+    try:
+      modified_row_count = self.database.stage_rows(rows)
+    except Exception as e:
+      self.logger.exception('exception while staging rows', exc_info=e, file=str(tag))
+      self.database.rollback_to_savepoint(self.SAVEPOINT)
+      return False
+
+    if not self._tags:
+      self._started = time.time()
+    self._tags.append(tag)
+    self._rows.append(rows)
+    if key:
+      self._keys.add(key)
+    self._row_count += len(rows)
+    self._modified_row_count += modified_row_count or 0
+    if self._row_count >= self.max_rows:
+      self.flush()
+    return True
+
+  def flush(self):
+    """Dispatch the staged rows into dimension and fact tables, and commit."""
+
+    if not self._tags:
+      return
+    tags, files, row_count, modified_row_count = self._tags, self._rows, self._row_count, self._modified_row_count
+    self._reset()
+    start = time.time()
+    try:
+      self._dispatch()
+    except Exception as e:
+      self.logger.exception('exception while dispatching staged rows', exc_info=e, file_count=len(tags))
+      self.database.rollback()
+      if len(tags) == 1:
+        self.on_rollback(tags, e)
+        return
+      # find the failing files
+      for tag, rows in zip(tags, files):
+        self._dispatch_alone(tag, rows)
+      return
+    self.modified_row_count += modified_row_count
+    self.logger.info(
+      "Inserted database rows",
+      row_count=modified_row_count,
+      staged_row_count=row_count,
+      file_count=len(tags),
+      elapsed=round(time.time() - start, 2),
+    )
+    self.on_commit(tags)
+
+  def _dispatch(self):
+    self.database.fix_is_latest_issue()
+    self.database.run_dbjobs()
+    self.database.commit()
+
+  def _dispatch_alone(self, tag: Any, rows: List[CovidcastRow]):
+    """Stage and dispatch the rows of a single file after the dispatch of its batch failed."""
+
+    try:
+      modified_row_count = self.database.stage_rows(rows)
+      self._dispatch()
+    except Exception as e:
+      self.logger.exception('exception while dispatching staged rows', exc_info=e, file=str(tag))
+      self.database.rollback()
+      self.on_rollback([tag], e)
+      return
+    self.modified_row_count += modified_row_count or 0
+    self.logger.info("Inserted database rows", row_count=modified_row_count, staged_row_count=len(rows), file_count=1)
+    self.on_commit([tag])
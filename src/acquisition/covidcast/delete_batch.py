@@ -21,9 +21,17 @@ def get_argument_parser():
     parser.add_argument(
       '--log_file',
       help="filename for log output (defaults to stdout)")
+    parser.add_argument(
+      '--load_data_infile',
+      action='store_true',
+      help='load deletions with LOAD DATA LOCAL INFILE instead of INSERT statements, falling back to the latter if the server refuses')
+    parser.add_argument(
+      '--commit_chunks',
+      action='store_true',
+      help='commit the deletions of each chunk of signals on its own instead of each file at once, bounding the lock time of large files')
     return parser
 
-def handle_file(deletion_file, database, logger):
+def handle_file(deletion_file, database, logger, commit_chunks=False):
     logger.info("Deleting from csv file", filename=deletion_file)
     rows = []
     with open(deletion_file) as f:
@@ -33,7 +41,7 @@ def handle_file(deletion_file, database, logger):
             rows.append(fields + ["day"])
     rows = rows[1:]
     try:
-        n = database.delete_batch(rows)
+        n = database.delete_batch(rows, commit_chunks=commit_chunks)
         logger.info("Deleted database rows", row_count=n)
         return n
     except Exception as e:
@@ -47,12 +55,12 @@ def main(args):
     logger = get_structured_logger("csv_deletion", filename=args.log_file)
     start_time = time.time()
     database = Database()
-    database.connect()
+    database.connect(load_data_infile=args.load_data_infile)
     all_n = 0
 
     try:
         for deletion_file in sorted(glob.glob(os.path.join(args.deletion_dir, '*.csv'))):
-            n = handle_file(deletion_file, database, logger)
+            n = handle_file(deletion_file, database, logger, args.commit_chunks)
             if n is not None:
                 all_n += n
             else:
@@ -4,10 +4,24 @@
 import gzip
 import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# third party
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
 
 # first party
 from delphi.epidata.common.logger import get_structured_logger
 
+# extension and default level of each compression codec
+CODECS = {
+  'gzip': ('.gz', 9),
+  'zstd': ('.zst', 3),
+}
+
 class FileArchiver:
   """Archives files by moving and compressing."""
 
@@ -16,8 +30,10 @@ class FileArchiver:
                       gzip=gzip,
                       os=os,
                       shutil=shutil,
-                      open_impl=open):
-    return FileArchiver.archive_file(path, path, filename, True, gzip, os, shutil, open_impl)
+                      open_impl=open,
+                      codec='gzip',
+                      level=None):
+    return FileArchiver.archive_file(path, path, filename, True, gzip, os, shutil, open_impl, codec, level)
 
   @staticmethod
   def archive_file(
@@ -28,7 +44,9 @@ class FileArchiver:
       gzip=gzip,
       os=os,
       shutil=shutil,
-      open_impl=open):
+      open_impl=open,
+      codec='gzip',
+      level=None):
     """Archive a file and return the path and `stat` of the destination file.
 
     WARNING: This is a potentially destructive operation. See details below.
@@ -36,7 +54,10 @@ class FileArchiver:
     path_src: the directory which contains the file to be archived
     path_dst: the directory into which the file should be moved
     filename: the name of the file within `path_src`
-    compress: gzips the file if true, otherise moves the file unmodified
+    compress: compresses the file if true, otherise moves the file unmodified
+    codec: the compression codec, "gzip" (the default) or "zstd" (which
+      requires the `zstandard` package, and is much faster)
+    level: the compression level, by default 9 for gzip and 3 for zstd
 
     The destination directory will be created if necessary. If the destination
     file already exists, it will be overwritten.
@@ -47,7 +68,14 @@ class FileArchiver:
     dst = os.path.join(path_dst, filename)
 
     if compress:
-      dst += '.gz'
+      if codec not in CODECS:
+        raise ValueError(f'unknown compression codec: {codec}')
+      if codec == 'zstd' and zstandard is None:
+        raise ValueError('the zstd codec requires the zstandard package')
+      extension, default_level = CODECS[codec]
+      dst += extension
+      if level is None:
+        level = default_level
 
     # make sure the destination directory exists
     os.makedirs(path_dst, exist_ok=True)
@@ -56,11 +84,17 @@ class FileArchiver:
       # warn that destination is about to be overwritten
       logger.warning(event='destination exists, will overwrite', file=dst)
 
+    start_time = time.time()
+    bytes_in = os.stat(src).st_size
     if compress:
       # make a compressed copy
       with open_impl(src, 'rb') as f_in:
-        with gzip.open(dst, 'wb') as f_out:
-          shutil.copyfileobj(f_in, f_out)
+        if codec == 'zstd':
+          with open_impl(dst, 'wb') as f_out:
+            zstandard.ZstdCompressor(level=level).copy_stream(f_in, f_out)
+        else:
+          with gzip.open(dst, 'wb', compresslevel=level) as f_out:
+            shutil.copyfileobj(f_in, f_out)
 
       # delete the original
       os.remove(src)
@@ -69,4 +103,48 @@ class FileArchiver:
       shutil.move(src, dst)
 
     # return filesystem information about the destination file
-    return (dst, os.stat(dst))
+    stat = os.stat(dst)
+    logger.info(
+      'archived file',
+      file=dst,
+      bytes_in=bytes_in,
+      bytes_out=stat.st_size,
+      elapsed=round(time.time() - start_time, 3))
+    return (dst, stat)
+
+
+class BackgroundArchiver:
+  """Runs archiving handlers on a pool of threads, so that they don't block the caller.
+
+  The compression libraries release the GIL, so threads compress files in parallel.
+  With no threads, the handlers are run when they are submitted.
+  Errors of the handlers are raised by `close`, once all of them are done, unless the context is
+  exited with an exception, which is raised instead of them (they are logged).
+  """
+
+  def __init__(self, threads=4):
+    self._executor = ThreadPoolExecutor(threads) if threads else None
+    self._futures = []
+
+  def submit(self, handler, *args):
+    if self._executor is None:
+      handler(*args)
+    else:
+      self._futures.append(self._executor.submit(handler, *args))
+
+  def close(self, raise_errors=True):
+    if self._executor is not None:
+      self._executor.shutdown(wait=True)
+    futures, self._futures = self._futures, []
+    for future in futures:
+      if raise_errors:
+        future.result()
+      elif future.exception() is not None:
+        get_structured_logger("file_archiver").error('exception while archiving', exception=future.exception())
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    # don't hide the error of the block, e.g. a bad load state
+    self.close(raise_errors=exc_type is None)
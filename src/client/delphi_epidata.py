@@ -11,6 +11,7 @@ Notes:
 # External modules
 import requests
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from tenacity import retry, stop_after_attempt
 
 from aiohttp import ClientSession, TCPConnector
@@ -614,9 +615,57 @@ class Epidata:
     if 'fields' in kwargs:
       params['fields'] = kwargs['fields']
 
+    if 'cursor' in kwargs:
+      params['cursor'] = kwargs['cursor']
+
     # Make the API call
     return Epidata._request(params)
 
+  # Fetch Delphi's COVID-19 Surveillance Streams, following truncated responses
+  @staticmethod
+  def covidcast_paged(
+          data_source, signals, time_type, geo_type,
+          time_values, geo_value, as_of=None, issues=None, lag=None, max_workers=4, **kwargs):
+    """Fetch Delphi's COVID-19 Surveillance Streams without a limit on the number of rows.
+
+    Truncated responses are continued with the cursor they return. Each of the
+    given `time_values` (single values or ranges) is fetched as its own chain of
+    pages, up to `max_workers` of them in parallel. The rows are returned in the
+    order of the `time_values`.
+    """
+    if not isinstance(time_values, (list, tuple)):
+      time_values = [time_values]
+
+    def fetch_pages(time_value):
+      epidata = []
+      cursor = None
+      while True:
+        page_kwargs = dict(kwargs, cursor=cursor) if cursor else kwargs
+        response = Epidata.covidcast(
+          data_source, signals, time_type, geo_type,
+          [time_value], geo_value, as_of=as_of, issues=issues, lag=lag, **page_kwargs)
+        if response['result'] not in (1, 2, -2):
+          return response
+        epidata.extend(response.get('epidata', []))
+        cursor = response.get('cursor')
+        if response['result'] != 2 or not cursor:
+          return {'result': response['result'], 'message': response['message'], 'epidata': epidata}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      responses = list(executor.map(fetch_pages, time_values))
+
+    epidata = []
+    for response in responses:
+      if response['result'] not in (1, 2, -2):
+        return response
+      epidata.extend(response['epidata'])
+    if any(response['result'] == 2 for response in responses):
+      # truncated by a server that does not return cursors
+      return {'result': 2, 'message': 'too many results, data truncated', 'epidata': epidata}
+    if not epidata:
+      return {'result': -2, 'message': 'no results', 'epidata': epidata}
+    return {'result': 1, 'message': 'success', 'epidata': epidata}
+
   # Fetch Delphi's COVID-19 Surveillance Streams metadata
   @staticmethod
   def covidcast_meta():
@@ -0,0 +1,2 @@
+-- the as_of seek of /covidcast looks up issues in `epimetric_full` by its key ids
+CREATE VIEW `epidata`.`epimetric_full` AS SELECT * FROM `covid`.`epimetric_full`;
@@ -0,0 +1,11 @@
+USE covid;
+
+-- incremented whenever data of the signal is loaded or deleted, used to invalidate cached API results
+CREATE TABLE IF NOT EXISTS signal_update (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL PRIMARY KEY,
+    `version` BIGINT(20) UNSIGNED NOT NULL DEFAULT 1
+) ENGINE=InnoDB;
+
+-- the API reads the versions through the `epidata` schema
+CREATE VIEW `epidata`.`signal_dim`           AS SELECT * FROM `covid`.`signal_dim`;
+CREATE VIEW `epidata`.`signal_update`        AS SELECT * FROM `covid`.`signal_update`;
@@ -0,0 +1,71 @@
+USE covid;
+
+-- aggregates of `epimetric_latest` per (signal, time type, geo type, time value), kept up to date by
+-- `Database.run_dbjobs` and `Database.delete_batch`; used for the covidcast metadata and coverage
+CREATE TABLE IF NOT EXISTS epimetric_summary (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL,
+    `time_type` VARCHAR(12) NOT NULL,
+    `geo_type` VARCHAR(12) NOT NULL,
+    `time_value` INT(11) NOT NULL,
+    `row_count` BIGINT(20) UNSIGNED NOT NULL,
+    `value_count` BIGINT(20) UNSIGNED NOT NULL,
+    `value_sum` DOUBLE,
+    `value_sumsq` DOUBLE,
+    `min_value` DOUBLE,
+    `max_value` DOUBLE,
+    `max_issue` INT(11) NOT NULL,
+    `last_update` INT(11) NOT NULL,
+    `min_lag` INT(11) NOT NULL,
+    `max_lag` INT(11) NOT NULL,
+
+    PRIMARY KEY (`signal_key_id`, `time_type`, `geo_type`, `time_value`)
+) ENGINE=InnoDB;
+
+CREATE OR REPLACE VIEW epimetric_summary_v AS
+    SELECT
+        `t2`.`source` AS `source`,
+        `t2`.`signal` AS `signal`,
+        `t1`.`time_type` AS `time_type`,
+        `t1`.`geo_type` AS `geo_type`,
+        `t1`.`time_value` AS `time_value`,
+        `t1`.`row_count` AS `row_count`,
+        `t1`.`value_count` AS `value_count`,
+        `t1`.`value_sum` AS `value_sum`,
+        `t1`.`value_sumsq` AS `value_sumsq`,
+        `t1`.`min_value` AS `min_value`,
+        `t1`.`max_value` AS `max_value`,
+        `t1`.`max_issue` AS `max_issue`,
+        `t1`.`last_update` AS `last_update`,
+        `t1`.`min_lag` AS `min_lag`,
+        `t1`.`max_lag` AS `max_lag`,
+        `t1`.`signal_key_id` AS `signal_key_id`
+    FROM `epimetric_summary` `t1`
+        JOIN `signal_dim` `t2` USING (`signal_key_id`);
+
+-- groups of `epimetric_summary` changed since the covidcast metadata was last computed incrementally,
+-- the version is incremented on every change
+CREATE TABLE IF NOT EXISTS epimetric_meta_dirty (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL,
+    `time_type` VARCHAR(12) NOT NULL,
+    `geo_type` VARCHAR(12) NOT NULL,
+    `version` BIGINT(20) UNSIGNED NOT NULL DEFAULT 1,
+
+    PRIMARY KEY (`signal_key_id`, `time_type`, `geo_type`)
+) ENGINE=InnoDB;
+
+-- the summary of the existing data
+REPLACE INTO epimetric_summary
+    (`signal_key_id`, `time_type`, `geo_type`, `time_value`, `row_count`, `value_count`, `value_sum`, `value_sumsq`,
+     `min_value`, `max_value`, `max_issue`, `last_update`, `min_lag`, `max_lag`)
+    SELECT
+        l.`signal_key_id`, l.`time_type`, g.`geo_type`, l.`time_value`,
+        COUNT(1), COUNT(l.`value`), SUM(l.`value`), SUM(l.`value` * l.`value`), MIN(l.`value`), MAX(l.`value`),
+        MAX(l.`issue`), MAX(l.`value_updated_timestamp`), MIN(l.`lag`), MAX(l.`lag`)
+    FROM epimetric_latest l JOIN geo_dim g USING (`geo_key_id`)
+    GROUP BY l.`signal_key_id`, l.`time_type`, g.`geo_type`, l.`time_value`;
+
+-- the covidcast metadata cache may be older than the existing data, so the first incremental update recomputes every group
+INSERT IGNORE INTO epimetric_meta_dirty (`signal_key_id`, `time_type`, `geo_type`)
+    SELECT DISTINCT `signal_key_id`, `time_type`, `geo_type` FROM epimetric_summary;
+
+CREATE VIEW `epidata`.`epimetric_summary_v`  AS SELECT * FROM `covid`.`epimetric_summary_v`;
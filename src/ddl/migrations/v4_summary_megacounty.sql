@@ -0,0 +1,38 @@
+USE covid;
+
+-- megacounty rows per summary partition, for the `only-county` variant of /covidcast/coverage
+ALTER TABLE epimetric_summary ADD COLUMN `megacounty_count` BIGINT(20) UNSIGNED NOT NULL DEFAULT 0 AFTER `row_count`;
+
+CREATE OR REPLACE VIEW epimetric_summary_v AS
+    SELECT
+        `t2`.`source` AS `source`,
+        `t2`.`signal` AS `signal`,
+        `t1`.`time_type` AS `time_type`,
+        `t1`.`geo_type` AS `geo_type`,
+        `t1`.`time_value` AS `time_value`,
+        `t1`.`row_count` AS `row_count`,
+        `t1`.`megacounty_count` AS `megacounty_count`,
+        `t1`.`value_count` AS `value_count`,
+        `t1`.`value_sum` AS `value_sum`,
+        `t1`.`value_sumsq` AS `value_sumsq`,
+        `t1`.`min_value` AS `min_value`,
+        `t1`.`max_value` AS `max_value`,
+        `t1`.`max_issue` AS `max_issue`,
+        `t1`.`last_update` AS `last_update`,
+        `t1`.`min_lag` AS `min_lag`,
+        `t1`.`max_lag` AS `max_lag`,
+        `t1`.`signal_key_id` AS `signal_key_id`
+    FROM `epimetric_summary` `t1`
+        JOIN `signal_dim` `t2` USING (`signal_key_id`);
+
+-- the megacounties of the existing county partitions
+UPDATE epimetric_summary s JOIN (
+    SELECT l.`signal_key_id`, l.`time_type`, l.`time_value`, COUNT(1) AS `megacounty_count`
+    FROM epimetric_latest l JOIN geo_dim g USING (`geo_key_id`)
+    WHERE g.`geo_type` = 'county' AND RIGHT(g.`geo_value`, 3) = '000'
+    GROUP BY l.`signal_key_id`, l.`time_type`, l.`time_value`
+) m ON s.`signal_key_id` = m.`signal_key_id` AND s.`time_type` = m.`time_type` AND s.`geo_type` = 'county' AND s.`time_value` = m.`time_value`
+SET s.`megacounty_count` = m.`megacounty_count`;
+
+-- the columns of a `SELECT *` view are fixed when it is created, so the alias needs to be rebuilt for the new column
+CREATE OR REPLACE VIEW `epidata`.`epimetric_summary_v` AS SELECT * FROM `covid`.`epimetric_summary_v`;
@@ -16,6 +16,12 @@ CREATE TABLE signal_dim (
     UNIQUE INDEX `signal_dim_index` (`source`, `signal`)
 ) ENGINE=InnoDB;
 
+-- incremented whenever data of the signal is loaded or deleted, used to invalidate cached API results
+CREATE TABLE signal_update (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL PRIMARY KEY,
+    `version` BIGINT(20) UNSIGNED NOT NULL DEFAULT 1
+) ENGINE=InnoDB;
+
 CREATE TABLE strat_dim (
     `strat_key_id` BIGINT(20) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
     `stratification_name` VARCHAR(64) NOT NULL UNIQUE,
@@ -164,3 +170,59 @@ CREATE TABLE `covidcast_meta_cache` (
     PRIMARY KEY (`timestamp`)
 ) ENGINE=InnoDB;
 INSERT INTO covidcast_meta_cache VALUES (0, '[]');
+
+-- aggregates of `epimetric_latest` per (signal, time type, geo type, time value), kept up to date by
+-- `Database.run_dbjobs` and `Database.delete_batch`; used for the covidcast metadata and coverage
+CREATE TABLE epimetric_summary (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL,
+    `time_type` VARCHAR(12) NOT NULL,
+    `geo_type` VARCHAR(12) NOT NULL,
+    `time_value` INT(11) NOT NULL,
+    `row_count` BIGINT(20) UNSIGNED NOT NULL,
+    -- rows of megacounties (geo values ending in 000), excluded by the `only-county` coverage
+    `megacounty_count` BIGINT(20) UNSIGNED NOT NULL DEFAULT 0,
+    `value_count` BIGINT(20) UNSIGNED NOT NULL,
+    `value_sum` DOUBLE,
+    `value_sumsq` DOUBLE,
+    `min_value` DOUBLE,
+    `max_value` DOUBLE,
+    `max_issue` INT(11) NOT NULL,
+    `last_update` INT(11) NOT NULL,
+    `min_lag` INT(11) NOT NULL,
+    `max_lag` INT(11) NOT NULL,
+
+    PRIMARY KEY (`signal_key_id`, `time_type`, `geo_type`, `time_value`)
+) ENGINE=InnoDB;
+
+CREATE OR REPLACE VIEW epimetric_summary_v AS
+    SELECT
+        `t2`.`source` AS `source`,
+        `t2`.`signal` AS `signal`,
+        `t1`.`time_type` AS `time_type`,
+        `t1`.`geo_type` AS `geo_type`,
+        `t1`.`time_value` AS `time_value`,
+        `t1`.`row_count` AS `row_count`,
+        `t1`.`megacounty_count` AS `megacounty_count`,
+        `t1`.`value_count` AS `value_count`,
+        `t1`.`value_sum` AS `value_sum`,
+        `t1`.`value_sumsq` AS `value_sumsq`,
+        `t1`.`min_value` AS `min_value`,
+        `t1`.`max_value` AS `max_value`,
+        `t1`.`max_issue` AS `max_issue`,
+        `t1`.`last_update` AS `last_update`,
+        `t1`.`min_lag` AS `min_lag`,
+        `t1`.`max_lag` AS `max_lag`,
+        `t1`.`signal_key_id` AS `signal_key_id`
+    FROM `epimetric_summary` `t1`
+        JOIN `signal_dim` `t2` USING (`signal_key_id`);
+
+-- groups of `epimetric_summary` changed since the covidcast metadata was last computed incrementally,
+-- the version is incremented on every change
+CREATE TABLE epimetric_meta_dirty (
+    `signal_key_id` BIGINT(20) UNSIGNED NOT NULL,
+    `time_type` VARCHAR(12) NOT NULL,
+    `geo_type` VARCHAR(12) NOT NULL,
+    `version` BIGINT(20) UNSIGNED NOT NULL DEFAULT 1,
+
+    PRIMARY KEY (`signal_key_id`, `time_type`, `geo_type`)
+) ENGINE=InnoDB;
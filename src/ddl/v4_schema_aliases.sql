@@ -6,5 +6,9 @@
 -- ----------------------------------
 
 CREATE VIEW `epidata`.`epimetric_full_v`     AS SELECT * FROM `covid`.`epimetric_full_v`;
+CREATE VIEW `epidata`.`epimetric_full`       AS SELECT * FROM `covid`.`epimetric_full`;
 CREATE VIEW `epidata`.`epimetric_latest_v`   AS SELECT * FROM `covid`.`epimetric_latest_v`;
 CREATE VIEW `epidata`.`covidcast_meta_cache` AS SELECT * FROM `covid`.`covidcast_meta_cache`;
+CREATE VIEW `epidata`.`epimetric_summary_v`  AS SELECT * FROM `covid`.`epimetric_summary_v`;
+CREATE VIEW `epidata`.`signal_dim`           AS SELECT * FROM `covid`.`signal_dim`;
+CREATE VIEW `epidata`.`signal_update`        AS SELECT * FROM `covid`.`signal_update`;
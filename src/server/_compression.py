@@ -0,0 +1,178 @@
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from flask import Response, request
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+from ._config import RESPONSE_COMPRESSION_LEVELS, RESPONSE_COMPRESSION_MIN_BYTES
+from delphi.epidata.common.logger import get_structured_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _Encoder:
+    """
+    streaming compressor of a content encoding
+    """
+
+    def __init__(self, compress: Callable[[bytes], bytes], flush: Callable[[], bytes]):
+        self.compress = compress
+        self.flush = flush
+
+
+def _gzip_encoder(level: int) -> _Encoder:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return _Encoder(compressor.compress, compressor.flush)
+
+
+def _brotli_encoder(level: int) -> _Encoder:
+    compressor = brotli.Compressor(quality=level)
+    return _Encoder(compressor.process, compressor.finish)
+
+
+def _zstd_encoder(level: int) -> _Encoder:
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return _Encoder(compressor.compress, compressor.flush)
+
+
+_ENCODERS: Dict[str, Callable[[int], _Encoder]] = {"gzip": _gzip_encoder}
+if brotli is not None:
+    _ENCODERS["br"] = _brotli_encoder
+if zstandard is not None:
+    _ENCODERS["zstd"] = _zstd_encoder
+
+
+def supported_encodings() -> List[str]:
+    """
+    the available and enabled content encodings in the order of preference
+    """
+    return [e for e, level in RESPONSE_COMPRESSION_LEVELS.items() if level is not None and e in _ENCODERS]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    picks the content encoding of the response based on the given Accept-Encoding header
+    """
+    return parse_accept_header(accept_encoding).best_match(supported_encodings())
+
+
+def _to_bytes(chunk: Union[str, bytes]) -> bytes:
+    return chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+def _stream(
+    chunks: Iterator[Union[str, bytes]],
+    head: List[bytes],
+    encoder: Optional[_Encoder],
+    log_fields: Dict,
+    cpu_time: float,
+) -> Iterable[bytes]:
+    raw_bytes = sent_bytes = 0
+    compression_time = 0.0
+
+    def encode(chunk: bytes) -> bytes:
+        nonlocal raw_bytes, sent_bytes, compression_time
+        raw_bytes += len(chunk)
+        if encoder is not None:
+            start = time.thread_time()
+            chunk = encoder.compress(chunk)
+            compression_time += time.thread_time() - start
+        sent_bytes += len(chunk)
+        return chunk
+
+    try:
+        for chunk in head:
+            data = encode(chunk)
+            if data:
+                yield data
+        while True:
+            start = time.thread_time()
+            chunk = next(chunks, None)
+            cpu_time += time.thread_time() - start
+            if chunk is None:
+                break
+            data = encode(_to_bytes(chunk))
+            if data:
+                yield data
+        if encoder is not None:
+            start = time.thread_time()
+            data = encoder.flush()
+            compression_time += time.thread_time() - start
+            sent_bytes += len(data)
+            yield data
+    finally:
+        get_structured_logger("server_api").info(
+            "Sent API response",
+            raw_bytes=raw_bytes,
+            sent_bytes=sent_bytes,
+            cpu_time_ms=(cpu_time + compression_time) * 1000,
+            compression_cpu_time_ms=compression_time * 1000,
+            **log_fields,
+        )
+
+
+class CompressedResponse(Response):
+    """
+    streamed response compressed with the content encoding negotiated with the client.
+    the encoding is only decided once the response is iterated by the server: responses smaller than
+    RESPONSE_COMPRESSION_MIN_BYTES are sent uncompressed, so the headers are started (lazily, as WSGI allows)
+    after looking ahead at the first chunks, within the streamed context rather than in the view function.
+    """
+
+    def __init__(self, response: Response, compressible: bool = True):
+        super().__init__(response.response, status=response.status, headers=response.headers)
+        self.compressible = compressible
+        self.log_fields = dict(url=request.url, format=request.values.get("format", "classic"), content_encoding=None)
+        if compressible:
+            self.vary.add("Accept-Encoding")
+
+    def __call__(self, environ, start_response):
+        chunks = iter(self.response)
+        # close the underlying generator too, even if the stream was never started
+        return ClosingIterator(self._send(environ, start_response, chunks), getattr(chunks, "close", None))
+
+    def _send(self, environ, start_response, chunks: Iterator[Union[str, bytes]]) -> Iterable[bytes]:
+        encoding = negotiate_encoding(environ.get("HTTP_ACCEPT_ENCODING")) if self.compressible else None
+        head: List[bytes] = []
+        cpu_time = 0.0
+        if encoding is not None:
+            # the headers have to be final before the first chunk is sent, so look ahead until the threshold is reached
+            head_bytes = 0
+            start = time.thread_time()
+            while head_bytes < RESPONSE_COMPRESSION_MIN_BYTES:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    # too small to be worth it
+                    encoding = None
+                    break
+                head.append(_to_bytes(chunk))
+                head_bytes += len(head[-1])
+            cpu_time = time.thread_time() - start
+
+        encoder = None
+        if encoding is not None:
+            encoder = _ENCODERS[encoding](RESPONSE_COMPRESSION_LEVELS[encoding])
+            self.headers["Content-Encoding"] = encoding
+            self.headers.pop("Content-Length", None)
+            self.automatically_set_content_length = False
+        self.log_fields["content_encoding"] = encoding
+        start_response(self.status, self.get_wsgi_headers(environ).to_wsgi_list())
+        yield from _stream(chunks, head, encoder, self.log_fields, cpu_time)
+
+
+def compress_response(response: Response, compressible: bool = True) -> Response:
+    """
+    adds a streaming compression stage for the content encoding negotiated with the client to the given streamed response,
+    and logs the sent bytes and the cpu time spent on the response once it is completed.
+    """
+    return CompressedResponse(response, compressible)
@@ -9,6 +9,33 @@ VERSION = "0.4.11"
 MAX_RESULTS = int(10e6)
 MAX_COMPATIBILITY_RESULTS = int(3650)
 
+# printers collect the formatted rows and send them in chunks of (at least) this many bytes
+PRINTER_FLUSH_BYTES = int(os.environ.get("PRINTER_FLUSH_BYTES", 64 * 1024))
+
+# compression of printed responses negotiated by the Accept-Encoding header, codecs in the order of preference
+RESPONSE_COMPRESSION_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+RESPONSE_COMPRESSION_LEVELS.update(json.loads(os.environ.get("RESPONSE_COMPRESSION_LEVELS", "{}")))
+# responses smaller than this are sent uncompressed
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+
+# seconds between checks whether the covidcast_meta_cache table changed, the decoded content is kept in memory in between
+COVIDCAST_META_CACHE_REVALIDATE_SECONDS = float(os.environ.get("COVIDCAST_META_CACHE_REVALIDATE_SECONDS", 60))
+
+# cache of /covidcast responses: "none" (off), "memory" (per worker LRU, of up to COVIDCAST_RESULT_CACHE_MAX_BYTES each) or "disk" (shared by the workers of a host)
+COVIDCAST_RESULT_CACHE_BACKEND = os.environ.get("COVIDCAST_RESULT_CACHE_BACKEND", "none")
+COVIDCAST_RESULT_CACHE_DIR = os.environ.get("COVIDCAST_RESULT_CACHE_DIR", "/tmp/covidcast_result_cache")
+COVIDCAST_RESULT_CACHE_MAX_BYTES = int(os.environ.get("COVIDCAST_RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# larger responses are not cached
+COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES", 16 * 1024 * 1024))
+# seconds between checks of the signal versions that invalidate cached responses
+COVIDCAST_RESULT_CACHE_REVALIDATE_SECONDS = float(os.environ.get("COVIDCAST_RESULT_CACHE_REVALIDATE_SECONDS", 60))
+
+# how /covidcast selects the latest issues as of a date: "auto" (by the estimated number of requested keys), "join", "window" or "seek"
+COVIDCAST_AS_OF_STRATEGY = os.environ.get("COVIDCAST_AS_OF_STRATEGY", "auto")
+# "auto" seeks the latest issue of each row up to this many (signal, geo, time) keys, and uses a window function from that many on
+COVIDCAST_AS_OF_SEEK_MAX_KEYS = int(os.environ.get("COVIDCAST_AS_OF_SEEK_MAX_KEYS", 10000))
+COVIDCAST_AS_OF_WINDOW_MIN_KEYS = int(os.environ.get("COVIDCAST_AS_OF_WINDOW_MIN_KEYS", 1000000))
+
 SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI", "sqlite:///test.db")
 
 # defaults
@@ -1,8 +1,9 @@
 from math import inf
 import re
+import threading
 from dataclasses import dataclass
-from typing import List, Optional, Sequence, Tuple, Union
-import delphi_utils    
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
+import delphi_utils
 
 from flask import request
 
@@ -49,6 +50,63 @@ def _parse_single_arg(key: str) -> Tuple[str, str]:
     return m.group(1).strip().lower(), m.group(2).strip().lower()
 
 
+class GeoValueIndex:
+    """
+    process-local index of the valid geo_values per geo_type, as known to GeoMapper.
+    built once per worker so that validating a GeoSet is a plain membership test.
+    """
+
+    # TODO: keep this translator in sync with CsvImporter.GEOGRAPHIC_RESOLUTIONS in acquisition/covidcast/ and with GeoMapper
+    GEO_TYPE_TRANSLATOR = {
+        "county": "fips",
+        "state": "state_id",
+        "zip": "zip",
+        "hrr": "hrr",
+        "hhs": "hhs",
+        "msa": "msa",
+        "nation": "nation",
+    }
+
+    def __init__(self):
+        self._values: Optional[Dict[str, FrozenSet[str]]] = None
+        self._lock = threading.RLock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._values is not None
+
+    def load(self) -> "GeoValueIndex":
+        """
+        (re)builds the index from a single GeoMapper instance
+        """
+        mapper = delphi_utils.geomap.GeoMapper()
+        values = {geo_type: frozenset(mapper.get_geo_values(mapper_type)) for geo_type, mapper_type in self.GEO_TYPE_TRANSLATOR.items()}
+        with self._lock:
+            self._values = values
+        return self
+
+    def get(self, geo_type: str) -> Optional[FrozenSet[str]]:
+        """
+        returns the allowed geo_values for the given geo_type or None if the geo_type is unknown to GeoMapper
+        """
+        if geo_type not in self.GEO_TYPE_TRANSLATOR:
+            return None
+        with self._lock:
+            if self._values is None:
+                # not warmed up at startup, load on first use
+                self.misses += 1
+                self.load()
+            else:
+                self.hits += 1
+            return self._values[geo_type]
+
+
+# validation index shared by all GeoSets of this worker, loaded at startup by main
+geo_value_index = GeoValueIndex()
+
+
 @dataclass
 class GeoSet:
     geo_type: str
@@ -58,19 +116,9 @@ class GeoSet:
         if not isinstance(geo_values, bool):
             if geo_values == ['']:
                 raise ValidationFailedException(f"geo_value is empty for the requested geo_type {geo_type}!")
-            # TODO: keep this translator in sync with CsvImporter.GEOGRAPHIC_RESOLUTIONS in acquisition/covidcast/ and with GeoMapper
-            geo_type_translator = {
-                "county": "fips",
-                "state": "state_id",
-                "zip": "zip",
-                "hrr": "hrr",
-                "hhs": "hhs",
-                "msa": "msa",
-                "nation": "nation"
-            }
-            if geo_type in geo_type_translator: # else geo_type is unknown to GeoMapper
-                allowed_values = delphi_utils.geomap.GeoMapper().get_geo_values(geo_type_translator[geo_type])
-                invalid_values = set(geo_values) - set(allowed_values)
+            allowed_values = geo_value_index.get(geo_type)
+            if allowed_values is not None: # else geo_type is unknown to GeoMapper
+                invalid_values = set(geo_values) - allowed_values
                 if invalid_values:
                     raise ValidationFailedException(f"Invalid geo_value(s) {', '.join(invalid_values)} for the requested geo_type {geo_type}")
         self.geo_type = geo_type
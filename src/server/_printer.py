@@ -1,15 +1,21 @@
-from csv import DictWriter
-from io import StringIO
-from typing import Any, Dict, Iterable, List, Optional, Union
+import csv
+from io import BytesIO, StringIO
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import zlib
 
 from flask import Response, jsonify, stream_with_context
 from flask.json import dumps
 import orjson
 
-from ._config import MAX_RESULTS, MAX_COMPATIBILITY_RESULTS
+from ._compression import compress_response
+from ._config import MAX_RESULTS, MAX_COMPATIBILITY_RESULTS, PRINTER_FLUSH_BYTES
 from ._common import is_compatibility_mode
 from delphi.epidata.common.logger import get_structured_logger
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 
 def print_non_standard(format: str, data):
     """
@@ -29,11 +35,41 @@ def print_non_standard(format: str, data):
     return jsonify(dict(result=result, message=message, epidata=data))
 
 
+def _append(buffer: bytearray, value: Optional[Union[str, bytes]]):
+    if value:
+        buffer += value.encode("utf-8") if isinstance(value, str) else value
+
+
+def _dump_rows(rows: List[Dict]) -> Optional[bytes]:
+    """
+    serializes the rows as the items of a JSON array (without the brackets) using a single orjson call,
+    returns None if a row cannot be serialized
+    """
+    try:
+        return orjson.dumps(rows)[1:-1]
+    except orjson.JSONEncodeError:
+        return None
+
+
 class APrinter:
+    # number of rows that are formatted at once
+    _batch_rows: int = 256
+    # whether the response may be compressed according to the Accept-Encoding of the request
+    _compressible: bool = True
+    # whether a truncated response tells the continuation token
+    supports_cursor: bool = False
+
     def __init__(self):
         self.count: int = 0
         self.result: int = -1
         self._max_results: int = MAX_COMPATIBILITY_RESULTS if is_compatibility_mode() else MAX_RESULTS
+        # continuation token for the rows after the last printed one, if the result was truncated
+        self.cursor: Optional[str] = None
+        self._flush_bytes: int = PRINTER_FLUSH_BYTES
+        # printed rows that are not formatted yet
+        self._rows: List[Dict] = []
+        self._rows_first: bool = True
+        self._capture: Optional[Tuple[Callable[[bytes], None], int]] = None
 
     def make_response(self, gen):
         return Response(
@@ -41,38 +77,74 @@ class APrinter:
             mimetype="application/json",
         )
 
+    def capture(self, callback: Callable[[bytes], None], max_bytes: int):
+        """
+        passes the complete printed body to `callback` once it is sent, unless the printing failed or the body exceeded `max_bytes`
+        """
+        self._capture = (callback, max_bytes)
+
+    def replay(self, body: bytes) -> Response:
+        """
+        responds with a body captured from a printer of the same type
+        """
+        return compress_response(self.make_response([body]), self._compressible)
+
+    def _captured(self, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        callback, max_bytes = self._capture
+        body: Optional[List[bytes]] = []
+        size = 0
+        for chunk in chunks:
+            if body is not None:
+                size += len(chunk)
+                if size > max_bytes:
+                    # too large, just stream it
+                    body = None
+                else:
+                    body.append(chunk)
+            yield chunk
+        if body is not None and self.result != -1:
+            callback(b"".join(body))
+
     def __call__(self, generator: Iterable[Dict[str, Any]]) -> Response:
         def gen():
             self.result = -2  # no result, default response
             began = False
+            buffer = bytearray()
             try:
                 for row in generator:
                     if not began:
                         # do it here to catch an error before we send the begin
-                        r = self._begin()
+                        _append(buffer, self._begin())
                         began = True
-                        if r is not None:
-                            yield r
-                    r = self._print_row(row)
-                    if r is not None:
-                        yield r
+                    self._print_row(row)
+                    if len(self._rows) >= self._batch_rows:
+                        self._flush_rows(buffer)
+                        if len(buffer) >= self._flush_bytes:
+                            yield bytes(buffer)
+                            buffer.clear()
+                self._flush_rows(buffer)
             except Exception as e:
+                try:
+                    # the rows printed before the error are still sent
+                    self._flush_rows(buffer)
+                except Exception as format_error:
+                    # formatting them one at a time would have failed first
+                    e = format_error
                 get_structured_logger('server_error').error("Exception while executing printer", exception=e)
                 self.result = -1
-                yield self._error(e)
+                _append(buffer, self._error(e))
 
             if not began:
                 # do it manually to catch an error before we send the begin
-                r = self._begin()
+                _append(buffer, self._begin())
                 began = True
-                if r is not None:
-                    yield r
 
-            r = self._end()
-            if r is not None:
-                yield r
+            _append(buffer, self._end())
+            if buffer:
+                yield bytes(buffer)
 
-        return self.make_response(stream_with_context(gen()))
+        chunks = gen() if self._capture is None else self._captured(gen())
+        return compress_response(self.make_response(stream_with_context(chunks)), self._compressible)
 
     @property
     def remaining_rows(self) -> int:
@@ -86,16 +158,31 @@ class APrinter:
         # send an generic error
         return dumps(dict(result=self.result, message=f"unknown error occurred: {error}", error=str(error), epidata=[]))
 
-    def _print_row(self, row: Dict) -> Optional[Union[str, bytes]]:
-        first = self.count == 0
+    def _print_row(self, row: Dict):
         if self.count >= self._max_results:
             # hit the limit
             self.result = 2
-            return None
-        if first:
+            return
+        if self.count == 0:
             self.result = 1  # at least one row
         self.count += 1
-        return self._format_row(first, row)
+        self._rows.append(row)
+
+    def _flush_rows(self, buffer: bytearray):
+        if not self._rows:
+            return
+        rows, first = self._rows, self._rows_first
+        self._rows = []
+        self._rows_first = False
+        self._write_rows(buffer, first, rows)
+
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
+        """
+        appends the formatted rows to the buffer, `first` tells whether they start with the first row
+        """
+        for row in rows:
+            _append(buffer, self._format_row(first, row))
+            first = False
 
     def _format_row(self, first: bool, row: Dict) -> Optional[Union[str, bytes]]:
         # hook
@@ -105,12 +192,26 @@ class APrinter:
         # hook
         return None
 
+    def set_fields(
+        self,
+        fields_string: Optional[Sequence[str]] = None,
+        fields_int: Optional[Sequence[str]] = None,
+        fields_float: Optional[Sequence[str]] = None,
+    ):
+        """
+        declares the types of the printed fields, used by typed output formats
+        """
+        # hook
+        pass
+
 
 class ClassicPrinter(APrinter):
     """
     a printer class writing in the classic epidata format
     """
 
+    supports_cursor = True
+
     def _begin(self):
         if is_compatibility_mode():
             return "{ "
@@ -123,6 +224,16 @@ class ClassicPrinter(APrinter):
             sep = b"," if not first else b""
         return sep + orjson.dumps(row)
 
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
+        items = _dump_rows(rows)
+        if items is None:
+            return super(ClassicPrinter, self)._write_rows(buffer, first, rows)
+        if first and is_compatibility_mode():
+            buffer += b'"epidata": ['
+        elif not first:
+            buffer += b","
+        buffer += items
+
     def _end(self):
         message = "success"
         prefix = "], "
@@ -134,7 +245,8 @@ class ClassicPrinter(APrinter):
             message = "no results"
         elif self.result == 2:
             message = "too many results, data truncated"
-        return f'{prefix}"result": {self.result}, "message": {dumps(message)} }}'.encode("utf-8")
+        cursor = f', "cursor": {dumps(self.cursor)}' if self.result == 2 and self.cursor else ""
+        return f'{prefix}"result": {self.result}, "message": {dumps(message)}{cursor} }}'.encode("utf-8")
 
 
 class ClassicTreePrinter(ClassicPrinter):
@@ -149,6 +261,9 @@ class ClassicTreePrinter(ClassicPrinter):
         super(ClassicTreePrinter, self).__init__()
         self.group = group
 
+    # the rows are collected in the tree one at a time
+    _write_rows = APrinter._write_rows
+
     def _begin(self):
         self._tree = dict()
         return super(ClassicTreePrinter, self)._begin()
@@ -174,20 +289,47 @@ class ClassicTreePrinter(ClassicPrinter):
         return tree + r
 
 
+def _gzip_stream(gen: Iterable[Union[str, bytes]], level: int = 6) -> Iterable[bytes]:
+    """
+    compresses the chunks of the given generator on the fly into a gzip file
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in gen:
+            data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # also on an early disconnect, which closes this generator only, release the request context and cursor
+        close = getattr(gen, "close", None)
+        if close is not None:
+            close()
+
+
 class CSVPrinter(APrinter):
     """
     a printer class writing in a CSV file
     """
 
-    _stream = StringIO()
-    _writer: DictWriter
     _filename: Optional[str]
+    _gzip: bool
 
-    def __init__(self, filename: Optional[str] = "epidata"):
+    def __init__(self, filename: Optional[str] = "epidata", gzip: bool = False):
         super(CSVPrinter, self).__init__()
         self._filename = filename
+        self._gzip = gzip
+        # already compressed
+        self._compressible = not gzip
+        self._stream = StringIO()
+        self._writer = csv.writer(self._stream, lineterminator="\n")
+        self._fieldnames: List[str] = []
+        self._getter: Optional[Callable[[Dict], Tuple]] = None
 
     def make_response(self, gen):
+        if self._gzip:
+            headers = {"Content-Disposition": f"attachment; filename={self._filename}.csv.gz"} if self._filename else {}
+            return Response(_gzip_stream(gen), mimetype="application/gzip", headers=headers)
         headers = {"Content-Disposition": f"attachment; filename={self._filename}.csv"} if self._filename else {}
         return Response(gen, mimetype="text/csv; charset=utf8", headers=headers)
 
@@ -198,21 +340,34 @@ class CSVPrinter(APrinter):
         # send an generic error
         return f"unknown error occurred:\n{error}"
 
-    def _format_row(self, first: bool, row: Dict):
+    def _row_values(self, row: Dict) -> Sequence[Any]:
+        if len(row) == len(self._fieldnames):
+            try:
+                return self._getter(row)
+            except KeyError:
+                pass
+        # same semantics as a DictWriter: missing fields are empty, unknown fields are an error
+        wrong_fields = row.keys() - set(self._fieldnames)
+        if wrong_fields:
+            raise ValueError("dict contains fields not in fieldnames: " + ", ".join([repr(x) for x in wrong_fields]))
+        return [row.get(f, "") for f in self._fieldnames]
+
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
         if first:
-            self._writer = DictWriter(self._stream, list(row.keys()), lineterminator="\n")
-            self._writer.writeheader()
-        self._writer.writerow(row)
-
-        # remove the stream content to print just one line at a time
-        self._stream.flush()
-        v = self._stream.getvalue()
-        self._stream.seek(0)
-        self._stream.truncate(0)
-        return v
+            # the columns are given by the first row
+            self._fieldnames = list(rows[0].keys())
+            getter = itemgetter(*self._fieldnames) if self._fieldnames else (lambda _: ())
+            self._getter = getter if len(self._fieldnames) != 1 else (lambda row: (getter(row),))
+            self._writer.writerow(self._fieldnames)
+        try:
+            self._writer.writerows(map(self._row_values, rows))
+        finally:
+            # the rows written before an error are still sent
+            _append(buffer, self._stream.getvalue())
+            self._stream.seek(0)
+            self._stream.truncate(0)
 
     def _end(self):
-        self._writer = None
         return ""
 
 
@@ -228,6 +383,14 @@ class JSONPrinter(APrinter):
         sep = b"," if not first else b""
         return sep + orjson.dumps(row)
 
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
+        items = _dump_rows(rows)
+        if items is None:
+            return super(JSONPrinter, self)._write_rows(buffer, first, rows)
+        if not first:
+            buffer += b","
+        buffer += items
+
     def _end(self):
         return b"]"
 
@@ -244,10 +407,111 @@ class JSONLPrinter(APrinter):
         # each line is a JSON file with a new line to separate them
         return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
 
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
+        for row in rows:
+            buffer += orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
     def _end(self):
         return b""
 
 
+class ArrowPrinter(APrinter):
+    """
+    a printer class writing an Apache Arrow IPC stream of typed record batches
+    """
+
+    # rows per record batch
+    _batch_rows: int = 10_000
+
+    def __init__(self):
+        super(ArrowPrinter, self).__init__()
+        # only needed by the arrow and parquet formats, so not imported by the workers unless requested
+        import pyarrow
+
+        self._pa = pyarrow
+        self._types: Dict[str, "pa.DataType"] = {}
+        self._schema: Optional["pa.Schema"] = None
+        self._sink = BytesIO()
+        self._writer = None
+
+    def make_response(self, gen):
+        return Response(gen, mimetype="application/vnd.apache.arrow.stream")
+
+    def set_fields(self, fields_string=None, fields_int=None, fields_float=None):
+        self._types = {}
+        for fields, data_type in ((fields_string, self._pa.string()), (fields_int, self._pa.int64()), (fields_float, self._pa.float64())):
+            for f in fields or []:
+                self._types[f] = data_type
+
+    def _create_schema(self, rows: List[Dict]) -> "pa.Schema":
+        if not rows:
+            return self._pa.schema(list(self._types.items()))
+        schema = []
+        for f in rows[0].keys():
+            data_type = self._types.get(f)
+            if data_type is None:
+                # undeclared field, e.g. added by a transform
+                data_type = self._pa.array([row.get(f) for row in rows]).type
+                if self._pa.types.is_null(data_type):
+                    data_type = self._pa.string()
+            schema.append((f, data_type))
+        return self._pa.schema(schema)
+
+    def _create_writer(self, sink: BytesIO, schema: "pa.Schema"):
+        return self._pa.ipc.new_stream(sink, schema)
+
+    def _write_batch(self, rows: List[Dict]):
+        if self._writer is None:
+            self._schema = self._create_schema(rows)
+            self._writer = self._create_writer(self._sink, self._schema)
+        if rows:
+            self._writer.write_batch(self._pa.RecordBatch.from_pylist(rows, schema=self._schema))
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate(0)
+        return data
+
+    def _write_rows(self, buffer: bytearray, first: bool, rows: List[Dict]):
+        self._write_batch(rows)
+        buffer += self._drain()
+
+    def _error(self, error: Exception) -> str:
+        # the stream is not closed and this message is not a valid arrow message, so readers fail on it
+        return f"unknown error occurred:\n{error}"
+
+    def _end(self):
+        if self.result == -1:
+            return None
+        self._write_batch([])
+        self._writer.close()
+        return self._drain()
+
+
+class ParquetPrinter(ArrowPrinter):
+    """
+    a printer class writing a Parquet file, one row group per batch
+    """
+
+    _batch_rows: int = 100_000
+    # the columns are compressed within the file already
+    _compressible: bool = False
+
+    def __init__(self, filename: Optional[str] = "epidata"):
+        super(ParquetPrinter, self).__init__()
+        self._filename = filename
+
+    def make_response(self, gen):
+        headers = {"Content-Disposition": f"attachment; filename={self._filename}.parquet"} if self._filename else {}
+        return Response(gen, mimetype="application/vnd.apache.parquet", headers=headers)
+
+    def _create_writer(self, sink: BytesIO, schema: "pa.Schema"):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(sink, schema)
+
+
 def create_printer(format: str) -> APrinter:
     if format is None:
         return ClassicPrinter()
@@ -262,4 +526,8 @@ def create_printer(format: str) -> APrinter:
         return CSVPrinter()
     if format == "jsonl":
         return JSONLPrinter()
+    if format == "arrow":
+        return ArrowPrinter()
+    if format == "parquet":
+        return ParquetPrinter()
     return ClassicPrinter()
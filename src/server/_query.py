@@ -1,9 +1,12 @@
+import base64
 from datetime import date, datetime
+from operator import itemgetter
 from typing import (
     Any,
     Callable,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Sequence,
@@ -14,12 +17,14 @@ from typing import (
 from flask import Response
 
 from flask import request
+import orjson
 from sqlalchemy import text
-from sqlalchemy.engine import Row
+from sqlalchemy.engine import CursorResult, Row
 
 from ._common import db
+from ._config import COVIDCAST_AS_OF_STRATEGY, COVIDCAST_AS_OF_SEEK_MAX_KEYS, COVIDCAST_AS_OF_WINDOW_MIN_KEYS
 from ._printer import create_printer, APrinter
-from ._exceptions import DatabaseErrorException
+from ._exceptions import DatabaseErrorException, ValidationFailedException
 from ._params import extract_strings, GeoSet, SourceSignalSet, TimeSet
 from .utils import time_values_to_ranges, IntRange, TimeValues
 
@@ -49,19 +54,75 @@ def to_condition(
     return f"{field} = :{param_key}"
 
 
+# upper bound of values within a single IN list, longer lists are split into multiple IN lists
+MAX_IN_LIST_SIZE = 1000
+
+
+def _coalesce_integers(values: Iterable[IntRange]) -> List[IntRange]:
+    """
+    merges integer values and ranges into a minimal sorted list of values and ranges,
+    e.g. [1, 2, 3, (5, 7), 8, 10] -> [(1, 3), (5, 8), 10]
+    """
+    intervals = sorted((v, v) if type(v) is int else (v[0], v[1]) for v in values)
+    merged: List[IntRange] = []
+    start, end = intervals[0]
+    for next_start, next_end in intervals:
+        if next_start <= end + 1:
+            if next_end > end:
+                end = next_end
+            continue
+        merged.append(start if start == end else (start, end))
+        start, end = next_start, next_end
+    merged.append(start if start == end else (start, end))
+    return merged
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _is_integer_range(value: Union[str, IntRange]) -> bool:
+    # exact type checks on purpose, bools are no values to merge
+    value_type = type(value)
+    if value_type is tuple or value_type is list:
+        return type(value[0]) is int and type(value[1]) is int
+    return value_type is int
+
+
 def filter_values(
     field: str,
     values: Optional[Sequence[Union[str, IntRange]]],
     param_key: str,
     params: Dict[str, Any],
-    formatter=lambda x: x,
+    formatter=_identity,
+    max_in_list_size: int = MAX_IN_LIST_SIZE,
 ) -> str:
     if not values:
         return "FALSE"
     # builds a SQL expression to filter strings (ex: locations)
     #   $field: name of the field to filter
     #   $values: array of values
-    conditions = [to_condition(field, v, f"{param_key}_{i}", params, formatter) for i, v in enumerate(values)]
+    # scalar values are combined in (chunked) IN lists, adjacent integers are merged into BETWEEN ranges
+    if all(_is_integer_range(v) for v in values):
+        values = _coalesce_integers(cast(Sequence[IntRange], values))
+
+    scalars: List[Union[str, int]] = []
+    ranges: List[Tuple[Any, Any]] = []
+    for v in values:
+        (ranges if isinstance(v, (list, tuple)) else scalars).append(v)
+    scalars = list(dict.fromkeys(scalars))
+
+    conditions: List[str] = []
+    for chunk_start in range(0, len(scalars), max_in_list_size):
+        chunk = scalars[chunk_start : chunk_start + max_in_list_size]
+        if len(chunk) == 1:
+            conditions.append(to_condition(field, chunk[0], f"{param_key}_{chunk_start}", params, formatter))
+            continue
+        keys = [f"{param_key}_{i}" for i in range(chunk_start, chunk_start + len(chunk))]
+        params.update(zip(keys, chunk if formatter is _identity else map(formatter, chunk)))
+        conditions.append(f"{field} IN (:{', :'.join(keys)})")
+    for i, v in enumerate(ranges, len(scalars)):
+        conditions.append(to_condition(field, v, f"{param_key}_{i}", params, formatter))
     return f"({' OR '.join(conditions)})"
 
 
@@ -195,6 +256,54 @@ def filter_time_set(
     return f"({parts})"
 
 
+def filter_after(
+    fields: Sequence[str],
+    values: Sequence[Any],
+    param_key: str,
+    params: Dict[str, Any],
+) -> str:
+    """
+    condition selecting the rows that come after the given key in the ascending order of the given fields,
+    written with a leading range on the first field, so that it becomes a seek on an index starting with the fields
+    """
+    if not fields:
+        return "TRUE"
+    condition = ""
+    for i in reversed(range(len(fields))):
+        p_key = f"{param_key}_{i}"
+        params[p_key] = values[i]
+        if not condition:
+            condition = f"{fields[i]} > :{p_key}"
+        else:
+            condition = f"({fields[i]} > :{p_key} OR ({fields[i]} = :{p_key} AND {condition}))"
+    return f"({fields[0]} >= :{param_key}_0 AND {condition})"
+
+
+def encode_cursor(fields: Sequence[str], values: Sequence[Any]) -> str:
+    """
+    creates an opaque continuation token for the rows after the given sort key
+    """
+    return base64.urlsafe_b64encode(orjson.dumps([list(fields), list(values)])).decode("ascii")
+
+
+def decode_cursor(cursor: str, fields: Sequence[str]) -> List[Any]:
+    """
+    extracts the sort key of a continuation token created by `encode_cursor` for the same sort fields
+    """
+    try:
+        cursor_fields, values = orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValidationFailedException("invalid cursor")
+    if (
+        cursor_fields != list(fields)
+        or not isinstance(values, list)
+        or len(values) != len(fields)
+        or not all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in values)
+    ):
+        raise ValidationFailedException("cursor does not match the query")
+    return values
+
+
 def parse_row(
     row: Row,
     fields_string: Optional[Sequence[str]] = None,
@@ -218,6 +327,103 @@ def parse_row(
     return parsed
 
 
+def _format_date(v: Any) -> Any:
+    return v.strftime("%Y-%m-%d") if isinstance(v, (date, datetime)) else v
+
+
+class RowParser:
+    """
+    converts result rows into dicts of the given fields, like `parse_row` but compiled once per query:
+    column positions are resolved from the result keys up front and type conversions are only applied to
+    the columns whose values the database driver does not already return in the target type
+    (e.g. dates for string fields or decimals for int/float fields).
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str],
+        fields_string: Optional[Sequence[str]] = None,
+        fields_int: Optional[Sequence[str]] = None,
+        fields_float: Optional[Sequence[str]] = None,
+    ):
+        index = {k: i for i, k in enumerate(keys)}
+        converters: Dict[str, Tuple[Callable[[Any], Any], type]] = {}
+        for f in fields_string or []:
+            converters[f] = (_format_date, str)
+        for f in fields_int or []:
+            converters[f] = (int, int)
+        for f in fields_float or []:
+            converters[f] = (float, float)
+
+        names = list(converters)
+        self._names = [f for f in names if f in index]
+        # fields that are not part of the result are always None
+        self._template: Optional[Dict[str, Any]] = dict.fromkeys(names) if len(self._names) < len(names) else None
+        self._getter = self._create_getter([index[f] for f in self._names])
+        # columns whose value type is not known yet, they are checked on the first non-None value
+        self._pending: Dict[str, Tuple[Callable[[Any], Any], type]] = {f: converters[f] for f in self._names}
+        # columns that need a conversion for every value
+        self._convert: List[Tuple[str, Callable[[Any], Any]]] = []
+
+    @staticmethod
+    def _create_getter(indices: List[int]) -> Callable[[Row], Tuple[Any, ...]]:
+        if not indices:
+            return lambda _: ()
+        if len(indices) == 1:
+            single = indices[0]
+            return lambda row: (row[single],)
+        return itemgetter(*indices)
+
+    def _resolve_pending(self, parsed: Dict[str, Any]):
+        for f, (converter, target_type) in list(self._pending.items()):
+            v = parsed[f]
+            if v is None:
+                continue
+            del self._pending[f]
+            # a column has a single type, so one value tells whether conversions are needed
+            if type(v) is not target_type:
+                self._convert.append((f, converter))
+
+    def __call__(self, row: Row) -> Dict[str, Any]:
+        if self._template is None:
+            parsed = dict(zip(self._names, self._getter(row)))
+        else:
+            parsed = self._template.copy()
+            parsed.update(zip(self._names, self._getter(row)))
+        if self._pending:
+            self._resolve_pending(parsed)
+        for f, converter in self._convert:
+            v = parsed[f]
+            if v is not None:
+                parsed[f] = converter(v)
+        return parsed
+
+    def parse_batch(self, rows: Sequence[Row]) -> List[Dict[str, Any]]:
+        return [self(row) for row in rows]
+
+
+# number of rows fetched at once from a streamed result
+ROW_BATCH_SIZE = 1000
+
+
+def iter_parsed_rows(
+    result: CursorResult,
+    fields_string: Optional[Sequence[str]] = None,
+    fields_int: Optional[Sequence[str]] = None,
+    fields_float: Optional[Sequence[str]] = None,
+    batch_size: int = ROW_BATCH_SIZE,
+) -> Iterator[Tuple[Dict[str, Any], Row]]:
+    """
+    fetches the result in batches and yields the parsed rows along with the original row
+    """
+    parser = RowParser(result.keys(), fields_string, fields_int, fields_float)
+    while True:
+        batch = result.fetchmany(batch_size)
+        if not batch:
+            break
+        yield from zip(parser.parse_batch(batch), batch)
+
+
 def parse_result(
     query: str,
     params: Dict[str, Any],
@@ -228,7 +434,7 @@ def parse_result(
     """
     execute the given query and return the result as a list of dictionaries
     """
-    return [parse_row(row, fields_string, fields_int, fields_float) for row in db.execute(text(query), **params)]
+    return [parsed for parsed, _ in iter_parsed_rows(db.execute(text(query), **params), fields_string, fields_int, fields_float)]
 
 
 def limit_query(query: str, limit: int) -> str:
@@ -256,12 +462,17 @@ def execute_queries(
     fields_int: Sequence[str],
     fields_float: Sequence[str],
     transform: Callable[[Dict[str, Any], Row], Dict[str, Any]] = _identity_transform,
+    cursor_fields: Optional[Sequence[str]] = None,
+    printer: Optional[APrinter] = None,
 ) -> Response:
     """
-    execute the given queries and return the response to send them
+    execute the given queries and return the response to send them.
+    if `cursor_fields` (the sort order of the queries) are given and the response is truncated,
+    the printer gets a continuation token for the rows after the last one sent.
+    by default, the printer is created from the requested format.
     """
 
-    p = create_printer(request.values.get("format"))
+    p = printer or create_printer(request.values.get("format"))
 
     fields_to_send = set(extract_strings("fields") or [])
     if fields_to_send:
@@ -277,6 +488,8 @@ def execute_queries(
             fields_int = [v for v in fields_int if v not in exclude_fields]
             fields_float = [v for v in fields_float if v not in exclude_fields]
 
+    p.set_fields(fields_string, fields_int, fields_float)
+
     query_list = list(queries)
 
     def dummy_gen():
@@ -287,16 +500,21 @@ def execute_queries(
         return p(dummy_gen)
 
     def gen(first_rows):
-        for row in first_rows:
-            yield transform(parse_row(row, fields_string, fields_int, fields_float), row)
+        previous = None
+        for parsed, row in iter_parsed_rows(first_rows, fields_string, fields_int, fields_float):
+            yield transform(parsed, row)
+            if cursor_fields and p.supports_cursor and p.result == 2 and p.cursor is None and previous is not None:
+                # the printer rejected this row, so continue after the previous one
+                p.cursor = encode_cursor(cursor_fields, [previous[f] for f in cursor_fields])
+            previous = row
 
         for query_params in query_list:
             if p.remaining_rows <= 0:
                 # no more rows
                 break
             r = run_query(p, query_params)
-            for row in r:
-                yield transform(parse_row(row, fields_string, fields_int, fields_float), row)
+            for parsed, row in iter_parsed_rows(r, fields_string, fields_int, fields_float):
+                yield transform(parsed, row)
 
     # execute first query
     try:
@@ -315,17 +533,58 @@ def execute_query(
     fields_int: Sequence[str],
     fields_float: Sequence[str],
     transform: Callable[[Dict[str, Any], Row], Dict[str, Any]] = _identity_transform,
+    cursor_fields: Optional[Sequence[str]] = None,
+    printer: Optional[APrinter] = None,
 ) -> Response:
     """
     execute the given query and return the response to send it
     """
-    return execute_queries([(query, params)], fields_string, fields_int, fields_float, transform)
+    return execute_queries([(query, params)], fields_string, fields_int, fields_float, transform, cursor_fields, printer)
 
 
 def _join_l(value: Union[str, List[str]]) -> str:
     return ", ".join(value) if isinstance(value, (list, tuple)) else value
 
 
+def estimate_key_count(
+    source_signal_sets: Sequence[SourceSignalSet],
+    geo_sets: Sequence[GeoSet],
+    time_set: Optional[TimeSet],
+) -> float:
+    """
+    estimates the number of (signal, geo, time) keys requested by the given sets, inf if any of them is a wildcard
+    """
+    counts = [
+        sum(s.count() for s in source_signal_sets),
+        sum(g.count() for g in geo_sets),
+        time_set.count() if time_set else float("inf"),
+    ]
+    if 0 in counts:
+        return 0
+    return counts[0] * counts[1] * counts[2]
+
+
+def choose_as_of_strategy(
+    source_signal_sets: Sequence[SourceSignalSet],
+    geo_sets: Sequence[GeoSet],
+    time_set: Optional[TimeSet],
+) -> str:
+    """
+    picks the strategy of `QueryBuilder.apply_as_of_filter` for the requested sets:
+    few keys are seeked one at a time, many keys are read in a single pass, the join is in between.
+    """
+    strategy = COVIDCAST_AS_OF_STRATEGY
+    if strategy == "auto":
+        keys = estimate_key_count(source_signal_sets, geo_sets, time_set)
+        if keys <= COVIDCAST_AS_OF_SEEK_MAX_KEYS:
+            strategy = "seek"
+        elif keys >= COVIDCAST_AS_OF_WINDOW_MIN_KEYS:
+            strategy = "window"
+        else:
+            strategy = "join"
+    return strategy
+
+
 class QueryBuilder:
     """
     query builder helper class for simplified conditions
@@ -341,6 +600,7 @@ class QueryBuilder:
         self.params: Dict[str, Any] = {}
         self.subquery: str = ""
         self.index: Optional[str] = None
+        self.sort_fields: List[str] = []
 
     def retable(self, new_table: str):
         """
@@ -483,14 +743,40 @@ class QueryBuilder:
                 self.where_integers("issue", issues)
         return self
 
-    def apply_as_of_filter(self, history_table: str, as_of: Optional[int]) -> "QueryBuilder":
-        if as_of is not None:
-            self.retable(history_table)
+    def apply_as_of_filter(
+        self,
+        history_table: str,
+        as_of: Optional[int],
+        strategy: str = "join",
+        seek_table: Optional[str] = None,
+    ) -> "QueryBuilder":
+        """
+        keeps the latest issue of each row as of the given issue, needs to be applied after the other filters (but before the cursor filter).
+
+        strategy (see `choose_as_of_strategy`):
+         - "join": joins the maximal issue of each key, grouped in a subquery
+         - "window": numbers the issues of each key with ROW_NUMBER() in a single pass over the matching rows
+         - "seek": looks up the maximal issue of each matching row in `seek_table` (by default `history_table`),
+           which needs the `signal_key_id` and `geo_key_id` columns
+        """
+        if as_of is None:
+            return self
+        alias = self.alias
+        self.retable(history_table)
+        self.params["as_of"] = as_of
+        if strategy == "window":
+            conditions = " AND ".join(self.conditions + [f"{alias}.issue <= :as_of"])
+            partition = f"{alias}.signal_key_id, {alias}.geo_key_id, {alias}.time_type, {alias}.time_value"
+            self.table = f"(SELECT {alias}.*, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {alias}.issue DESC) as_of_row FROM {self.table} WHERE {conditions}) {alias}"
+            self.conditions = [f"{alias}.as_of_row = 1"]
+        elif strategy == "seek":
+            key_condition = " AND ".join(f"h.{field} = {alias}.{field}" for field in ("signal_key_id", "geo_key_id", "time_type", "time_value"))
+            self.conditions.append(f"{alias}.issue <= :as_of")
+            self.conditions.append(f"{alias}.issue = (SELECT MAX(h.issue) FROM {seek_table or history_table} h WHERE {key_condition} AND h.issue <= :as_of)")
+        else:
             sub_condition_asof = "(issue <= :as_of)"
-            self.params["as_of"] = as_of
             sub_fields = "max(issue) max_issue, time_type, time_value, `source`, `signal`, geo_type, geo_value"
             sub_group = "time_type, time_value, `source`, `signal`, geo_type, geo_value"
-            alias = self.alias
             sub_condition = f"x.max_issue = {alias}.issue AND x.time_type = {alias}.time_type AND x.time_value = {alias}.time_value AND x.source = {alias}.source AND x.signal = {alias}.signal AND x.geo_type = {alias}.geo_type AND x.geo_value = {alias}.geo_value"
             self.subquery = f"JOIN (SELECT {sub_fields} FROM {self.table} WHERE {self.conditions_clause} AND {sub_condition_asof} GROUP BY {sub_group}) x ON {sub_condition}"
         return self
@@ -505,6 +791,16 @@ class QueryBuilder:
         """
 
         self.order = [f"{self.alias}.{k} ASC" for k in args]
+        self.sort_fields = list(args)
+        return self
+
+    def apply_cursor_filter(self, cursor: Optional[str], param_key: str = "cursor") -> "QueryBuilder":
+        """
+        continues after the position of the given continuation token, needs to be applied after the sort order and the other filters
+        """
+        if cursor:
+            values = decode_cursor(cursor, self.sort_fields)
+            self.conditions.append(filter_after([self._fq_field(f) for f in self.sort_fields], values, param_key, self.params))
         return self
 
     def with_max_issue(self, *args: str) -> "QueryBuilder":
@@ -1,14 +1,12 @@
 from typing import List, Optional, Tuple, Dict, Any
-from itertools import groupby
 from datetime import date, timedelta
 from epiweeks import Week
 from flask import Blueprint, request
-from flask.json import loads, jsonify
-from bisect import bisect_right
-from sqlalchemy import text
+from flask.json import jsonify
 from pandas import read_csv, to_datetime
 
-from .._common import is_compatibility_mode, db
+from .._common import is_compatibility_mode
+from .._config import COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES
 from .._exceptions import ValidationFailedException, DatabaseErrorException
 from .._params import (
     GeoSet,
@@ -17,23 +15,22 @@ from .._params import (
     extract_date,
     extract_dates,
     extract_integer,
+    extract_strings,
     parse_geo_arg,
     parse_source_signal_arg,
     parse_day_or_week_arg,
     parse_day_or_week_range_arg,
-    parse_single_source_signal_arg,
     parse_single_time_arg,
-    parse_single_geo_arg,
     parse_geo_sets,
     parse_source_signal_sets,
     parse_time_set,
 )
-from .._query import QueryBuilder, execute_query, run_query, parse_row, filter_fields
+from .._query import QueryBuilder, choose_as_of_strategy, execute_query, run_query, filter_fields
 from .._printer import create_printer, CSVPrinter
 from .._validate import require_all
 from .._pandas import as_pandas, print_pandas
-from .covidcast_utils import compute_trend, compute_trends, compute_trend_value, CovidcastMetaEntry
-from ..utils import shift_day_value, day_to_time_value, time_value_to_iso, time_value_to_day, shift_week_value, time_value_to_week, guess_time_value_is_day, week_to_time_value, TimeValues
+from .covidcast_utils import TrendSeries, BACKFILL_FIELDS, compute_backfill, CovidcastMetaEntry, meta_cache, result_cache
+from ..utils import shift_day_value, shift_day_values, shift_week_values, day_to_time_value, time_value_to_iso, time_value_to_day, shift_week_value, time_value_to_week, guess_time_value_is_day, week_to_time_value, TimeValues
 from .covidcast_utils.model import TimeType, count_signal_time_types, data_sources, create_source_signal_alias_mapper
 
 # first argument is the endpoint name
@@ -42,17 +39,44 @@ alias = None
 
 latest_table = "epimetric_latest_v"
 history_table = "epimetric_full_v"
+# the as_of seek looks up the issues by the key ids, without the joins of the history view
+history_base_table = "epimetric_full"
+summary_table = "epimetric_summary_v"
 
 @bp.route("/", methods=("GET", "POST"))
 def handle():
-    source_signal_sets = parse_source_signal_sets()
-    source_signal_sets, alias_mapper = create_source_signal_alias_mapper(source_signal_sets)
+    requested_source_signal_sets = parse_source_signal_sets()
+    source_signal_sets, alias_mapper = create_source_signal_alias_mapper(requested_source_signal_sets)
     time_set = parse_time_set()
     geo_sets = parse_geo_sets()
 
     as_of = extract_date("as_of")
     issues = extract_dates("issues")
     lag = extract_integer("lag")
+    is_compatibility = is_compatibility_mode()
+
+    # serve an identical query from the result cache, as long as none of its signals were updated since
+    p = create_printer(request.values.get("format"))
+    if request.values.get("cursor") and not p.supports_cursor:
+        # the other formats have no place for the cursor of the next page
+        raise ValidationFailedException("cursor is only supported by the classic and tree formats")
+    cache_key = result_cache.key(
+        requested_source_signal_sets,
+        geo_sets,
+        time_set,
+        as_of=as_of,
+        issues=issues,
+        lag=lag,
+        format=request.values.get("format"),
+        fields=sorted(set(extract_strings("fields") or [])),
+        compatibility=is_compatibility,
+        cursor=request.values.get("cursor"),
+    )
+    cache_stamp = result_cache.stamp(source_signal_sets)
+    cached = result_cache.get(cache_key, cache_stamp)
+    if cached is not None:
+        return p.replay(cached)
+    p.capture(lambda body: result_cache.put(cache_key, cache_stamp, body), COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES)
 
     # build query
     q = QueryBuilder(latest_table, "t")
@@ -60,9 +84,8 @@ def handle():
     fields_string = ["geo_value", "signal"]
     fields_int = ["time_value", "direction", "issue", "lag", "missing_value", "missing_stderr", "missing_sample_size"]
     fields_float = ["value", "stderr", "sample_size"]
-    is_compatibility = is_compatibility_mode()
     if is_compatibility:
-        q.set_sort_order("signal", "time_value", "geo_value", "issue")
+        q.set_sort_order("source", "signal", "time_value", "geo_value", "issue")
     else:
         # transfer also the new detail columns
         fields_string.extend(["source", "geo_type", "time_type"])
@@ -79,7 +102,9 @@ def handle():
 
     q.apply_issues_filter(history_table, issues)
     q.apply_lag_filter(history_table, lag)
-    q.apply_as_of_filter(history_table, as_of)
+    q.apply_as_of_filter(history_table, as_of, choose_as_of_strategy(source_signal_sets, geo_sets, time_set), history_base_table)
+    # continue a truncated response
+    q.apply_cursor_filter(request.values.get("cursor"))
 
     def transform_row(row, proxy):
         if is_compatibility or not alias_mapper or "source" not in row:
@@ -88,7 +113,7 @@ def handle():
         return row
 
     # send query
-    return execute_query(str(q), q.params, fields_string, fields_int, fields_float, transform=transform_row)
+    return execute_query(str(q), q.params, fields_string, fields_int, fields_float, transform=transform_row, cursor_fields=q.sort_fields, printer=p)
 
 
 def _verify_argument_time_type_matches(is_day_argument: bool, count_daily_signal: int, count_weekly_signal: int) -> None:
@@ -136,12 +161,11 @@ def handle_trend():
     p = create_printer(request.values.get("format"))
 
     def gen(rows):
-        for key, group in groupby((parse_row(row, fields_string, fields_int, fields_float) for row in rows), lambda row: (row["geo_type"], row["geo_value"], row["source"], row["signal"])):
-            geo_type, geo_value, source, signal = key
-            if alias_mapper:
-                source = alias_mapper(source, signal)
-            trend = compute_trend(geo_type, geo_value, source, signal, time_value, basis_time_value, ((row["time_value"], row["value"]) for row in group))
-            yield trend.asdict()
+        # the rows are (geo_type, geo_value, source, signal, time_value, value) as selected above
+        series = TrendSeries.from_rows(rows)
+        if alias_mapper:
+            series.map_sources(alias_mapper)
+        yield from series.trend(time_value, basis_time_value)
 
     # execute first query
     try:
@@ -188,13 +212,10 @@ def handle_trendseries():
         shifter = lambda x: shift_week_value(x, -basis_shift)
 
     def gen(rows):
-        for key, group in groupby((parse_row(row, fields_string, fields_int, fields_float) for row in rows), lambda row: (row["geo_type"], row["geo_value"], row["source"], row["signal"])):
-            geo_type, geo_value, source, signal = key
-            if alias_mapper:
-                source = alias_mapper(source, signal)
-            trends = compute_trends(geo_type, geo_value, source, signal, shifter, ((row["time_value"], row["value"]) for row in group))
-            for t in trends:
-                yield t.asdict()
+        series = TrendSeries.from_rows(rows)
+        if alias_mapper:
+            series.map_sources(alias_mapper)
+        yield from series.trends(shifter)
 
     # execute first query
     try:
@@ -230,23 +251,29 @@ def handle_export():
     if is_day != is_as_of_day:
         raise ValidationFailedException("mixing weeks with day arguments")
 
+    compression = request.values.get("compression")
+    if compression not in (None, "", "gzip"):
+        raise ValidationFailedException(f"unsupported compression: {compression}, supported: gzip")
+
     # build query
     q = QueryBuilder(latest_table, "t")
 
     q.set_fields(["geo_value", "signal", "time_value", "issue", "lag", "value", "stderr", "sample_size", "geo_type", "source"], [], [])
 
     q.set_sort_order("time_value", "geo_value")
+    time_set = TimeSet("day" if is_day else "week", [(start_day, end_day)])
+    geo_sets = [GeoSet(geo_type, True if geo_values == "*" else geo_values)]
     q.apply_source_signal_filters("source", "signal", source_signal_sets)
-    q.apply_time_filter("time_type", "time_value", TimeSet("day" if is_day else "week", [(start_day, end_day)]))
-    q.apply_geo_filters("geo_type", "geo_value", [GeoSet(geo_type, True if geo_values == "*" else geo_values)])
+    q.apply_time_filter("time_type", "time_value", time_set)
+    q.apply_geo_filters("geo_type", "geo_value", geo_sets)
 
-    q.apply_as_of_filter(history_table, as_of)
+    q.apply_as_of_filter(history_table, as_of, choose_as_of_strategy(source_signal_sets, geo_sets, time_set), history_base_table)
 
     format_date = time_value_to_iso if is_day else lambda x: time_value_to_week(x).cdcformat()
     # tag as_of in filename, if it was specified
     as_of_str = "-asof-{as_of}".format(as_of=format_date(as_of)) if as_of is not None else ""
     filename = "covidcast-{source}-{signal}-{start_day}-to-{end_day}{as_of}".format(source=source, signal=signal, start_day=format_date(start_day), end_day=format_date(end_day), as_of=as_of_str)
-    p = CSVPrinter(filename)
+    p = CSVPrinter(filename, gzip=compression == "gzip")
 
     def parse_row(i, row):
         # '',geo_value,signal,{time_value,issue},lag,value,stderr,sample_size,geo_type,data_source
@@ -290,66 +317,47 @@ def handle_export():
 def handle_backfill():
     """
     example query: http://localhost:5000/covidcast/backfill?signal=fb-survey:smoothed_cli&time=day:20200101-20220101&geo=state:ny&anchor_lag=60
+    several signals and geos can be requested at once (e.g. signal=fb-survey:smoothed_cli,smoothed_ili&geo=state:ny,ca),
+    the rows then also have their source, signal, geo_type and geo_value
     """
     require_all(request, "geo", "time", "signal")
-    source_signal_set = parse_single_source_signal_arg("signal")
-    daily_signals, weekly_signals = count_signal_time_types([source_signal_set])
-    source_signal_sets, _ = create_source_signal_alias_mapper([source_signal_set])
-    # don't need the alias mapper since we don't return the source
+    source_signal_sets = parse_source_signal_arg("signal")
+    daily_signals, weekly_signals = count_signal_time_types(source_signal_sets)
+    source_signal_sets, alias_mapper = create_source_signal_alias_mapper(source_signal_sets)
 
     time_set = parse_single_time_arg("time")
     is_day = time_set.is_day
     _verify_argument_time_type_matches(is_day, daily_signals, weekly_signals)
 
-    geo_set = parse_single_geo_arg("geo")
+    geo_sets = parse_geo_arg("geo")
     reference_anchor_lag = extract_integer("anchor_lag")  # in days or weeks
     if reference_anchor_lag is None:
         reference_anchor_lag = 60
+    # a single series keeps the original output without the key fields
+    is_single_series = len(source_signal_sets) == 1 and source_signal_sets[0].count() == 1 and len(geo_sets) == 1 and geo_sets[0].count() == 1
 
     # build query
     q = QueryBuilder(history_table, "t")
 
-    fields_string = []
-    fields_int = ["time_value", "issue"]
-    fields_float = ["value", "sample_size"]
-    # sort by time value and issue asc
-    q.set_sort_order("time_value", "issue")
-    q.set_fields(fields_string, fields_int, fields_float, ["is_latest_issue"])
+    # sort by series, time value and issue asc
+    q.set_sort_order(*BACKFILL_FIELDS[:6])
+    q.set_fields(BACKFILL_FIELDS)
 
     q.apply_source_signal_filters("source", "signal", source_signal_sets)
-    q.apply_geo_filters("geo_type", "geo_value", [geo_set])
+    q.apply_geo_filters("geo_type", "geo_value", geo_sets)
     q.apply_time_filter("time_type", "time_value", time_set)
 
     p = create_printer(request.values.get("format"))
 
-    def find_anchor_row(rows: List[Dict[str, Any]], issue: int) -> Optional[Dict[str, Any]]:
-        # assume sorted by issue asc
-        # find the row that is <= target issue
-        i = bisect_right([r["issue"] for r in rows], issue)
-        if i:
-            return rows[i - 1]
-        return None
+    def shift_anchor(time_values):
+        return shift_day_values(time_values, reference_anchor_lag) if is_day else shift_week_values(time_values, reference_anchor_lag)
 
     def gen(rows):
-        # stream per time_value
-        for time_value, group in groupby((parse_row(row, fields_string, fields_int, fields_float) for row in rows), lambda row: row["time_value"]):
-            # compute data per time value
-            issues: List[Dict[str, Any]] = [r for r in group]
-            shifted_time_value = shift_day_value(time_value, reference_anchor_lag) if is_day else shift_week_value(time_value, reference_anchor_lag)
-            anchor_row = find_anchor_row(issues, shifted_time_value)
-
-            for i, row in enumerate(issues):
-                if i > 0:
-                    prev_row = issues[i - 1]
-                    row["value_rel_change"] = compute_trend_value(row["value"] or 0, prev_row["value"] or 0, 0)
-                    if row["sample_size"] is not None:
-                        row["sample_size_rel_change"] = compute_trend_value(row["sample_size"] or 0, prev_row["sample_size"] or 0, 0)
-                if anchor_row and anchor_row["value"] is not None:
-                    row["is_anchor"] = row == anchor_row
-                    row["value_completeness"] = (row["value"] or 0) / anchor_row["value"] if anchor_row["value"] else 1
-                    if row["sample_size"] is not None:
-                        row["sample_size_completeness"] = row["sample_size"] / anchor_row["sample_size"] if anchor_row["sample_size"] else 1
-                yield row
+        backfill = compute_backfill(rows, shift_anchor, with_keys=not is_single_series)
+        for row in backfill:
+            if alias_mapper and not is_single_series:
+                row["source"] = alias_mapper(row["source"], row["signal"])
+            yield row
 
     # execute first query
     try:
@@ -396,14 +404,7 @@ def handle_meta():
     elif "week" in flags:
         filter_active = TimeType.week
 
-    row = db.execute(text("SELECT epidata FROM covidcast_meta_cache LIMIT 1")).fetchone()
-
-    data = loads(row["epidata"]) if row and row["epidata"] else []
-
-    by_signal: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
-    for row in data:
-        entry = by_signal.setdefault((row["data_source"], row["signal"]), [])
-        entry.append(row)
+    by_signal = meta_cache.get().by_signal
 
     sources: List[Dict[str, Any]] = []
     for source in data_sources:
@@ -475,7 +476,8 @@ def handle_coverage():
             time_window = TimeSet("day", [(day_to_time_value(now - timedelta(days=last)), day_to_time_value(now))])
     _verify_argument_time_type_matches(is_day, daily_signals, weekly_signals)
 
-    q = QueryBuilder(latest_table, "c")
+    # the summary already counts the locations of each time value, and the megacounties among the counties
+    q = QueryBuilder(summary_table, "c")
     fields_string = ["source", "signal"]
     fields_int = ["time_value"]
 
@@ -483,12 +485,11 @@ def handle_coverage():
 
     # manually append the count column because of grouping
     fields_int.append("count")
-    q.fields.append(f"count({q.alias}.geo_value) as count")
-
     if geo_type == "only-county":
+        q.fields.append(f"sum({q.alias}.row_count - {q.alias}.megacounty_count) as count")
         q.where(geo_type="county")
-        q.conditions.append('geo_value not like "%000"')
     else:
+        q.fields.append(f"sum({q.alias}.row_count) as count")
         q.where(geo_type=geo_type)
     q.apply_source_signal_filters("source", "signal", source_signal_sets)
     q.apply_time_filter("time_type", "time_value", time_window)
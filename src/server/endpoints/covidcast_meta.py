@@ -1,13 +1,11 @@
 from typing import Dict, List, Optional
 
 from flask import Blueprint, request
-from flask.json import loads
-from sqlalchemy import text
 
-from .._common import db
 from .._params import extract_strings
 from .._printer import create_printer
 from .._query import filter_fields
+from .covidcast_utils import meta_cache
 from delphi.epidata.common.logger import get_structured_logger
 
 bp = Blueprint("covidcast_meta", __name__)
@@ -34,25 +32,16 @@ def fetch_data(
     # complain if the cache is more than 75 minutes old
     max_age = 75 * 60
 
-    row = db.execute(
-        text(
-            "SELECT UNIX_TIMESTAMP(NOW()) - timestamp AS age, epidata FROM covidcast_meta_cache LIMIT 1"
-        )
-    ).fetchone()
+    snapshot = meta_cache.get()
 
-    if not row or not row["epidata"]:
+    if not snapshot.epidata:
         get_structured_logger('server_api').warning("no data in covidcast_meta cache")
         return
 
-    age = row["age"]
-    if age > max_age and row["epidata"]:
+    age = meta_cache.age
+    if age > max_age:
         get_structured_logger('server_api').warning("covidcast_meta cache is stale", cache_age=age)
 
-    epidata = loads(row["epidata"])
-
-    if not epidata:
-        return
-
     def filter_row(row: Dict):
         if time_types and row.get("time_type") not in time_types:
             return False
@@ -68,9 +57,10 @@ def fetch_data(
                 return True
         return False
 
-    for row in epidata:
+    for row in snapshot.epidata:
         if filter_row(row):
-            yield row
+            # copy since the cached rows are shared between requests and printers may modify them
+            yield dict(row)
 
 
 @bp.route("/", methods=("GET", "POST"))
@@ -1,2 +1,5 @@
-from .trend import compute_trend, compute_trend_value, compute_trends
-from .meta import CovidcastMetaEntry
\ No newline at end of file
+from .trend import compute_trend, compute_trend_value, compute_trends, TrendSeries
+from .backfill import BACKFILL_FIELDS, compute_backfill
+from .meta import CovidcastMetaEntry
+from .meta_cache import CovidcastMetaCache, CovidcastMetaSnapshot, meta_cache
+from .result_cache import CovidcastResultCache, result_cache
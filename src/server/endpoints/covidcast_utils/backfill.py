@@ -0,0 +1,136 @@
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+# the columns of the rows given to `compute_backfill`
+BACKFILL_KEY_FIELDS = ["source", "signal", "geo_type", "geo_value"]
+BACKFILL_FIELDS = BACKFILL_KEY_FIELDS + ["time_value", "issue", "value", "sample_size"]
+
+# rows with the same key and time value are the issues of one group
+_group_key = itemgetter(0, 1, 2, 3, 4)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, equal_is_zero: bool) -> np.ndarray:
+    """
+    `numerator / denominator (- 1)` as Python numbers, with the ints of `compute_trend_value` and of the completeness
+    where the denominator is 0
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = numerator / denominator - 1 if equal_is_zero else numerator / denominator
+    result = ratio.astype(object)
+    result[denominator == 0] = 1
+    if equal_is_zero:
+        result[numerator == denominator] = 0
+    return result
+
+
+def _iter_groups(rows: Iterator[Sequence[Any]], batch_size: int) -> Iterator[List[Sequence[Any]]]:
+    """
+    splits the rows into batches of about `batch_size` rows that end with complete groups
+    """
+    carry: List[Sequence[Any]] = []
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            if carry:
+                yield carry
+            return
+        batch = carry + batch if carry else batch
+        # the last group may continue in the next batch
+        last = _group_key(batch[-1])
+        cut = len(batch) - 1
+        while cut > 0 and _group_key(batch[cut - 1]) == last:
+            cut -= 1
+        carry = batch[cut:]
+        if cut:
+            yield batch[:cut]
+
+
+def _compute_batch(batch: List[Sequence[Any]], shift_anchor: Callable[[np.ndarray], np.ndarray], with_keys: bool) -> List[Dict[str, Any]]:
+    sources, signals, geo_types, geo_values, time_values, issues, values, sample_sizes = zip(*batch)
+    n = len(batch)
+    time_value = np.array(time_values, dtype=np.int64)
+    issue = np.array(issues, dtype=np.int64)
+    # NaN for NULL
+    value = np.array(values, dtype=np.float64)
+    sample_size = np.array(sample_sizes, dtype=np.float64)
+    has_value = ~np.isnan(value)
+    has_sample_size = ~np.isnan(sample_size)
+
+    first = np.ones(n, dtype=bool)
+    first[1:] = time_value[1:] != time_value[:-1]
+    for column in (sources, signals, geo_types, geo_values):
+        key = np.array(column, dtype=object)
+        first[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(first)
+    group = np.cumsum(first) - 1
+
+    # changes to the previous issue, NULL counting as 0
+    current_value = np.where(has_value, value, 0.0)
+    current_sample_size = np.where(has_sample_size, sample_size, 0.0)
+    value_rel_change = _ratio(current_value, np.roll(current_value, 1), True)
+    sample_size_rel_change = _ratio(current_sample_size, np.roll(current_sample_size, 1), True)
+
+    # the anchor of a group is its last issue up to the shifted time value (the issues are sorted)
+    positions = np.arange(n)
+    anchor_issue = shift_anchor(time_value[starts])
+    anchor = np.maximum.reduceat(np.where(issue <= anchor_issue[group], positions, -1), starts)[group]
+    with_anchor = anchor >= starts[group]
+    anchor = np.maximum(anchor, 0)
+    with_anchor &= has_value[anchor]
+    anchor_value = np.where(with_anchor, value[anchor], 1.0)
+    anchor_sample_size = np.where(has_sample_size[anchor], sample_size[anchor], 0.0)
+    value_completeness = _ratio(current_value, anchor_value, False)
+    sample_size_completeness = _ratio(np.where(has_sample_size, sample_size, 0.0), anchor_sample_size, False)
+
+    parsed_values = np.where(has_value, value, None).tolist()
+    parsed_sample_sizes = np.where(has_sample_size, sample_size, None).tolist()
+    columns = zip(
+        time_value.tolist(),
+        issue.tolist(),
+        parsed_values,
+        parsed_sample_sizes,
+        first.tolist(),
+        value_rel_change.tolist(),
+        sample_size_rel_change.tolist(),
+        with_anchor.tolist(),
+        (anchor == positions).tolist(),
+        value_completeness.tolist(),
+        sample_size_completeness.tolist(),
+    )
+    rows: List[Dict[str, Any]] = []
+    for i, (t, iss, v, ss, is_first, v_change, ss_change, has_anchor, is_anchor, v_completeness, ss_completeness) in enumerate(columns):
+        row = {"source": sources[i], "signal": signals[i], "geo_type": geo_types[i], "geo_value": geo_values[i]} if with_keys else {}
+        row["time_value"] = t
+        row["issue"] = iss
+        row["value"] = v
+        row["sample_size"] = ss
+        if not is_first:
+            row["value_rel_change"] = v_change
+            if ss is not None:
+                row["sample_size_rel_change"] = ss_change
+        if has_anchor:
+            row["is_anchor"] = is_anchor
+            row["value_completeness"] = v_completeness
+            if ss is not None:
+                row["sample_size_completeness"] = ss_completeness
+        rows.append(row)
+    return rows
+
+
+def compute_backfill(
+    rows: Iterable[Sequence[Any]],
+    shift_anchor: Callable[[np.ndarray], np.ndarray],
+    with_keys: bool = False,
+    batch_size: int = 10000,
+) -> Iterator[Dict[str, Any]]:
+    """
+    computes the backfill of (source, signal, geo_type, geo_value, time_value, issue, value, sample_size) rows
+    sorted by those columns in a single pass over batches of arrays:
+    the relative changes of the value and the sample size to the previous issue of the same time value,
+    and their completeness relative to the anchor, i.e. the last issue up to `shift_anchor(time_value)`.
+    """
+    for batch in _iter_groups(iter(rows), batch_size):
+        yield from _compute_batch(batch, shift_anchor, with_keys)
@@ -0,0 +1,107 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask.json import loads
+from sqlalchemy import text
+
+from ..._common import db
+from ..._config import COVIDCAST_META_CACHE_REVALIDATE_SECONDS
+from delphi.epidata.common.logger import get_structured_logger
+
+
+MetaKey = Tuple[str, str, str, str]
+
+
+@dataclass(frozen=True)
+class CovidcastMetaSnapshot:
+    """
+    one decoded version of the covidcast_meta_cache table.
+    instances are shared between requests and must be treated as read-only.
+    """
+
+    timestamp: int = 0
+    version: Tuple[int, int] = (0, 0)
+    epidata: List[Dict[str, Any]] = field(default_factory=list)
+    # (data_source, signal, time_type, geo_type) -> row
+    index: Dict[MetaKey, Dict[str, Any]] = field(default_factory=dict)
+    # (data_source, signal) -> rows
+    by_signal: Dict[Tuple[str, str], List[Dict[str, Any]]] = field(default_factory=dict)
+
+    @staticmethod
+    def from_epidata(timestamp: int, version: Tuple[int, int], epidata: List[Dict[str, Any]]) -> "CovidcastMetaSnapshot":
+        index: Dict[MetaKey, Dict[str, Any]] = {}
+        by_signal: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for row in epidata:
+            index[(row["data_source"], row["signal"], row["time_type"], row["geo_type"])] = row
+            by_signal.setdefault((row["data_source"], row["signal"]), []).append(row)
+        return CovidcastMetaSnapshot(timestamp, version, epidata, index, by_signal)
+
+    def get(self, data_source: str, signal: str, time_type: str, geo_type: str) -> Optional[Dict[str, Any]]:
+        return self.index.get((data_source, signal, time_type, geo_type))
+
+
+class CovidcastMetaCache:
+    """
+    per worker cache of the decoded covidcast_meta_cache blob.
+    the blob is only fetched and parsed again when its version (timestamp and length) changed,
+    which is checked with a cheap query at most every `revalidate_seconds`.
+    """
+
+    def __init__(self, revalidate_seconds: float = COVIDCAST_META_CACHE_REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        self._snapshot = CovidcastMetaSnapshot()
+        self._loaded = False
+        self._checked_at = 0.0
+        # database clock minus the clock of this worker, as of the last check
+        self._db_clock_offset = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = CovidcastMetaSnapshot()
+            self._loaded = False
+            self._checked_at = 0.0
+
+    @property
+    def age(self) -> float:
+        """
+        seconds since the current snapshot was computed, on the clock of the database
+        """
+        return time.time() + self._db_clock_offset - self._snapshot.timestamp
+
+    def get(self) -> CovidcastMetaSnapshot:
+        """
+        returns the current snapshot, revalidating it against the database if it is due
+        """
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.revalidate_seconds:
+            return self._snapshot
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.revalidate_seconds:
+                # revalidated by another thread in the meantime
+                return self._snapshot
+            self._revalidate()
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _revalidate(self):
+        row = db.execute(text("SELECT timestamp, LENGTH(epidata) AS length, UNIX_TIMESTAMP(NOW()) AS now FROM covidcast_meta_cache LIMIT 1")).fetchone()
+        version = (row["timestamp"], row["length"]) if row else (0, 0)
+        if row:
+            self._db_clock_offset = row["now"] - time.time()
+        if self._loaded and version == self._snapshot.version:
+            return
+        row = db.execute(text("SELECT timestamp, LENGTH(epidata) AS length, epidata FROM covidcast_meta_cache LIMIT 1")).fetchone()
+        if not row or not row["epidata"]:
+            self._snapshot = CovidcastMetaSnapshot()
+        else:
+            epidata = loads(row["epidata"]) or []
+            self._snapshot = CovidcastMetaSnapshot.from_epidata(row["timestamp"], (row["timestamp"], row["length"]), epidata)
+            get_structured_logger("server_api").info("loaded covidcast_meta cache", timestamp=row["timestamp"], rows=len(epidata))
+        self._loaded = True
+
+
+# the covidcast_meta_cache shared by all meta endpoints of this worker
+meta_cache = CovidcastMetaCache()
@@ -0,0 +1,297 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import text
+
+from ..._common import db
+from ..._config import (
+    COVIDCAST_RESULT_CACHE_BACKEND,
+    COVIDCAST_RESULT_CACHE_DIR,
+    COVIDCAST_RESULT_CACHE_MAX_BYTES,
+    COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES,
+    COVIDCAST_RESULT_CACHE_REVALIDATE_SECONDS,
+)
+from ..._params import GeoSet, SourceSignalSet, TimeSet
+from .meta_cache import meta_cache
+from delphi.epidata.common.logger import get_structured_logger
+
+
+class LRUBackend:
+    """
+    in-process store evicting the least recently used entries beyond `max_bytes`
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._remove(key)
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskBackend:
+    """
+    store with one file per entry in a local directory, which can be shared by all workers of a host.
+    the least recently used files are removed once they take more than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # bytes written since the last eviction check
+        self._written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            # atomic, so that readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            get_structured_logger("server_error").warning("cannot write covidcast result cache entry", path=path, exception=str(e))
+            return
+        self._written += len(value)
+        if self._written > self.max_bytes // 10:
+            self._written = 0
+            self._evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def _normalize_source_signal_sets(source_signal_sets: Sequence[SourceSignalSet]) -> List[Any]:
+    return sorted([s.source, True if s.signal is True else sorted(set(s.signal))] for s in source_signal_sets)
+
+
+def _normalize_geo_sets(geo_sets: Sequence[GeoSet]) -> List[Any]:
+    return sorted([g.geo_type, True if g.geo_values is True else sorted(set(g.geo_values))] for g in geo_sets)
+
+
+def _normalize_time_set(time_set: Optional[TimeSet]) -> Any:
+    if time_set is None:
+        return None
+    return [time_set.time_type, time_set.to_ranges().time_values]
+
+
+class CovidcastResultCache:
+    """
+    cache of complete /covidcast responses keyed on the normalized query.
+    entries are stamped with the versions of their signals (bumped by `run_dbjobs`) and the timestamp of the covidcast meta cache,
+    an entry is only used as long as its stamp is current. the versions are checked at most every `revalidate_seconds`.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_entry_bytes: int = COVIDCAST_RESULT_CACHE_MAX_ENTRY_BYTES,
+        revalidate_seconds: float = COVIDCAST_RESULT_CACHE_REVALIDATE_SECONDS,
+    ):
+        self.backend = backend
+        self.max_entry_bytes = max_entry_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.hits = 0
+        self.misses = 0
+        # (source, signal) -> version
+        self._versions: Dict[Tuple[str, str], int] = {}
+        # source -> sum of the versions of its signals
+        self._source_versions: Dict[str, int] = {}
+        self._loaded = False
+        # time of the last load attempt, also of a failed one, so that it is not repeated for every request
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def key(
+        source_signal_sets: Sequence[SourceSignalSet],
+        geo_sets: Sequence[GeoSet],
+        time_set: Optional[TimeSet],
+        **params: Any,
+    ) -> str:
+        """
+        cache key of a query, the same for equivalent sets of signals, geos, and times
+        """
+        query = dict(
+            params,
+            source_signal_sets=_normalize_source_signal_sets(source_signal_sets),
+            geo_sets=_normalize_geo_sets(geo_sets),
+            time_set=_normalize_time_set(time_set),
+        )
+        return hashlib.sha256(orjson.dumps(query, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def _refresh_versions(self) -> bool:
+        """
+        reloads the signal versions every `revalidate_seconds`, returns whether they are loaded
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.revalidate_seconds:
+            return self._loaded
+        with self._lock:
+            if now - self._checked_at < self.revalidate_seconds:
+                return self._loaded
+            try:
+                rows = db.execute(text("SELECT sd.`source`, sd.`signal`, su.`version` FROM signal_update su JOIN signal_dim sd USING (signal_key_id)")).fetchall()
+            except Exception as e:
+                # outdated versions could serve outdated responses, the cache is bypassed until the next check
+                self._loaded = False
+                self._checked_at = time.monotonic()
+                get_structured_logger("server_error").warning("cannot load signal versions, bypassing the covidcast result cache", exception=str(e))
+                return False
+            versions: Dict[Tuple[str, str], int] = {}
+            source_versions: Dict[str, int] = {}
+            for source, signal, version in rows:
+                versions[(source, signal)] = version
+                source_versions[source] = source_versions.get(source, 0) + version
+            self._versions, self._source_versions = versions, source_versions
+            self._loaded = True
+            self._checked_at = time.monotonic()
+            return True
+
+    def stamp(self, source_signal_sets: Sequence[SourceSignalSet]) -> Optional[bytes]:
+        """
+        the current versions of the given signals (as queried in the database) and of the meta cache,
+        None if they cannot be determined
+        """
+        if not self.enabled:
+            return None
+        if not self._refresh_versions():
+            return None
+        try:
+            meta_timestamp = meta_cache.get().timestamp
+        except Exception as e:
+            get_structured_logger("server_error").warning("cannot load the covidcast meta, bypassing the covidcast result cache", exception=str(e))
+            return None
+        signals = []
+        for s in source_signal_sets:
+            if s.signal is True:
+                signals.append([s.source, "*", self._source_versions.get(s.source, 0)])
+            else:
+                signals.extend([s.source, signal, self._versions.get((s.source, signal), 0)] for signal in s.signal)
+        return orjson.dumps([meta_timestamp, sorted(signals)])
+
+    def get(self, key: str, stamp: Optional[bytes]) -> Optional[bytes]:
+        """
+        returns the cached response body, if it was stored with the same stamp
+        """
+        if not self.enabled or stamp is None:
+            return None
+        entry = self.backend.get(key)
+        if entry is not None:
+            entry_stamp, _, body = entry.partition(b"\n")
+            if entry_stamp == stamp:
+                self.hits += 1
+                return body
+            # outdated
+            self.backend.delete(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, stamp: Optional[bytes], body: bytes):
+        if not self.enabled or stamp is None or len(body) > self.max_entry_bytes:
+            return
+        self.backend.set(key, stamp + b"\n" + body)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+
+def _create_backend():
+    if COVIDCAST_RESULT_CACHE_BACKEND == "memory":
+        return LRUBackend(COVIDCAST_RESULT_CACHE_MAX_BYTES)
+    if COVIDCAST_RESULT_CACHE_BACKEND == "disk":
+        return DiskBackend(COVIDCAST_RESULT_CACHE_DIR, COVIDCAST_RESULT_CACHE_MAX_BYTES)
+    return None
+
+
+# the cache of /covidcast responses of this worker
+result_cache = CovidcastResultCache(_create_backend())
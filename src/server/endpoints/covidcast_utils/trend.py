@@ -1,7 +1,10 @@
 from dataclasses import dataclass, asdict
-from typing import Optional, Iterable, Tuple, Dict, List, Callable
+from typing import Any, Optional, Iterable, Iterator, Sequence, Tuple, Dict, List, Callable
 from enum import Enum
 from collections import OrderedDict
+from operator import itemgetter
+
+import numpy as np
 
 
 class TrendEnum(str, Enum):
@@ -129,3 +132,221 @@ def compute_trend_class(trend_value: float) -> TrendEnum:
     if trend_value <= -0.1:
         return TrendEnum.decreasing
     return TrendEnum.steady
+
+
+# codes of the trends computed by `TrendSeries`
+_TREND_CLASSES = np.array([TrendEnum.unknown, TrendEnum.increasing, TrendEnum.decreasing, TrendEnum.steady], dtype=object)
+
+
+def _compute_trend_classes(current: np.ndarray, basis: np.ndarray, min_value: np.ndarray, valid: np.ndarray) -> List[TrendEnum]:
+    """
+    vectorized `compute_trend_class(compute_trend_value(current, basis, min_value))`, unknown where not valid
+    """
+    normalized_basis = basis - min_value
+    normalized_current = current - min_value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trend_value = np.where(
+            normalized_basis == normalized_current,
+            0.0,
+            np.where(normalized_basis == 0, 1.0, normalized_current / normalized_basis - 1),
+        )
+    codes = np.where(trend_value >= 0.1, 1, np.where(trend_value <= -0.1, 2, 3))
+    return _TREND_CLASSES[np.where(valid, codes, 0)].tolist()
+
+
+def _nullable(values: np.ndarray, present: np.ndarray) -> List[Any]:
+    return np.where(present, values, None).tolist()
+
+
+class TrendSeries:
+    """
+    the (time_value, value) series of many (geo_type, geo_value, source, signal) keys as arrays,
+    to compute the trends of all of them at once, like `compute_trend` and `compute_trends` do for one
+    """
+
+    def __init__(self, keys: List[Tuple[str, str, str, str]], starts: np.ndarray, times: np.ndarray, values: np.ndarray):
+        self.keys = keys
+        # first row of each key, the rows of a key are contiguous
+        self.starts = starts
+        self.times = times
+        # NaN for missing values
+        self.values = values
+        self.key_index = np.repeat(np.arange(len(keys)), np.diff(np.append(starts, len(times))))
+
+    @staticmethod
+    def from_rows(rows: Iterable[Sequence[Any]]) -> "TrendSeries":
+        """
+        reads (geo_type, geo_value, source, signal, time_value, value) rows, grouped by the first four
+        """
+        rows = list(rows)
+        # one column at a time, which unlike transposing the rows creates no objects per row
+        times = np.fromiter(map(itemgetter(4), rows), dtype=np.int64, count=len(rows))
+        values = np.array(list(map(itemgetter(5), rows)), dtype=np.float64)
+        key_columns = [np.array(list(map(itemgetter(i), rows)), dtype=object) for i in range(4)]
+        first = np.ones(len(times), dtype=bool)
+        for column in key_columns:
+            first[1:] &= column[1:] == column[:-1]
+        first = ~first
+        if len(first):
+            first[0] = True
+        starts = np.flatnonzero(first)
+        keys = list(zip(*(column[starts].tolist() for column in key_columns)))
+        return TrendSeries(keys, starts, times, values)
+
+    def map_sources(self, mapper: Callable[[str, str], str]) -> "TrendSeries":
+        self.keys = [(geo_type, geo_value, mapper(source, signal), signal) for geo_type, geo_value, source, signal in self.keys]
+        return self
+
+    def _min_max(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        the minimal and maximal value of each key (NaN if it has no values) and their first dates
+        """
+        if not self.keys:
+            empty = np.array([], dtype=np.float64)
+            return empty, empty, empty, empty
+        min_value = np.fmin.reduceat(self.values, self.starts)
+        max_value = np.fmax.reduceat(self.values, self.starts)
+        positions = np.arange(len(self.times))
+        min_first = np.minimum.reduceat(np.where(self.values == min_value[self.key_index], positions, len(positions)), self.starts)
+        max_first = np.minimum.reduceat(np.where(self.values == max_value[self.key_index], positions, len(positions)), self.starts)
+        min_date = np.where(np.isnan(min_value), 0, self.times[np.minimum(min_first, len(positions) - 1)])
+        max_date = np.where(np.isnan(max_value), 0, self.times[np.minimum(max_first, len(positions) - 1)])
+        return min_value, min_date, max_value, max_date
+
+    def trend(self, current_time: int, basis_time: int) -> Iterator[Dict[str, Any]]:
+        """
+        yields `compute_trend(..., current_time, basis_time, rows).asdict()` of each key
+        """
+        n = len(self.keys)
+        min_value, min_date, max_value, max_date = self._min_max()
+        value = np.full(n, np.nan)
+        basis_value = np.full(n, np.nan)
+        # the last row of the time wins, as in `compute_trend`
+        current = self.times == current_time
+        value[self.key_index[current]] = self.values[current]
+        basis = self.times == basis_time
+        basis_value[self.key_index[basis]] = self.values[basis]
+
+        has_value = ~np.isnan(value)
+        has_min = ~np.isnan(min_value)
+        valid = has_value & has_min
+        basis_trend = _compute_trend_classes(value, basis_value, min_value, valid & (basis_value != 0) & ~np.isnan(basis_value))
+        min_trend = _compute_trend_classes(value, min_value, min_value, valid)
+        max_trend = _compute_trend_classes(value, max_value, min_value, valid & (max_value != 0))
+
+        geo_types, geo_values, sources, signals = zip(*self.keys) if self.keys else ((), (), (), ())
+        columns = zip(
+            geo_types,
+            geo_values,
+            sources,
+            signals,
+            _nullable(value, has_value),
+            _nullable(basis_value, ~np.isnan(basis_value)),
+            basis_trend,
+            _nullable(min_date, has_min),
+            _nullable(min_value, has_min),
+            min_trend,
+            _nullable(max_date, has_min),
+            _nullable(max_value, has_min),
+            max_trend,
+        )
+        for geo_type, geo_value, source, signal, v, bv, bt, mind, minv, mint, maxd, maxv, maxt in columns:
+            # a literal, which is much faster to build than `Trend(...).asdict()`, with the same fields
+            yield {
+                "geo_type": geo_type,
+                "geo_value": geo_value,
+                "signal_source": source,
+                "signal_signal": signal,
+                "date": current_time,
+                "value": v,
+                "basis_date": basis_time,
+                "basis_value": bv,
+                "basis_trend": bt,
+                "min_date": mind,
+                "min_value": minv,
+                "min_trend": mint,
+                "max_date": maxd,
+                "max_value": maxv,
+                "max_trend": maxt,
+            }
+
+    def trends(self, shifter: Callable[[int], int]) -> Iterator[Dict[str, Any]]:
+        """
+        yields `compute_trends(..., shifter, rows)` of each key as dicts, the basis of each time given by `shifter`
+        """
+        if not self.keys:
+            return
+        min_value, min_date, max_value, max_date = self._min_max()
+        key_index = self.key_index
+
+        # the basis times of the distinct times only, which `shifter` computes one at a time
+        unique_times = np.unique(self.times)
+        unique_basis_times = np.array([shifter(t) for t in unique_times.tolist()], dtype=np.int64)
+        basis_times = unique_basis_times[np.searchsorted(unique_times, self.times)]
+
+        # looks up the (key, basis time) among the sorted (key, time) pairs
+        all_times = np.unique(np.concatenate([unique_times, unique_basis_times]))
+        pairs = key_index * len(all_times) + np.searchsorted(all_times, self.times)
+        basis_pairs = key_index * len(all_times) + np.searchsorted(all_times, basis_times)
+        order = np.argsort(pairs, kind="stable")
+        found_at = np.minimum(np.searchsorted(pairs[order], basis_pairs), len(pairs) - 1)
+        basis_rows = order[found_at]
+        basis_value = np.where(pairs[basis_rows] == basis_pairs, self.values[basis_rows], np.nan)
+
+        has_value = ~np.isnan(self.values)
+        has_basis = ~np.isnan(basis_value)
+        has_min = ~np.isnan(min_value)[key_index]
+        row_min, row_max = min_value[key_index], max_value[key_index]
+        valid = has_value & has_min
+        basis_trend = _compute_trend_classes(self.values, basis_value, row_min, valid & has_basis & (basis_value != 0))
+        min_trend = _compute_trend_classes(self.values, row_min, row_min, valid)
+        max_trend = _compute_trend_classes(self.values, row_max, row_min, valid & (row_max != 0))
+
+        # the fields of a key are the same in all of its records, which are copies of its record with the others replaced
+        has_min_key = ~np.isnan(min_value)
+        records = [
+            {
+                "geo_type": geo_type,
+                "geo_value": geo_value,
+                "signal_source": source,
+                "signal_signal": signal,
+                "date": None,
+                "value": None,
+                "basis_date": None,
+                "basis_value": None,
+                "basis_trend": None,
+                "min_date": mind,
+                "min_value": minv,
+                "min_trend": None,
+                "max_date": maxd,
+                "max_value": maxv,
+                "max_trend": None,
+            }
+            for (geo_type, geo_value, source, signal), mind, minv, maxd, maxv in zip(
+                self.keys,
+                _nullable(min_date, has_min_key),
+                _nullable(min_value, has_min_key),
+                _nullable(max_date, has_min_key),
+                _nullable(max_value, has_min_key),
+            )
+        ]
+        columns = zip(
+            key_index.tolist(),
+            self.times.tolist(),
+            _nullable(self.values, has_value),
+            _nullable(basis_times, has_basis),
+            _nullable(basis_value, has_basis),
+            basis_trend,
+            min_trend,
+            max_trend,
+        )
+        for key, date, v, bd, bv, bt, mint, maxt in columns:
+            row = records[key].copy()
+            row["date"] = date
+            row["value"] = v
+            row["basis_date"] = bd
+            row["basis_value"] = bv
+            row["basis_trend"] = bt
+            row["min_trend"] = mint
+            row["max_trend"] = maxt
+            yield row
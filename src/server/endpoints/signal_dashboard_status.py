@@ -1,7 +1,7 @@
 from flask import Blueprint, request
 
 from .signal_dashboard_coverage import fetch_coverage_data
-from .._query import parse_row, run_query
+from .._query import iter_parsed_rows, run_query
 from .._printer import create_printer
 from .._exceptions import DatabaseErrorException
 
@@ -33,8 +33,7 @@ def handle():
     p = create_printer(request.values.get("format"))
 
     def gen(rows, coverage_data):
-        for row in rows:
-            parsed = parse_row(row, fields_string, fields_int, fields_float)
+        for parsed, _ in iter_parsed_rows(rows, fields_string, fields_int, fields_float):
             # inject coverage data
             parsed["coverage"] = coverage_data.get(parsed["name"], {})
             yield parsed
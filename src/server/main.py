@@ -7,6 +7,7 @@ from flask import request, send_file, Response, send_from_directory, jsonify
 from ._config import URL_PREFIX, VERSION
 from ._common import app, set_compatibility_mode
 from ._exceptions import MissingOrWrongSourceException
+from ._params import geo_value_index
 from .endpoints import endpoints
 
 __all__ = ["app"]
@@ -21,6 +22,9 @@ for endpoint in endpoints:
     if alias:
         endpoint_map[alias] = endpoint.handle
 
+# build the geo_value validation index once per worker instead of per request
+geo_value_index.load()
+
 
 @app.route(f"{URL_PREFIX}/api.php", methods=["GET", "POST"])
 def handle_generic():
@@ -1,12 +1,14 @@
 from datetime import date, timedelta
 from typing import (
     Callable,
+    List,
     Optional,
     Sequence,
     Tuple,
     Union
 )
 
+import numpy as np
 from epiweeks import Week, Year
 from typing_extensions import TypeAlias
 
@@ -16,7 +18,82 @@ from delphi.epidata.common.logger import get_structured_logger
 IntRange: TypeAlias = Union[Tuple[int, int], int]
 TimeValues: TypeAlias = Sequence[IntRange]
 
+# precomputed calendar of the days and epiweeks of the years [_FIRST_YEAR, _LAST_YEAR], as ordinal indices:
+# the conversions and shifts of values within it are lookups, others fall back to `date` and `Week`
+_FIRST_YEAR = 2000
+_LAST_YEAR = 2040
+
+def _build_day_calendar() -> Tuple[List[date], List[int], List[str], List[int]]:
+    first, last = date(_FIRST_YEAR, 1, 1), date(_LAST_YEAR, 12, 31)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    # slot of YYYYMMDD: (YYYY - _FIRST_YEAR) * 372 + (MM - 1) * 31 + DD - 1, -1 for invalid dates
+    index = [-1] * ((_LAST_YEAR - _FIRST_YEAR + 1) * 372)
+    for i, d in enumerate(days):
+        index[(d.year - _FIRST_YEAR) * 372 + (d.month - 1) * 31 + d.day - 1] = i
+    return days, [d.year * 10000 + d.month * 100 + d.day for d in days], [d.isoformat() for d in days], index
+
+def _build_week_calendar() -> Tuple[List[Week], List[int], List[int]]:
+    weeks = []
+    week = Week(_FIRST_YEAR, 1)
+    while week.year <= _LAST_YEAR:
+        weeks.append(week)
+        week += 1
+    # slot of YYYYWW: (YYYY - _FIRST_YEAR) * 53 + WW - 1, -1 for invalid weeks
+    index = [-1] * ((_LAST_YEAR - _FIRST_YEAR + 1) * 53)
+    for i, w in enumerate(weeks):
+        index[(w.year - _FIRST_YEAR) * 53 + w.week - 1] = i
+    return weeks, [w.year * 100 + w.week for w in weeks], index
+
+_DAYS, _DAY_VALUES, _DAY_ISO, _DAY_INDEX = _build_day_calendar()
+_WEEKS, _WEEK_VALUES, _WEEK_INDEX = _build_week_calendar()
+_DAY_VALUES_ARRAY = np.array(_DAY_VALUES, dtype=np.int64)
+_DAY_ISO_ARRAY = np.array(_DAY_ISO, dtype=object)
+_DAY_INDEX_ARRAY = np.array(_DAY_INDEX, dtype=np.int64)
+_WEEK_VALUES_ARRAY = np.array(_WEEK_VALUES, dtype=np.int64)
+_WEEK_INDEX_ARRAY = np.array(_WEEK_INDEX, dtype=np.int64)
+
+def _day_index(value: int) -> int:
+    """
+    ordinal index of a YYYYMMDD value in the calendar, -1 if not in it
+    """
+    year, month, day = value // 10000, (value % 10000) // 100, value % 100
+    if _FIRST_YEAR <= year <= _LAST_YEAR and 1 <= month <= 12 and 1 <= day <= 31:
+        return _DAY_INDEX[(year - _FIRST_YEAR) * 372 + (month - 1) * 31 + day - 1]
+    return -1
+
+def _week_index(value: int) -> int:
+    """
+    ordinal index of a YYYYWW value in the calendar, -1 if not in it
+    """
+    year, week = value // 100, value % 100
+    if _FIRST_YEAR <= year <= _LAST_YEAR and 1 <= week <= 53:
+        return _WEEK_INDEX[(year - _FIRST_YEAR) * 53 + week - 1]
+    return -1
+
+def _day_indices(values: np.ndarray) -> np.ndarray:
+    year, month, day = values // 10000, (values % 10000) // 100, values % 100
+    covered = (year >= _FIRST_YEAR) & (year <= _LAST_YEAR) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    slots = np.where(covered, (year - _FIRST_YEAR) * 372 + (month - 1) * 31 + day - 1, 0)
+    return np.where(covered, _DAY_INDEX_ARRAY[slots], -1)
+
+def _week_indices(values: np.ndarray) -> np.ndarray:
+    year, week = values // 100, values % 100
+    covered = (year >= _FIRST_YEAR) & (year <= _LAST_YEAR) & (week >= 1) & (week <= 53)
+    slots = np.where(covered, (year - _FIRST_YEAR) * 53 + week - 1, 0)
+    return np.where(covered, _WEEK_INDEX_ARRAY[slots], -1)
+
+def _shift_indices(values: np.ndarray, indices: np.ndarray, shift: int, calendar: np.ndarray, fallback: Callable[[int, int], int]) -> np.ndarray:
+    shifted = indices + shift
+    covered = (indices >= 0) & (shifted >= 0) & (shifted < len(calendar))
+    result = np.where(covered, calendar[np.where(covered, shifted, 0)], 0)
+    for i in np.flatnonzero(~covered).tolist():
+        result[i] = fallback(int(values[i]), shift)
+    return result
+
 def time_value_to_day(value: int) -> date:
+    index = _day_index(value)
+    if index >= 0:
+        return _DAYS[index]
     year, month, day = value // 10000, (value % 10000) // 100, value % 100
     if year < date.min.year:
         return date.min
@@ -25,6 +102,9 @@ def time_value_to_day(value: int) -> date:
     return date(year=year, month=month, day=day)
 
 def time_value_to_week(value: int) -> Week:
+    index = _week_index(value)
+    if index >= 0:
+        return _WEEKS[index]
     year, week = value // 100, value % 100
     if year < date.min.year:
         return Week(date.min.year, 1)
@@ -41,17 +121,23 @@ def guess_time_value_is_week(value: int) -> bool:
     return len(str(value)) == 6
 
 def day_to_time_value(d: date) -> int:
-    return int(d.strftime("%Y%m%d"))
+    return d.year * 10000 + d.month * 100 + d.day
 
 def week_to_time_value(w: Week) -> int:
     return w.year * 100 + w.week
 
 def time_value_to_iso(value: int) -> str:
+    index = _day_index(value)
+    if index >= 0:
+        return _DAY_ISO[index]
     return time_value_to_day(value).strftime("%Y-%m-%d")
 
 def shift_day_value(time_value: int, days: int) -> int:
     if days == 0:
         return time_value
+    index = _day_index(time_value)
+    if index >= 0 and 0 <= index + days < len(_DAY_VALUES):
+        return _DAY_VALUES[index + days]
     d = time_value_to_day(time_value)
     shifted = d + timedelta(days=days)
     return day_to_time_value(shifted)
@@ -59,10 +145,42 @@ def shift_day_value(time_value: int, days: int) -> int:
 def shift_week_value(week_value: int, weeks: int) -> int:
     if weeks == 0:
         return week_value
+    index = _week_index(week_value)
+    if index >= 0 and 0 <= index + weeks < len(_WEEK_VALUES):
+        return _WEEK_VALUES[index + weeks]
     week = time_value_to_week(week_value)
     shifted = week + weeks
     return week_to_time_value(shifted)
 
+def shift_day_values(time_values: Sequence[int], days: int) -> np.ndarray:
+    """
+    `shift_day_value` of each of the time values
+    """
+    values = np.asarray(time_values, dtype=np.int64)
+    if days == 0:
+        return values.copy()
+    return _shift_indices(values, _day_indices(values), days, _DAY_VALUES_ARRAY, shift_day_value)
+
+def shift_week_values(week_values: Sequence[int], weeks: int) -> np.ndarray:
+    """
+    `shift_week_value` of each of the week values
+    """
+    values = np.asarray(week_values, dtype=np.int64)
+    if weeks == 0:
+        return values.copy()
+    return _shift_indices(values, _week_indices(values), weeks, _WEEK_VALUES_ARRAY, shift_week_value)
+
+def time_values_to_iso(time_values: Sequence[int]) -> List[str]:
+    """
+    `time_value_to_iso` of each of the time values
+    """
+    values = np.asarray(time_values, dtype=np.int64)
+    indices = _day_indices(values)
+    iso = _DAY_ISO_ARRAY[np.maximum(indices, 0)]
+    for i in np.flatnonzero(indices < 0).tolist():
+        iso[i] = time_value_to_iso(int(values[i]))
+    return iso.tolist()
+
 def days_in_range(range: Tuple[int, int]) -> int:
     """
     returns the days within this time range
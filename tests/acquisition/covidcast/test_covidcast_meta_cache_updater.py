@@ -34,11 +34,12 @@ class UnitTests(unittest.TestCase):
       'epidata': [{'foo': 'bar'}],
     }
 
-    args = MagicMock(log_file="log")
+    args = MagicMock(log_file="log", incremental=False)
     mock_epidata_impl = MagicMock()
     mock_epidata_impl.covidcast_meta.return_value = api_response
     mock_database = MagicMock()
     mock_database.compute_covidcast_meta.return_value=api_response['epidata']
+    mock_database.read_meta_dirty.return_value = [(1, 'day', 'state', 3)]
     fake_database_impl = lambda: mock_database
 
     main(
@@ -52,6 +53,8 @@ class UnitTests(unittest.TestCase):
     actual_args = mock_database.update_covidcast_meta_cache.call_args[0]
     expected_args = (api_response['epidata'],)
     self.assertEqual(actual_args, expected_args)
+    # the groups marked before the full computation are up to date
+    self.assertEqual(mock_database.clear_meta_dirty.call_args[0], ([(1, 'day', 'state', 3)],))
 
     self.assertTrue(mock_database.disconnect.called)
     self.assertTrue(mock_database.disconnect.call_args[0][0])
@@ -64,7 +67,7 @@ class UnitTests(unittest.TestCase):
       'message': 'no',
     }
 
-    args = MagicMock(log_file="log")
+    args = MagicMock(log_file="log", incremental=False)
     mock_database = MagicMock()
     mock_database.compute_covidcast_meta.return_value = list()
     fake_database_impl = lambda: mock_database
@@ -72,3 +75,21 @@ class UnitTests(unittest.TestCase):
     main(args, epidata_impl=None, database_impl=fake_database_impl)
 
     self.assertTrue(mock_database.compute_covidcast_meta.called)
+
+  def test_main_incremental(self):
+    """Run the main program with the incremental computation."""
+
+    args = MagicMock(log_file="log", incremental=True)
+    mock_database = MagicMock()
+    mock_database.compute_covidcast_meta_incremental.return_value = [{'foo': 'bar'}]
+    mock_database.update_covidcast_meta_cache.side_effect = Exception('testing')
+    fake_database_impl = lambda: mock_database
+
+    with self.assertRaises(Exception):
+      main(args, epidata_impl=None, database_impl=fake_database_impl)
+
+    self.assertFalse(mock_database.compute_covidcast_meta.called)
+    self.assertFalse(mock_database.clear_meta_dirty.called)
+    self.assertEqual(mock_database.update_covidcast_meta_cache.call_args[0], ([{'foo': 'bar'}],))
+    # the recomputed partitions are not committed without the cache
+    self.assertFalse(mock_database.disconnect.call_args[0][0])
@@ -339,4 +339,64 @@ class UnitTests(unittest.TestCase):
     self.assertEqual(rows[4].sample_size, None)
     self.assertEqual(rows[4].missing_value, Nans.NOT_MISSING)
     self.assertEqual(rows[4].missing_stderr, Nans.NOT_MISSING)
-    self.assertEqual(rows[4].missing_sample_size, Nans.OTHER)
\ No newline at end of file
+    self.assertEqual(rows[4].missing_sample_size, Nans.OTHER)
+
+  @patch("pandas.read_csv")
+  def test_load_valid_csv(self, mock_read_csv):
+    """Stream the rows of a CSV file only if all of them are valid."""
+
+    filepath = 'path/name.csv'
+    details = PathDetails(20200101, 0, "src", "name", "day", 20200101, "state")
+    data = {
+      'geo_id': ['ca', 'tx'],
+      'val': ['1.1', '1.2'],
+      'se': ['2.1', '2.2'],
+      'sample_size': ['301', '302'],
+    }
+
+    mock_read_csv.return_value = pd.DataFrame(data)
+    rows = CsvImporter.load_valid_csv(filepath, details)
+    self.assertNotIsInstance(rows, list)
+    self.assertEqual([(r.geo_value, r.value) for r in rows], [('ca', 1.1), ('tx', 1.2)])
+
+    with self.subTest("invalid row"):
+      mock_read_csv.return_value = pd.DataFrame({**data, 'geo_id': ['ca', '123']})
+      self.assertIsNone(CsvImporter.load_valid_csv(filepath, details))
+    with self.subTest("invalid header"):
+      mock_read_csv.return_value = pd.DataFrame({'foo': [1, 2]})
+      self.assertIsNone(CsvImporter.load_valid_csv(filepath, details))
+    with self.subTest("empty"):
+      mock_read_csv.return_value = pd.DataFrame({k: [] for k in data})
+      self.assertIsNone(CsvImporter.load_valid_csv(filepath, details))
+
+  def test_validate_table(self):
+    """Apply the sanity checks of `extract_and_check_row` to whole columns."""
+
+    table = pd.DataFrame({
+      'geo_id': ['ca', 'TX', 'iowa', None, 'fl', 'ak', 'wa', 'nv', 'or'],
+      'value': ['1.1', 'inf', '1.3', '1.4', 'value', None, '1.7', '1.8', '1.9'],
+      'stderr': ['2.1', '2.2', '2.3', '2.4', '2.5', 'na', '-1', '2.8', ''],
+      'sample_size': ['301', '302', '303', '304', '305', '306', '307', 'inf', '309'],
+      'missing_value': [Nans.NOT_MISSING, None, None, None, None, Nans.DELETED, None, None, Nans.DELETED],
+      'missing_stderr': [None] * 8 + [Nans.NOT_MISSING],
+    })
+    values, errors = CsvImporter.validate_table(table, 'state')
+
+    self.assertEqual(errors.tolist(), [None, 'value', 'geo_id', 'geo_id', 'value', None, 'stderr', 'sample_size', None])
+    self.assertEqual(values['geo_value'][[0, 5, 8]].tolist(), ['ca', 'ak', 'or'])
+    self.assertEqual(values['value'][0], 1.1)
+    self.assertTrue(np.isnan(values['value'][5]))
+    self.assertEqual(values['missing_value'][[0, 5, 8]].tolist(), [Nans.NOT_MISSING, Nans.DELETED, Nans.NOT_MISSING])
+    self.assertEqual(values['missing_stderr'][[0, 5, 8]].tolist(), [Nans.NOT_MISSING, Nans.OTHER, Nans.OTHER])
+    # no missingness column
+    self.assertEqual(values['missing_sample_size'][[0, 5, 8]].tolist(), [Nans.NOT_MISSING] * 3)
+
+    with self.subTest('integer geo ids'):
+      table = pd.DataFrame({'geo_id': ['1', '2.0', '2.5', '11', 'hhs1'], 'value': 1.0, 'stderr': 1.0, 'sample_size': 1.0})
+      values, errors = CsvImporter.validate_table(table, 'hhs')
+      self.assertEqual(errors.tolist(), [None, None, 'geo_id', 'geo_id', 'geo_id'])
+      self.assertEqual(values['geo_value'][:2].tolist(), ['1', '2'])
+
+    with self.subTest('invalid geo_type'):
+      _, errors = CsvImporter.validate_table(table, 'province')
+      self.assertEqual(errors.tolist(), ['geo_type'] * 5)
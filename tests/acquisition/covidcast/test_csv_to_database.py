@@ -7,7 +7,8 @@ import unittest
 from unittest.mock import MagicMock, patch
 
 from delphi.epidata.acquisition.covidcast.csv_importer import PathDetails
-from delphi.epidata.acquisition.covidcast.csv_to_database import get_argument_parser, main, collect_files, upload_archive, make_handlers
+from delphi.epidata.acquisition.covidcast.csv_to_database import get_argument_parser, main, collect_files, upload_archive, upload_archive_pipelined, make_handlers
+from delphi.epidata.acquisition.covidcast.database import DBLoadStateException
 
 # py3tester coverage target
 __test_target__ = 'delphi.epidata.acquisition.covidcast.csv_to_database'
@@ -60,27 +61,26 @@ class UnitTests(unittest.TestCase):
         sample_size=value,
       )
 
-    def load_csv_impl(path, details):
+    def load_valid_csv_impl(path, details):
       if path == 'path/a.csv':
         # no validation errors
-        yield make_row('a1', details)
-        yield make_row('a2', details)
-        yield make_row('a3', details)
+        return (make_row(v, details) for v in ('a1', 'a2', 'a3'))
       elif path == 'path/b.csv':
         # one validation error
-        yield make_row('b1', details)
-        yield None
-        yield make_row('b3', details)
+        return None
       else:
         # fail the test for any other path
         raise Exception('unexpected path')
 
-    def iter_len(l: Iterable) -> int:
-      return len(list(l))
+    # the rows are streamed, keep them as they are consumed
+    inserted = []
+    def insert_rows(rows: Iterable) -> int:
+      inserted.append(list(rows))
+      return len(inserted[-1])
 
     data_dir = 'data_dir'
-    mock_database.insert_or_update_bulk = MagicMock(wraps=iter_len)
-    mock_csv_importer.load_csv = load_csv_impl
+    mock_database.insert_or_update_bulk = MagicMock(wraps=insert_rows)
+    mock_csv_importer.load_valid_csv = load_valid_csv_impl
     mock_logger = MagicMock()
 
     modified_row_count = upload_archive(
@@ -93,10 +93,9 @@ class UnitTests(unittest.TestCase):
     self.assertEqual(modified_row_count, 3)
     # verify that appropriate rows were added to the database
     self.assertEqual(mock_database.insert_or_update_bulk.call_count, 1)
-    call_args_list = mock_database.insert_or_update_bulk.call_args_list
     actual_args = [[(a.source, a.signal, a.time_type, a.geo_type, a.time_value,
                      a.geo_value, a.value, a.stderr, a.sample_size, a.issue, a.lag)
-                    for a in call.args[0]] for call in call_args_list]
+                    for a in rows] for rows in inserted]
 
     expected_args = [
       [('src_a', 'sig_a', 'day', 'hrr', 20200419, 'a1', 'a1', 'a1', 'a1', 20200420, 1),
@@ -108,11 +107,12 @@ class UnitTests(unittest.TestCase):
     # verify that two files were successful (a, d) and two failed (b, c)
     self.assertEqual(mock_file_archiver.archive_file.call_count, 3)
     call_args_list = mock_file_archiver.archive_file.call_args_list
-    actual_args = [args for (args, kwargs) in call_args_list]
+    # the files are archived in the background, in any order
+    actual_args = sorted(args for (args, kwargs) in call_args_list)
     expected_args = [
-      ('path', 'data_dir/archive/successful/src_a', 'a.csv', True),
       ('path', 'data_dir/archive/failed/src_b', 'b.csv', False),
       ('path', 'data_dir/archive/failed/unknown', 'c.csv', False),
+      ('path', 'data_dir/archive/successful/src_a', 'a.csv', True),
     ]
     self.assertEqual(actual_args, expected_args)
 
@@ -196,9 +196,9 @@ class UnitTests(unittest.TestCase):
     mock_csv_importer.find_csv_files.return_value = [
       ('path/file.csv', PathDetails(20200424, 1, 'src', 'sig', 'day', 20200423, 'hrr')),
     ]
-    mock_csv_importer.load_csv.return_value = [
+    mock_csv_importer.load_valid_csv.return_value = iter([
       MagicMock(geo_value='geo', value=1, stderr=1, sample_size=1),
-    ]
+    ])
     mock_logger = MagicMock()
 
     upload_archive(
@@ -216,3 +216,101 @@ class UnitTests(unittest.TestCase):
     actual_args = mock_file_archiver.archive_file.call_args[0]
     expected_args = ('path', 'data_dir/archive/failed/src', 'file.csv', False)
     self.assertEqual(actual_args, expected_args)
+
+
+  @patch("delphi.epidata.acquisition.covidcast.csv_to_database.CsvImporter")
+  @patch("delphi.epidata.acquisition.covidcast.csv_to_database.FileArchiver")
+  def test_upload_archive_pipelined(self, mock_file_archiver: MagicMock, mock_csv_importer: MagicMock):
+    """Insert many files at once, and archive them."""
+
+    path_details = [
+      ('path/a.csv', PathDetails(20200420, 1, 'src', 'sig', 'day', 20200419, 'hrr')),
+      ('path/b.csv', PathDetails(20200420, 1, 'src', 'sig', 'day', 20200418, 'hrr')),
+      # another issue of a.csv
+      ('path/c.csv', PathDetails(20200421, 2, 'src', 'sig', 'day', 20200419, 'hrr')),
+      # a file with a data error
+      ('path/d.csv', PathDetails(20200421, 2, 'src', 'sig', 'day', 20200417, 'hrr')),
+      ('path/e.csv', None),
+    ]
+
+    def load_valid_csv_impl(path, details):
+      if path == 'path/d.csv':
+        return None
+      key = dict(source=details.source, signal=details.signal, time_type=details.time_type, geo_type=details.geo_type, time_value=details.time_value)
+      return iter([MagicMock(path=path, **key), MagicMock(path=path, **key)])
+
+    def archived():
+      return [(args[2], args[1].split('/')[2]) for args, _ in mock_file_archiver.archive_file.call_args_list]
+
+    mock_csv_importer.load_valid_csv = load_valid_csv_impl
+    handlers = make_handlers('data_dir', False)
+
+    def make_database(stage_rows=lambda rows: len(list(rows))):
+      mock_database = MagicMock()
+      # the rows staged since the last commit, by file
+      mock_database.staged = []
+      mock_database.committed = []
+      def stage(rows):
+        rows = list(rows)
+        mock_database.staged.append(rows[0].path)
+        return stage_rows(rows)
+      def commit():
+        mock_database.committed.append(mock_database.staged)
+        mock_database.staged = []
+      mock_database.stage_rows = MagicMock(side_effect=stage)
+      mock_database.commit = MagicMock(side_effect=commit)
+      return mock_database
+
+    with self.subTest("batches"):
+      mock_database = make_database()
+      modified_row_count = upload_archive_pipelined(path_details, mock_database, handlers, MagicMock(), workers=0, archive_threads=1)
+      self.assertEqual(modified_row_count, 6)
+      # c.csv is not inserted together with the other issue of the same day
+      self.assertEqual(mock_database.committed, [['path/a.csv', 'path/b.csv'], ['path/c.csv']])
+      self.assertEqual(mock_database.run_dbjobs.call_count, 2)
+      self.assertEqual(sorted(archived()), [('a.csv', 'successful'), ('b.csv', 'successful'), ('c.csv', 'successful'), ('d.csv', 'failed'), ('e.csv', 'failed')])
+
+    with self.subTest("batch rows"):
+      mock_file_archiver.reset_mock()
+      mock_database = make_database()
+      upload_archive_pipelined(path_details, mock_database, handlers, MagicMock(), workers=0, batch_rows=2, archive_threads=1)
+      self.assertEqual(mock_database.committed, [['path/a.csv'], ['path/b.csv'], ['path/c.csv']])
+
+    with self.subTest("failed file"):
+      mock_file_archiver.reset_mock()
+      def stage_rows(rows):
+        if rows[0].path == 'path/b.csv':
+          raise Exception('testing')
+        return len(rows)
+      mock_database = make_database(stage_rows)
+      mock_database.rollback_to_savepoint.side_effect = lambda name: mock_database.staged.pop()
+      modified_row_count = upload_archive_pipelined(path_details, mock_database, handlers, MagicMock(), workers=0, archive_threads=1)
+      self.assertEqual(modified_row_count, 4)
+      self.assertEqual(mock_database.committed, [['path/a.csv'], ['path/c.csv']])
+      self.assertEqual(sorted(archived()), [('a.csv', 'successful'), ('b.csv', 'failed'), ('c.csv', 'successful'), ('d.csv', 'failed'), ('e.csv', 'failed')])
+
+    with self.subTest("failed batch"):
+      mock_file_archiver.reset_mock()
+      mock_database = make_database()
+      def run_dbjobs():
+        if 'path/b.csv' in mock_database.staged:
+          raise Exception('testing')
+      def rollback():
+        mock_database.staged = []
+      mock_database.run_dbjobs.side_effect = run_dbjobs
+      mock_database.rollback.side_effect = rollback
+      modified_row_count = upload_archive_pipelined(path_details, mock_database, handlers, MagicMock(), workers=0, archive_threads=1)
+      # the files of the failed batch are dispatched again one at a time
+      self.assertEqual(modified_row_count, 4)
+      self.assertEqual(mock_database.rollback.call_count, 2)
+      self.assertEqual(mock_database.committed, [['path/a.csv'], ['path/c.csv']])
+      self.assertEqual(sorted(archived()), [('a.csv', 'successful'), ('b.csv', 'failed'), ('c.csv', 'successful'), ('d.csv', 'failed'), ('e.csv', 'failed')])
+
+    with self.subTest("bad load state"):
+      mock_file_archiver.reset_mock()
+      mock_database = make_database()
+      mock_database._check_load_table_empty.side_effect = DBLoadStateException('testing')
+      with self.assertRaises(DBLoadStateException):
+        upload_archive_pipelined(path_details, mock_database, handlers, MagicMock(), workers=0, archive_threads=1)
+      self.assertFalse(mock_database.stage_rows.called)
+      self.assertFalse(any(folder == 'successful' for _, folder in archived()))
@@ -4,7 +4,8 @@
 import unittest
 from unittest.mock import MagicMock
 
-from delphi.epidata.acquisition.covidcast.database import Database
+from delphi.epidata.acquisition.covidcast.database import Database, DimensionKeyCache, LoadSession
+from delphi.epidata.common.covidcast_row import CovidcastRow
 
 # py3tester coverage target
 __test_target__ = 'delphi.epidata.acquisition.covidcast.database'
@@ -117,3 +118,337 @@ class UnitTests(unittest.TestCase):
     cc_rows = [MagicMock(geo_id='CA', val=1, se=0, sample_size=0)]
     result = database.insert_or_update_batch(cc_rows)
     self.assertIsNone(result)
+
+  def test_insert_or_update_batch_generator(self):
+    """Test that rows are consumed from any iterable in batches"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.count_all_load_rows = lambda:0 # simulate an empty load table
+    database.connect(connector_impl=mock_connector)
+    connection = mock_connector.connect()
+    cursor = connection.cursor()
+    database.run_dbjobs = MagicMock()
+
+    consumed = []
+    def make_rows(n):
+      for i in range(n):
+        consumed.append(i)
+        yield CovidcastRow('src', 'sig', 'day', 'state', 20200101, f'{i}', i, 0, 0, 0, 0, 0, 20200102, 1)
+
+    batch_sizes = []
+    def executemany(sql, args):
+      # no more than one batch is read ahead
+      self.assertEqual(len(consumed), sum(batch_sizes) + len(args))
+      batch_sizes.append(len(args))
+      cursor.rowcount = len(args)
+    cursor.executemany.side_effect = executemany
+
+    result = database.insert_or_update_batch(make_rows(5), batch_size=2)
+    self.assertEqual(result, 5)
+    self.assertEqual(batch_sizes, [2, 2, 1])
+    self.assertEqual(database.run_dbjobs.call_count, 3)
+
+    with self.subTest("empty"):
+      database.run_dbjobs.reset_mock()
+      self.assertEqual(database.insert_or_update_batch(iter([]), batch_size=2), 0)
+      self.assertFalse(database.run_dbjobs.called)
+
+    with self.subTest("unknown row count of a batch"):
+      def unknown_first(sql, args):
+        cursor.rowcount = -1 if not batch_sizes else len(args)
+        batch_sizes.append(len(args))
+      batch_sizes.clear()
+      cursor.executemany.side_effect = unknown_first
+      self.assertIsNone(database.insert_or_update_batch(make_rows(3), batch_size=2))
+
+  def test_insert_or_update_batch_load_data_infile(self):
+    """Test that rows are loaded from a TSV file if enabled, falling back to INSERT"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.count_all_load_rows = lambda:0 # simulate an empty load table
+    database.connect(connector_impl=mock_connector, load_data_infile=True)
+    self.assertTrue(mock_connector.connect.call_args.kwargs['allow_local_infile'])
+    connection = mock_connector.connect()
+    cursor = connection.cursor()
+    cursor.rowcount = 2
+
+    loaded = []
+    def execute(sql, args=None):
+      if 'LOAD DATA LOCAL INFILE' in sql:
+        with open(args[0], encoding='utf-8') as f:
+          loaded.append(f.read())
+    cursor.execute.side_effect = execute
+
+    cc_rows = [
+      CovidcastRow('src', 'sig', 'day', 'state', 20200101, 'ca', 1.5, None, 10.0, 0, 5, 0, 20200102, 1),
+      CovidcastRow('src', 'sig\\\t', 'day', 'state', 20200101, 'tx', 0.1, 0.2, None, 0, 0, 5, 20200102, 1),
+    ]
+    result = database.insert_or_update_batch(cc_rows)
+    self.assertEqual(result, 2)
+    self.assertFalse(cursor.executemany.called)
+    self.assertEqual(loaded, [
+      'src\tsig\tday\tstate\t20200101\tca\t1.5\t\\N\t10.0\t20200102\t1\t0\t5\t0\t\\N\t\\N\n'
+      'src\tsig\\\\\\t\tday\tstate\t20200101\ttx\t0.1\t0.2\t\\N\t20200102\t1\t0\t0\t5\t\\N\t\\N\n'
+    ])
+
+    # the server does not allow it
+    def refuse(sql, args=None):
+      if 'LOAD DATA LOCAL INFILE' in sql:
+        refused = Exception('Loading local data is disabled')
+        refused.errno = 3948
+        raise refused
+    cursor.execute.side_effect = refuse
+    result = database.insert_or_update_batch(cc_rows)
+    self.assertEqual(result, 2)
+    self.assertEqual(cursor.executemany.call_count, 1)
+    self.assertEqual(cursor.executemany.call_args[0][1][0][:6], ('src', 'sig', 'day', 'state', 20200101, 'ca'))
+
+  def test_load_session(self):
+    """Test that the rows of many files are dispatched at once, rolling back failed files alone"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.count_all_load_rows = lambda:0 # simulate an empty load table
+    database.connect(connector_impl=mock_connector)
+    connection = mock_connector.connect()
+    cursor = connection.cursor()
+    cursor.rowcount = 1
+    database.run_dbjobs = MagicMock()
+
+    def executemany(sql, args):
+      if args[0][5] == 'bad':
+        raise Exception('testing')
+    cursor.executemany.side_effect = executemany
+
+    def make_rows(time_value, *geo_values):
+      return (CovidcastRow('src', 'sig', 'day', 'state', time_value, g, 1, 0, 0, 0, 0, 0, 20200102, 1) for g in geo_values)
+
+    committed, rolled_back = [], []
+    with LoadSession(database, committed.append, lambda tags, e: rolled_back.append(tags), max_rows=3) as session:
+      self.assertTrue(session.stage('a', make_rows(20200101, 'ca')))
+      self.assertFalse(session.stage('b', make_rows(20200102, 'bad')))
+      self.assertEqual(cursor.execute.call_args[0][0], 'ROLLBACK TO SAVEPOINT `load_session_file`')
+      self.assertTrue(session.stage('c', make_rows(20200103, 'ca')))
+      self.assertFalse(database.run_dbjobs.called)
+      # another file of the same day as `a` is dispatched separately
+      self.assertTrue(session.stage('d', make_rows(20200101, 'ca')))
+      self.assertEqual(committed, [['a', 'c']])
+      # reaching max_rows
+      self.assertTrue(session.stage('e', make_rows(20200104, 'ca', 'tx')))
+      self.assertEqual(committed, [['a', 'c'], ['d', 'e']])
+      self.assertTrue(session.stage('f', make_rows(20200105, 'ca')))
+    self.assertEqual(committed, [['a', 'c'], ['d', 'e'], ['f']])
+    self.assertEqual(database.run_dbjobs.call_count, 3)
+    self.assertEqual(session.modified_row_count, 5)
+    self.assertEqual(rolled_back, [])
+
+    with self.subTest("max_seconds"):
+      committed.clear()
+      with LoadSession(database, committed.append, None, max_seconds=0) as session:
+        session.stage('a', make_rows(20200101, 'ca'))
+        session.stage('b', make_rows(20200102, 'ca'))
+      self.assertEqual(committed, [['a'], ['b']])
+
+    with self.subTest("failed dispatch"):
+      committed.clear()
+      database.run_dbjobs.side_effect = Exception('testing')
+      with LoadSession(database, committed.append, lambda tags, e: rolled_back.append(tags)) as session:
+        session.stage('a', make_rows(20200101, 'ca'))
+      self.assertEqual(committed, [])
+      self.assertEqual(rolled_back, [['a']])
+
+    with self.subTest("failed dispatch of a batch"):
+      committed.clear()
+      rolled_back.clear()
+      def run_dbjobs():
+        # fails if the last staged file is from `ny`
+        if cursor.executemany.call_args[0][1][0][5] == 'ny':
+          raise Exception('testing')
+      database.run_dbjobs.side_effect = run_dbjobs
+      with LoadSession(database, committed.append, lambda tags, e: rolled_back.append(tags)) as session:
+        session.stage('a', make_rows(20200101, 'ca'))
+        session.stage('c', make_rows(20200103, 'tx'))
+        session.stage('b', make_rows(20200102, 'ny'))
+      # the files are dispatched again one at a time
+      self.assertEqual(committed, [['a'], ['c']])
+      self.assertEqual(rolled_back, [['b']])
+      self.assertEqual(session.modified_row_count, 2)
+
+  def test_dimension_key_cache(self):
+    """Test that dimension keys are resolved from memory, and added to the dimension tables as needed"""
+
+    class FakeCursor:
+      """dimension tables in memory, with a case insensitive collation"""
+      def __init__(self):
+        self.dims = {'signal_dim': {('src', 'a'): 1}, 'geo_dim': {('state', 'ca'): 1}}
+        self.queries = []
+        self.result = []
+      def execute(self, sql, args=None):
+        self.queries.append(sql)
+        table = 'signal_dim' if 'signal_dim' in sql else 'geo_dim'
+        if args is None:
+          self.result = [(*key, i) for key, i in self.dims[table].items()]
+        else:
+          wanted = {(x.lower(), y.lower()) for x, y in zip(args[::2], args[1::2])}
+          self.result = [(*key, i) for key, i in self.dims[table].items() if (key[0].lower(), key[1].lower()) in wanted]
+      def executemany(self, sql, keys):
+        table = 'signal_dim' if 'signal_dim' in sql else 'geo_dim'
+        existing = {(x.lower(), y.lower()) for x, y in self.dims[table]}
+        for x, y in keys:
+          if (x.lower(), y.lower()) not in existing:
+            self.dims[table][(x, y)] = len(self.dims[table]) + 1
+      def __iter__(self):
+        return iter(self.result)
+
+    def row(signal, geo_value):
+      return CovidcastRow('src', signal, 'day', 'state', 20200101, geo_value, 1, 0, 0, 0, 0, 0, 20200102, 1)
+
+    cursor = FakeCursor()
+    cache = DimensionKeyCache()
+    self.assertEqual(cache.resolve(cursor, [row('a', 'ca'), row('a', 'ca')]), [(1, 1), (1, 1)])
+    self.assertEqual(len(cursor.queries), 2)
+    # warmed once
+    cursor.queries.clear()
+    self.assertEqual(cache.resolve(cursor, [row('a', 'ca')]), [(1, 1)])
+    self.assertEqual(cursor.queries, [])
+
+    mark = cache.mark()
+    self.assertEqual(cache.resolve(cursor, [row('b', 'ca'), row('a', 'tx')]), [(2, 1), (1, 2)])
+    self.assertEqual(cursor.dims['signal_dim'][('src', 'b')], 2)
+    # equal only through the collation, left to `run_dbjobs`
+    self.assertEqual(cache.resolve(cursor, [row('a', 'CA')]), [(1, None)])
+
+    # the added keys are forgotten if they are rolled back
+    cache.rollback(mark)
+    cursor.dims['signal_dim'].pop(('src', 'b'))
+    cursor.dims['geo_dim'].pop(('state', 'tx'))
+    self.assertEqual(cache.resolve(cursor, [row('c', 'ca'), row('a', 'tx')]), [(2, 1), (1, 2)])
+    cache.commit()
+    cache.rollback()
+    self.assertEqual(cache.resolve(cursor, [row('c', 'ca')]), [(2, 1)])
+
+  def test_run_dbjobs_key_cache(self):
+    """Test that the fact tables are loaded without joining the dimension tables with the key cache"""
+    for key_cache in (False, True):
+      mock_connector = MagicMock()
+      database = Database()
+      database.connect(connector_impl=mock_connector, key_cache=key_cache)
+      cursor = mock_connector.connect().cursor()
+      database.run_dbjobs()
+      queries = [call.args[0] for call in cursor.execute.call_args_list]
+      facts = [q for q in queries if 'INSERT INTO epimetric_full' in q or 'INSERT INTO epimetric_latest' in q]
+      self.assertEqual(len(facts), 2)
+      self.assertEqual(any('JOIN signal_dim' in q for q in facts), not key_cache)
+      self.assertEqual(any('INSERT INTO signal_dim' in q for q in queries), not key_cache)
+
+  def test_run_dbjobs_summary(self):
+    """Test that the summary partitions of the new latest rows are aggregated again"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.connect(connector_impl=mock_connector)
+    cursor = mock_connector.connect().cursor()
+    database.run_dbjobs()
+    queries = [call.args[0] for call in cursor.execute.call_args_list]
+    index = lambda text: next(i for i, q in enumerate(queries) if text in q)
+    summary = index('REPLACE INTO epimetric_summary')
+    self.assertIn('is_latest_issue = 1', queries[summary])
+    self.assertIn('megacounty_count', queries[summary])
+    self.assertLess(index('INSERT INTO epimetric_latest'), summary)
+    self.assertLess(summary, index('DELETE FROM `epimetric_load`'))
+
+  def test_delete_batch_in_chunks(self):
+    """Test that deletions are loaded from a TSV file and removed in chunks of signals"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.connect(connector_impl=mock_connector, load_data_infile=True)
+    cursor = mock_connector.connect().cursor()
+    cursor.rowcount = 2
+
+    loaded = []
+    def execute(sql, args=None):
+      if 'LOAD DATA LOCAL INFILE' in sql:
+        with open(args[0], encoding='utf-8') as f:
+          loaded.append(f.read())
+    cursor.execute.side_effect = execute
+    # (signal_key_id, number of deletions)
+    cursor.fetchall.return_value = [(1, 3), (2, 2), (5, 4), (7, 1)]
+
+    deletions = [
+      ('ca', '', '', '', '20200102', '20200101', 'state', 'sig', 'src', 'day'),
+      ('tx', 1.5, None, None, 20200102, 20200101, 'state', 'sig', 'src', 'day'),
+    ]
+    self.assertEqual(database.delete_batch(deletions, chunk_rows=5), 4)
+    # only the key fields are loaded
+    self.assertEqual(loaded, [
+      'ca\t20200102\t20200101\tstate\tsig\tsrc\tday\n'
+      'tx\t20200102\t20200101\tstate\tsig\tsrc\tday\n'
+    ])
+    self.assertFalse(cursor.executemany.called)
+
+    queries = [(call.args[0], call.args[1] if len(call.args) > 1 else None) for call in cursor.execute.call_args_list]
+    deletes = [args for sql, args in queries if 'DELETE h FROM' in sql]
+    self.assertEqual(deletes, [(1, 2), (5, 7)])
+    self.assertTrue(mock_connector.connect().commit.called)
+    self.assertIn('DROP TABLE', queries[-1][0])
+
+    with self.subTest("unknown row count"):
+      cursor.rowcount = -1
+      self.assertIsNone(database.delete_batch(deletions, chunk_rows=5))
+
+    with self.subTest("commit chunks"):
+      commit = mock_connector.connect().commit
+      commit.reset_mock()
+      database.delete_batch(deletions, chunk_rows=5)
+      self.assertEqual(commit.call_count, 1)
+      commit.reset_mock()
+      database.delete_batch(deletions, chunk_rows=5, commit_chunks=True)
+      self.assertEqual(commit.call_count, 3)
+
+  def test_merge_meta_partials(self):
+    """Test that merged aggregates give the mean and population standard deviation"""
+    values = [1.5, 2.0, 4.0, 8.5]
+    partitions = [values[:1], values[1:]]
+    merged = Database.merge_meta_partials(
+      'src', 'sig', 'day', 'state', 20200101, 20200102, 2,
+      sum(len(p) for p in partitions), sum(sum(p) for p in partitions), sum(v * v for p in partitions for v in p),
+      min(values), max(values), 123, 20200103, 0, 1)
+    self.assertEqual(merged['mean_value'], 4.0)
+    self.assertEqual(merged['stdev_value'], 2.7613403)
+    self.assertEqual((merged['min_value'], merged['max_value'], merged['num_locations']), (1.5, 8.5, 2))
+
+    # only missing values
+    merged = Database.merge_meta_partials('src', 'sig', 'day', 'state', 20200101, 20200102, 2, 0, None, None, None, None, 123, 20200103, 0, 1)
+    self.assertIsNone(merged['mean_value'])
+    self.assertIsNone(merged['stdev_value'])
+
+  def test_compute_covidcast_meta_incremental(self):
+    """Test that only the dirty groups are merged again from the summary"""
+    mock_connector = MagicMock()
+    database = Database()
+    database.connect(connector_impl=mock_connector)
+    cursor = mock_connector.connect().cursor()
+
+    def entry(signal, geo_type, mean_value):
+      return {'data_source': 'src', 'signal': signal, 'time_type': 'day', 'geo_type': geo_type, 'mean_value': mean_value}
+    previous_meta = [entry('a', 'state', 1.0), entry('a', 'county', 2.0), entry('b', 'state', 3.0)]
+
+    dirty = [(1, 'day', 'state', 3), (2, 'day', 'state', 1)]
+    cursor.fetchall.return_value = dirty
+    cursor.fetchone.side_effect = [
+      ('src', 'a'), (20200101, 20200102, 2, 10.0, 52.0, 4.0, 6.0, 123, 20200103, 0, 1), (4,),
+      # all of the rows of `b` were deleted
+      ('src', 'b'), (None, None, None, None, None, None, None, None, None, None, None),
+    ]
+
+    meta = database.compute_covidcast_meta_incremental(previous_meta)
+    self.assertEqual([(m['signal'], m['geo_type'], m['mean_value']) for m in meta], [('a', 'county', 2.0), ('a', 'state', 5.0)])
+    self.assertEqual(meta[1]['num_locations'], 4)
+    self.assertEqual(meta[1]['stdev_value'], 1.0)
+
+    # the groups are merged from the summary rather than from the rows
+    queries = [(call.args[0], call.args[1] if len(call.args) > 1 else None) for call in cursor.execute.call_args_list]
+    merges = [args for sql, args in queries if 'FROM `epimetric_summary`' in sql]
+    self.assertEqual(merges, [(1, 'day', 'state'), (2, 'day', 'state')])
+    # and are no longer dirty, unless they changed again
+    self.assertEqual(cursor.executemany.call_args[0][1], dirty)
+    self.assertIn('`version` = %s', cursor.executemany.call_args[0][0])
+    self.assertFalse(mock_connector.connect().commit.called)
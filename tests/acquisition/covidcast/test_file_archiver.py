@@ -3,9 +3,9 @@
 # standard library
 import os
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-from delphi.epidata.acquisition.covidcast.file_archiver import FileArchiver
+from delphi.epidata.acquisition.covidcast.file_archiver import BackgroundArchiver, FileArchiver
 
 # py3tester coverage target
 __test_target__ = 'delphi.epidata.acquisition.covidcast.file_archiver'
@@ -117,3 +117,60 @@ class UnitTests(unittest.TestCase):
     path = 'some/dst/path/data.csv'
     self.assertEqual(mock_os.path.exists.call_args[0][0], path)
     self.assertEqual(result[0], path)
+
+  def test_archive_file_with_codec(self):
+    """Archive a file with a given compression codec and level."""
+
+    mock_os = MagicMock()
+    # use the real `os.path.join`
+    mock_os.path.join = os.path.join
+    mock_os.path.exists.return_value = False
+    mock_gzip = MagicMock()
+    mock_open_impl = MagicMock()
+
+    with self.subTest("gzip"):
+      result = FileArchiver.archive_file(
+          'src', 'dst', 'data.csv', True, gzip=mock_gzip, os=mock_os, shutil=MagicMock(), open_impl=mock_open_impl, level=1)
+      self.assertEqual(result[0], 'dst/data.csv.gz')
+      self.assertEqual(mock_gzip.open.call_args[1]['compresslevel'], 1)
+
+    with self.subTest("zstd"):
+      with patch('delphi.epidata.acquisition.covidcast.file_archiver.zstandard') as mock_zstandard:
+        result = FileArchiver.archive_file(
+            'src', 'dst', 'data.csv', True, os=mock_os, open_impl=mock_open_impl, codec='zstd')
+      self.assertEqual(result[0], 'dst/data.csv.zst')
+      self.assertEqual(mock_open_impl.call_args[0], ('dst/data.csv.zst', 'wb'))
+      self.assertEqual(mock_zstandard.ZstdCompressor.call_args[1]['level'], 3)
+      self.assertTrue(mock_zstandard.ZstdCompressor.return_value.copy_stream.called)
+      self.assertEqual(mock_os.remove.call_args[0][0], 'src/data.csv')
+
+    with self.subTest("unknown codec"):
+      with self.assertRaises(ValueError):
+        FileArchiver.archive_file('src', 'dst', 'data.csv', True, os=mock_os, codec='lzma')
+
+  def test_background_archiver(self):
+    """Run archiving handlers in the background, reporting their errors once done."""
+
+    for threads in (0, 2):
+      with self.subTest(threads=threads):
+        archived = []
+        with BackgroundArchiver(threads) as archiver:
+          for filename in ('a.csv', 'b.csv', 'c.csv'):
+            archiver.submit(archived.append, filename)
+        self.assertEqual(sorted(archived), ['a.csv', 'b.csv', 'c.csv'])
+
+    archiver = BackgroundArchiver(2)
+    archiver.submit(MagicMock(side_effect=Exception('testing')))
+    archiver.submit(archived.append, 'd.csv')
+    with self.assertRaises(Exception):
+      archiver.close()
+    # the other handlers are done anyway
+    self.assertIn('d.csv', archived)
+
+    # the error of the block is not hidden by those of the handlers
+    with self.assertRaisesRegex(ValueError, 'block'):
+      with BackgroundArchiver(2) as archiver:
+        archiver.submit(MagicMock(side_effect=Exception('testing')))
+        archiver.submit(archived.append, 'e.csv')
+        raise ValueError('block')
+    self.assertIn('e.csv', archived)
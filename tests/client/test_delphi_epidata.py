@@ -2,6 +2,9 @@
 
 # standard library
 import unittest
+from unittest.mock import patch
+
+from delphi.epidata.client.delphi_epidata import Epidata
 
 # py3tester coverage target
 __test_target__ = 'delphi.epidata.client.delphi_epidata'
@@ -14,3 +17,25 @@ class UnitTests(unittest.TestCase):
   # the target file can't be loaded. In effect, it's a syntax checker.
   def test_syntax(self):
     pass
+
+  @patch.object(Epidata, 'covidcast')
+  def test_covidcast_paged(self, covidcast):
+    pages = {
+      (20200101, None): {'result': 2, 'message': 'too many results, data truncated', 'epidata': [1, 2], 'cursor': 'c1'},
+      (20200101, 'c1'): {'result': 2, 'message': 'too many results, data truncated', 'epidata': [3, 4], 'cursor': 'c2'},
+      (20200101, 'c2'): {'result': 1, 'message': 'success', 'epidata': [5]},
+      (20200102, None): {'result': -2, 'message': 'no results'},
+      (20200103, None): {'result': 1, 'message': 'success', 'epidata': [6]},
+    }
+    covidcast.side_effect = lambda *args, **kwargs: pages[(args[4][0], kwargs.get('cursor'))]
+
+    with self.subTest(name='follows cursors'):
+      response = Epidata.covidcast_paged('src', 'sig', 'day', 'county', [20200101, 20200102, 20200103], '*', max_workers=2)
+      self.assertEqual(response, {'result': 1, 'message': 'success', 'epidata': [1, 2, 3, 4, 5, 6]})
+    with self.subTest(name='no results'):
+      response = Epidata.covidcast_paged('src', 'sig', 'day', 'county', 20200102, '*')
+      self.assertEqual(response, {'result': -2, 'message': 'no results', 'epidata': []})
+    with self.subTest(name='error'):
+      pages[(20200103, None)] = {'result': -1, 'message': 'error'}
+      response = Epidata.covidcast_paged('src', 'sig', 'day', 'county', [20200101, 20200103], '*')
+      self.assertEqual(response, {'result': -1, 'message': 'error'})
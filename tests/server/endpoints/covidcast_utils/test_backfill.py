@@ -0,0 +1,46 @@
+import unittest
+
+from delphi.epidata.server.endpoints.covidcast_utils.backfill import compute_backfill
+
+
+class UnitTests(unittest.TestCase):
+    rows = [
+        ("so", "si", "state", "ca", 1, 1, 10.0, 100.0),
+        ("so", "si", "state", "ca", 1, 2, 15.0, None),
+        ("so", "si", "state", "ca", 1, 4, 20.0, 200.0),
+        ("so", "si", "state", "ny", 1, 2, None, None),
+        ("so", "si", "state", "ny", 1, 3, 8.0, None),
+        ("so", "si", "state", "ny", 2, 3, 0.0, 10.0),
+        ("so", "si", "state", "ny", 2, 4, 0.0, 10.0),
+    ]
+
+    def test_compute_backfill(self):
+        # anchored at the last issue up to time_value + 2
+        expected = [
+            dict(time_value=1, issue=1, value=10.0, sample_size=100.0, is_anchor=False, value_completeness=10.0 / 15.0, sample_size_completeness=1),
+            dict(time_value=1, issue=2, value=15.0, sample_size=None, value_rel_change=0.5, is_anchor=True, value_completeness=1.0),
+            dict(time_value=1, issue=4, value=20.0, sample_size=200.0, value_rel_change=20.0 / 15.0 - 1, sample_size_rel_change=1, is_anchor=False, value_completeness=20.0 / 15.0, sample_size_completeness=1),
+            dict(time_value=1, issue=2, value=None, sample_size=None, is_anchor=False, value_completeness=0.0),
+            dict(time_value=1, issue=3, value=8.0, sample_size=None, value_rel_change=1, is_anchor=True, value_completeness=1.0),
+            dict(time_value=2, issue=3, value=0.0, sample_size=10.0, is_anchor=False, value_completeness=1, sample_size_completeness=1.0),
+            dict(time_value=2, issue=4, value=0.0, sample_size=10.0, value_rel_change=0, sample_size_rel_change=0, is_anchor=True, value_completeness=1, sample_size_completeness=1.0),
+        ]
+        for batch_size in (1, 2, 100):
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(list(compute_backfill(self.rows, lambda t: t + 2, batch_size=batch_size)), expected)
+
+    def test_compute_backfill_without_anchor(self):
+        rows = list(compute_backfill(self.rows, lambda t: t - 1))
+        self.assertFalse(any("is_anchor" in r or "value_completeness" in r for r in rows))
+        # the anchor of the first time value has no value
+        rows = list(compute_backfill(self.rows[3:], lambda t: t + 1))
+        self.assertNotIn("is_anchor", rows[0])
+        self.assertIn("is_anchor", rows[2])
+
+    def test_compute_backfill_with_keys(self):
+        rows = list(compute_backfill(self.rows, lambda t: t + 2, with_keys=True))
+        self.assertEqual([(r["geo_value"], r["time_value"], r["issue"]) for r in rows], [(r[3], r[4], r[5]) for r in self.rows])
+        self.assertEqual(list(rows[0])[:6], ["source", "signal", "geo_type", "geo_value", "time_value", "issue"])
+
+    def test_compute_backfill_empty(self):
+        self.assertEqual(list(compute_backfill([], lambda t: t + 2)), [])
@@ -0,0 +1,81 @@
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from delphi.epidata.server.endpoints.covidcast_utils.meta_cache import CovidcastMetaCache, CovidcastMetaSnapshot
+
+# py3tester coverage target
+__test_target__ = "delphi.epidata.server.endpoints.covidcast_utils.meta_cache"
+
+
+def _meta_row(source: str, signal: str, time_type: str = "day", geo_type: str = "county"):
+    return dict(data_source=source, signal=signal, time_type=time_type, geo_type=geo_type, min_time=20200101, max_time=20200102, max_issue=20200103)
+
+
+class _FakeDB:
+    """answers the version and content queries of the cache from an in-memory covidcast_meta_cache row"""
+
+    def __init__(self, timestamp: int, epidata: list):
+        self.set(timestamp, epidata)
+        self.queries = []
+
+    def set(self, timestamp: int, epidata: list):
+        self.row = dict(timestamp=timestamp, epidata=json.dumps(epidata))
+        self.row["length"] = len(self.row["epidata"])
+        # the database clock, an hour ahead of the worker's
+        self.row["now"] = time.time() + 3600
+
+    def execute(self, query):
+        self.queries.append(str(query))
+        result = MagicMock()
+        result.fetchone.return_value = self.row
+        return result
+
+
+class UnitTests(unittest.TestCase):
+    def test_snapshot_index(self):
+        rows = [_meta_row("src", "sig"), _meta_row("src", "sig", geo_type="state"), _meta_row("src", "sig2")]
+        snapshot = CovidcastMetaSnapshot.from_epidata(1, (1, 1), rows)
+        self.assertIs(snapshot.get("src", "sig", "day", "state"), rows[1])
+        self.assertIsNone(snapshot.get("src", "sig", "week", "state"))
+        self.assertEqual(snapshot.by_signal[("src", "sig")], rows[:2])
+        self.assertEqual(snapshot.by_signal[("src", "sig2")], rows[2:])
+
+    def test_revalidate(self):
+        fake_db = _FakeDB(10, [_meta_row("src", "sig")])
+        with patch("delphi.epidata.server.endpoints.covidcast_utils.meta_cache.db", fake_db):
+            with self.subTest("initial load"):
+                cache = CovidcastMetaCache(revalidate_seconds=0)
+                snapshot = cache.get()
+                self.assertEqual(len(snapshot.epidata), 1)
+                self.assertEqual(len(fake_db.queries), 2)
+
+            with self.subTest("unchanged version is not fetched again"):
+                self.assertIs(cache.get(), snapshot)
+                self.assertEqual(len(fake_db.queries), 3)
+
+            with self.subTest("new version"):
+                fake_db.set(11, [_meta_row("src", "sig"), _meta_row("src", "sig2")])
+                snapshot = cache.get()
+                self.assertEqual(len(snapshot.epidata), 2)
+                self.assertEqual(snapshot.timestamp, 11)
+                self.assertEqual(len(fake_db.queries), 5)
+
+            with self.subTest("throttled"):
+                cache.revalidate_seconds = 3600
+                fake_db.set(12, [])
+                self.assertIs(cache.get(), snapshot)
+                self.assertEqual(len(fake_db.queries), 5)
+
+            with self.subTest("invalidate"):
+                cache.invalidate()
+                self.assertEqual(cache.get().epidata, [])
+
+    def test_age(self):
+        fake_db = _FakeDB(int(time.time()), [_meta_row("src", "sig")])
+        with patch("delphi.epidata.server.endpoints.covidcast_utils.meta_cache.db", fake_db):
+            cache = CovidcastMetaCache(revalidate_seconds=0)
+            cache.get()
+            # measured on the clock of the database
+            self.assertAlmostEqual(cache.age, 3600, delta=60)
@@ -0,0 +1,136 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from delphi.epidata.server._params import GeoSet, SourceSignalSet, TimeSet
+from delphi.epidata.server.endpoints.covidcast_utils.meta_cache import CovidcastMetaSnapshot
+from delphi.epidata.server.endpoints.covidcast_utils.result_cache import CovidcastResultCache, DiskBackend, LRUBackend
+
+# py3tester coverage target
+__test_target__ = "delphi.epidata.server.endpoints.covidcast_utils.result_cache"
+
+
+class _FakeDB:
+    """answers the signal version query of the cache from an in-memory signal_update table"""
+
+    def __init__(self, versions: dict):
+        self.versions = versions
+        self.queries = 0
+
+    def execute(self, query):
+        self.queries += 1
+        result = MagicMock()
+        result.fetchall.return_value = [(source, signal, version) for (source, signal), version in self.versions.items()]
+        return result
+
+
+class UnitTests(unittest.TestCase):
+    def test_lru_backend(self):
+        backend = LRUBackend(10)
+        backend.set("a", b"1234")
+        backend.set("b", b"1234")
+        self.assertEqual(backend.get("a"), b"1234")
+        # evicts b, the least recently used one
+        backend.set("c", b"1234")
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), b"1234")
+        self.assertEqual(backend.size, 8)
+        # too large to be stored at all
+        backend.set("d", b"x" * 11)
+        self.assertIsNone(backend.get("d"))
+        backend.set("a", b"12")
+        self.assertEqual(backend.size, 6)
+
+    def test_disk_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = DiskBackend(directory, 10)
+            backend.set("a", b"1234")
+            self.assertEqual(backend.get("a"), b"1234")
+            self.assertEqual(DiskBackend(directory, 10).get("a"), b"1234")
+            self.assertIsNone(backend.get("b"))
+            backend.set("b", b"1234")
+            backend.set("c", b"1234")
+            self.assertEqual(sum(backend.get(k) is not None for k in "abc"), 2)
+            backend.delete("c")
+            self.assertIsNone(backend.get("c"))
+
+    def test_key(self):
+        key = CovidcastResultCache.key(
+            [SourceSignalSet("src", ["b", "a"]), SourceSignalSet("src2", True)],
+            [GeoSet("state", ["pa", "ca"])],
+            TimeSet("day", [20200101, (20200102, 20200105)]),
+            format="json",
+        )
+        same = CovidcastResultCache.key(
+            [SourceSignalSet("src2", True), SourceSignalSet("src", ["a", "b"])],
+            [GeoSet("state", ["ca", "pa"])],
+            TimeSet("day", [(20200101, 20200105)]),
+            format="json",
+        )
+        self.assertEqual(key, same)
+        other_format = CovidcastResultCache.key([SourceSignalSet("src", ["a", "b"])], [GeoSet("state", ["ca", "pa"])], TimeSet("day", [(20200101, 20200105)]), format="csv")
+        self.assertNotEqual(key, other_format)
+
+    def test_invalidation(self):
+        fake_db = _FakeDB({("src", "a"): 1, ("src", "b"): 1})
+        meta = MagicMock()
+        meta.get.return_value = CovidcastMetaSnapshot(timestamp=10)
+        module = "delphi.epidata.server.endpoints.covidcast_utils.result_cache"
+        with patch(f"{module}.db", fake_db), patch(f"{module}.meta_cache", meta):
+            cache = CovidcastResultCache(LRUBackend(1000), max_entry_bytes=100, revalidate_seconds=0)
+            signals = [SourceSignalSet("src", ["a"])]
+            stamp = cache.stamp(signals)
+            self.assertIsNone(cache.get("k", stamp))
+            cache.put("k", stamp, b"body")
+            self.assertEqual(cache.get("k", cache.stamp(signals)), b"body")
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            with self.subTest("other signal updated"):
+                fake_db.versions[("src", "b")] = 2
+                self.assertEqual(cache.get("k", cache.stamp(signals)), b"body")
+            with self.subTest("signal updated"):
+                fake_db.versions[("src", "a")] = 2
+                self.assertIsNone(cache.get("k", cache.stamp(signals)))
+            with self.subTest("wildcard"):
+                wildcard = [SourceSignalSet("src", True)]
+                cache.put("w", cache.stamp(wildcard), b"all")
+                self.assertEqual(cache.get("w", cache.stamp(wildcard)), b"all")
+                fake_db.versions[("src", "c")] = 1
+                self.assertIsNone(cache.get("w", cache.stamp(wildcard)))
+            with self.subTest("meta cache updated"):
+                cache.put("k", cache.stamp(signals), b"body")
+                meta.get.return_value = CovidcastMetaSnapshot(timestamp=11)
+                self.assertIsNone(cache.get("k", cache.stamp(signals)))
+            with self.subTest("too large"):
+                cache.put("k", cache.stamp(signals), b"x" * 101)
+                self.assertIsNone(cache.get("k", cache.stamp(signals)))
+
+    def test_revalidate_seconds(self):
+        fake_db = _FakeDB({("src", "a"): 1})
+        module = "delphi.epidata.server.endpoints.covidcast_utils.result_cache"
+        meta = MagicMock()
+        meta.get.return_value = CovidcastMetaSnapshot(timestamp=10)
+        with patch(f"{module}.db", fake_db), patch(f"{module}.meta_cache", meta):
+            cache = CovidcastResultCache(LRUBackend(1000), revalidate_seconds=3600)
+            cache.stamp([SourceSignalSet("src", ["a"])])
+            cache.stamp([SourceSignalSet("src", ["a"])])
+            self.assertEqual(fake_db.queries, 1)
+
+    def test_failed_versions(self):
+        module = "delphi.epidata.server.endpoints.covidcast_utils.result_cache"
+        failing_db = MagicMock()
+        failing_db.execute.side_effect = Exception("Table 'epidata.signal_update' doesn't exist")
+        meta = MagicMock()
+        meta.get.return_value = CovidcastMetaSnapshot(timestamp=10)
+        with patch(f"{module}.db", failing_db), patch(f"{module}.meta_cache", meta):
+            cache = CovidcastResultCache(LRUBackend(1000), revalidate_seconds=3600)
+            self.assertIsNone(cache.stamp([SourceSignalSet("src", ["a"])]))
+            # not tried again before the next check
+            self.assertIsNone(cache.stamp([SourceSignalSet("src", ["a"])]))
+            self.assertEqual(failing_db.execute.call_count, 1)
+
+    def test_disabled(self):
+        cache = CovidcastResultCache(None)
+        self.assertIsNone(cache.stamp([SourceSignalSet("src", ["a"])]))
+        cache.put("k", b"stamp", b"body")
+        self.assertIsNone(cache.get("k", b"stamp"))
@@ -1,7 +1,8 @@
+from itertools import groupby
 from typing import Tuple
 import unittest
 
-from delphi.epidata.server.endpoints.covidcast_utils.trend import compute_trend_value, compute_trend_class, TrendEnum, compute_trend, Trend, compute_trends
+from delphi.epidata.server.endpoints.covidcast_utils.trend import compute_trend_value, compute_trend_class, TrendEnum, compute_trend, Trend, compute_trends, TrendSeries
 
 
 class UnitTests(unittest.TestCase):
@@ -131,3 +132,32 @@ class UnitTests(unittest.TestCase):
                 max_trend=TrendEnum.decreasing,
             ),
         )
+
+    def test_trend_series(self):
+        rows = [
+            ("gt", "a", "so", "si", 1, 12.0),
+            ("gt", "a", "so", "si", 2, 10.0),
+            ("gt", "a", "so", "si", 3, 0.0),
+            ("gt", "a", "so", "si", 5, 3.0),
+            ("gt", "b", "so", "si", 2, 5.0),
+            ("gt", "b", "so", "si", 4, 5.0),
+            ("gt", "b", "so", "si2", 1, 2.0),
+            ("gt", "b", "so", "si2", 3, 8.0),
+            ("gt", "b", "so", "si2", 4, 2.0),
+        ]
+        groups = [(key, [(row[4], row[5]) for row in group]) for key, group in groupby(rows, lambda row: row[:4])]
+        series = TrendSeries.from_rows(rows)
+
+        with self.subTest("trends"):
+            expected = [t.asdict() for key, values in groups for t in compute_trends(*key, lambda x: x - 2, values)]
+            self.assertEqual(list(series.trends(lambda x: x - 2)), expected)
+        with self.subTest("trend"):
+            for current_time, basis_time in [(3, 1), (4, 2), (5, 3), (6, 4)]:
+                expected = [compute_trend(*key, current_time, basis_time, values).asdict() for key, values in groups]
+                self.assertEqual(list(series.trend(current_time, basis_time)), expected)
+        with self.subTest("empty"):
+            self.assertEqual(list(TrendSeries.from_rows([]).trends(lambda x: x - 2)), [])
+            self.assertEqual(list(TrendSeries.from_rows([]).trend(3, 1)), [])
+        with self.subTest("source mapping"):
+            mapped = TrendSeries.from_rows(rows).map_sources(lambda source, signal: f"{source}-{signal}")
+            self.assertEqual({t["signal_source"] for t in mapped.trend(3, 1)}, {"so-si", "so-si2"})
@@ -33,3 +33,9 @@ class UnitTests(unittest.TestCase):
         self.assertEqual(rv.status_code, 200)
         self.assertEqual(msg["result"], -2)  # no result
         self.assertEqual(msg["message"], "no results")
+
+    def test_cursor_format(self):
+        rv: Response = self.client.get("/covidcast/", query_string=dict(signal="src1:*", time="day:20200101", geo="state:*", format="json", cursor="abc"))
+        msg = rv.get_json()
+        self.assertEqual(msg["result"], -1)
+        self.assertEqual(msg["message"], "cursor is only supported by the classic and tree formats")
@@ -0,0 +1,84 @@
+# standard library
+import gzip
+import unittest
+from unittest.mock import patch
+
+import orjson
+from werkzeug.test import run_wsgi_app
+
+from flask import request
+
+from delphi.epidata.server._common import app
+from delphi.epidata.server._compression import supported_encodings
+from delphi.epidata.server._printer import create_printer
+
+# py3tester coverage target
+__test_target__ = "delphi.epidata.server._compression"
+
+
+def _rows(n: int):
+    return [dict(geo_value=f"{i:05d}", signal="sig", value=i * 0.5) for i in range(n)]
+
+
+class UnitTests(unittest.TestCase):
+    """Basic unit tests."""
+
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["WTF_CSRF_ENABLED"] = False
+        app.config["DEBUG"] = False
+
+    def _print(self, format: str, rows, accept_encoding: str = None):
+        headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+        with app.test_request_context("/", query_string=dict(format=format), headers=headers):
+            p = create_printer(format)
+            p._flush_bytes = 100
+            response = p(iter(rows))
+            # the encoding is only decided when the server iterates the response
+            app_iter, _, headers = run_wsgi_app(response, request.environ)
+            data = b"".join(app_iter)
+            app_iter.close()
+            return headers, data
+
+    def test_negotiation(self):
+        self.assertEqual(supported_encodings()[-1], "gzip")
+        rows = _rows(200)
+        expected = orjson.dumps(rows)
+
+        with self.subTest("not accepted"):
+            headers, data = self._print("json", rows)
+            self.assertNotIn("Content-Encoding", headers)
+            self.assertEqual(data, expected)
+        with self.subTest("gzip"):
+            headers, data = self._print("json", rows, "gzip, deflate")
+            self.assertEqual(headers["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", headers["Vary"])
+            self.assertEqual(gzip.decompress(data), expected)
+        with self.subTest("refused"):
+            headers, data = self._print("json", rows, "gzip;q=0")
+            self.assertNotIn("Content-Encoding", headers)
+            self.assertEqual(data, expected)
+        with self.subTest("unsupported only"):
+            headers, data = self._print("json", rows, "compress")
+            self.assertNotIn("Content-Encoding", headers)
+            self.assertEqual(data, expected)
+        with self.subTest("too small"):
+            headers, data = self._print("json", rows[:2], "gzip")
+            self.assertNotIn("Content-Encoding", headers)
+            self.assertEqual(data, orjson.dumps(rows[:2]))
+        with self.subTest("already compressed"):
+            headers, data = self._print("parquet", rows, "gzip")
+            self.assertNotIn("Content-Encoding", headers)
+            self.assertTrue(data.startswith(b"PAR1"))
+
+    def test_log(self):
+        rows = _rows(200)
+        with patch("delphi.epidata.server._compression.get_structured_logger") as logger:
+            _, data = self._print("jsonl", rows, "gzip")
+        logger.assert_called_with("server_api")
+        fields = logger.return_value.info.call_args.kwargs
+        self.assertEqual(fields["format"], "jsonl")
+        self.assertEqual(fields["content_encoding"], "gzip")
+        self.assertEqual(fields["sent_bytes"], len(data))
+        self.assertEqual(fields["raw_bytes"], len(gzip.decompress(data)))
+        self.assertGreaterEqual(fields["cpu_time_ms"], fields["compression_cpu_time_ms"])
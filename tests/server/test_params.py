@@ -22,6 +22,7 @@ from delphi.epidata.server._params import (
     parse_day_range_arg,
     parse_day_arg,
     GeoSet,
+    GeoValueIndex,
     TimeSet,
     SourceSignalSet,
 )
@@ -59,6 +60,25 @@ class UnitTests(unittest.TestCase):
             self.assertEqual(GeoSet("a", True).count(), inf)
             self.assertEqual(GeoSet("a", False).count(), 0)
             self.assertEqual(GeoSet("fips", [FIPS[0], FIPS[1]]).count(), 2)
+        with self.subTest("invalid"):
+            with app.test_request_context("/"):
+                with self.assertRaises(ValidationFailedException):
+                    GeoSet("county", [FIPS[0], "99999"])
+
+    def test_geo_value_index(self):
+        index = GeoValueIndex()
+        self.assertFalse(index.is_loaded)
+        with self.subTest("unknown geo_type"):
+            self.assertIsNone(index.get("fips"))
+            self.assertEqual((index.hits, index.misses), (0, 0))
+        with self.subTest("lazy load"):
+            self.assertIn(FIPS[0], index.get("county"))
+            self.assertTrue(index.is_loaded)
+            self.assertEqual((index.hits, index.misses), (0, 1))
+        with self.subTest("hit"):
+            self.assertIn(MSA[0], index.get("msa"))
+            self.assertIsInstance(index.get("msa"), frozenset)
+            self.assertEqual((index.hits, index.misses), (2, 1))
 
     def test_source_signal_set(self):
         with self.subTest("*"):
@@ -0,0 +1,207 @@
+# standard library
+import csv
+import gzip
+from io import BytesIO, StringIO
+import unittest
+
+from flask import g
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from delphi.epidata.server._common import app
+from delphi.epidata.server._printer import create_printer, CSVPrinter, _gzip_stream
+
+# py3tester coverage target
+__test_target__ = "delphi.epidata.server._printer"
+
+
+def _rows(n: int):
+    return [dict(geo_value=f"{i:05d}", signal=f"sig{i % 2}", value=i * 0.5 if i % 3 else None, name='a"é') for i in range(n)]
+
+
+class UnitTests(unittest.TestCase):
+    """Basic unit tests."""
+
+    def setUp(self):
+        app.config["TESTING"] = True
+        app.config["WTF_CSRF_ENABLED"] = False
+        app.config["DEBUG"] = False
+
+    def _print(self, format: str, rows, flush_bytes: int = 0, batch_rows: int = 7, compatibility: bool = False):
+        with app.test_request_context("/"):
+            g.compatibility = compatibility
+            p = create_printer(format)
+            p._flush_bytes = flush_bytes
+            p._batch_rows = batch_rows
+            chunks = list(p(iter(rows)).response)
+            return chunks, p
+
+    def test_formats(self):
+        rows = _rows(20)
+        with self.subTest("json"):
+            chunks, _ = self._print("json", rows)
+            self.assertEqual(b"".join(chunks), orjson.dumps(rows))
+        with self.subTest("jsonl"):
+            chunks, _ = self._print("jsonl", rows)
+            self.assertEqual(b"".join(chunks), b"".join(orjson.dumps(r) + b"\n" for r in rows))
+        with self.subTest("classic"):
+            chunks, _ = self._print(None, rows)
+            self.assertEqual(orjson.loads(b"".join(chunks)), dict(epidata=rows, result=1, message="success"))
+        with self.subTest("classic compatibility"):
+            chunks, _ = self._print(None, rows, compatibility=True)
+            self.assertEqual(orjson.loads(b"".join(chunks)), dict(epidata=rows, result=1, message="success"))
+        with self.subTest("tree"):
+            chunks, _ = self._print("tree", _rows(4))
+            tree = orjson.loads(b"".join(chunks))["epidata"][0]
+            self.assertEqual(sorted(tree), ["sig0", "sig1"])
+            self.assertEqual([r["geo_value"] for r in tree["sig1"]], ["00001", "00003"])
+        with self.subTest("no rows"):
+            chunks, _ = self._print("json", [])
+            self.assertEqual(b"".join(chunks), b"[]")
+
+    def test_chunks(self):
+        rows = _rows(100)
+        expected, _ = self._print("json", rows, flush_bytes=1 << 20, batch_rows=1000)
+        self.assertEqual(len(expected), 1)
+        for flush_bytes, batch_rows in ((0, 1), (0, 7), (500, 7), (500, 1000)):
+            with self.subTest(flush_bytes=flush_bytes, batch_rows=batch_rows):
+                chunks, p = self._print("json", rows, flush_bytes=flush_bytes, batch_rows=batch_rows)
+                self.assertEqual(b"".join(chunks), expected[0])
+                self.assertTrue(all(len(c) >= flush_bytes for c in chunks[:-1]))
+                self.assertEqual(p.count, 100)
+
+    def test_limit(self):
+        with app.test_request_context("/"):
+            p = create_printer("json")
+            p._max_results = 5
+            p._batch_rows = 2
+            data = b"".join(p(iter(_rows(20))).response)
+        self.assertEqual(orjson.loads(data), _rows(5))
+        self.assertEqual(p.result, 2)
+
+    def test_unserializable_row(self):
+        rows = _rows(5)
+        rows[3]["value"] = object()
+        chunks, p = self._print("json", rows)
+        data = b"".join(chunks)
+        # the rows before the broken one are sent as before, followed by the error
+        self.assertTrue(data.startswith(orjson.dumps(rows[:3])[:-1] + b"{"))
+        self.assertIn(b'"result":-1', data.replace(b" ", b""))
+        self.assertEqual(p.result, -1)
+
+    def test_csv(self):
+        rows = _rows(20)
+        rows[2]["name"] = "comma, and\nnewline"
+        stream = StringIO()
+        writer = csv.DictWriter(stream, list(rows[0].keys()), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+        expected = stream.getvalue().encode("utf-8")
+
+        with self.subTest("matches DictWriter"):
+            chunks, _ = self._print("csv", rows)
+            self.assertEqual(b"".join(chunks), expected)
+        with self.subTest("missing and unknown fields"):
+            chunks, p = self._print("csv", [dict(a=1, b=2), dict(a=3), dict(a=4, c=5)])
+            data = b"".join(chunks).decode("utf-8")
+            self.assertTrue(data.startswith("a,b\n1,2\n3,\nunknown error occurred:\n"))
+            self.assertEqual(p.result, -1)
+        with self.subTest("independent instances"):
+            with app.test_request_context("/"):
+                a, b = CSVPrinter(), CSVPrinter()
+                a._batch_rows = b._batch_rows = 1
+                a._flush_bytes = b._flush_bytes = 0
+                gen_a = iter(a(iter(rows)).response)
+                gen_b = iter(b(iter([dict(x=1), dict(x=2)])).response)
+                data_a, data_b = [next(gen_a)], [next(gen_b)]
+                data_a.extend(gen_a)
+                data_b.extend(gen_b)
+            self.assertEqual(b"".join(data_a), expected)
+            self.assertEqual(b"".join(data_b), b"x\n1\n2\n")
+        with self.subTest("gzip"):
+            with app.test_request_context("/"):
+                p = CSVPrinter("test", gzip=True)
+                p._flush_bytes = 0
+                response = p(iter(rows))
+                data = b"".join(response.response)
+            self.assertEqual(response.mimetype, "application/gzip")
+            self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=test.csv.gz")
+            self.assertEqual(gzip.decompress(data), expected)
+        with self.subTest("gzip closed early"):
+            closed = []
+
+            def chunks():
+                try:
+                    while True:
+                        yield b"x" * 100000
+                finally:
+                    closed.append(True)
+
+            # still referenced, as by stream_with_context
+            gen = chunks()
+            stream = _gzip_stream(gen)
+            next(stream)
+            stream.close()
+            self.assertEqual(closed, [True])
+
+    def test_arrow(self):
+        rows = _rows(30)
+        for format, read in (("arrow", lambda data: pa.ipc.open_stream(data).read_all()), ("parquet", lambda data: pq.read_table(BytesIO(data)))):
+            with self.subTest(format):
+                with app.test_request_context("/"):
+                    p = create_printer(format)
+                    p._batch_rows = 7
+                    p.set_fields(["geo_value", "signal", "name"], [], ["value"])
+                    table = read(b"".join(p(iter(rows)).response))
+                self.assertEqual(table.schema, pa.schema([("geo_value", pa.string()), ("signal", pa.string()), ("value", pa.float64()), ("name", pa.string())]))
+                self.assertEqual(table.to_pylist(), rows)
+            with self.subTest(f"{format} without rows"):
+                with app.test_request_context("/"):
+                    p = create_printer(format)
+                    p.set_fields(["geo_value"], ["time_value"], [])
+                    table = read(b"".join(p(iter([])).response))
+                self.assertEqual(table.num_rows, 0)
+                self.assertEqual(table.schema, pa.schema([("geo_value", pa.string()), ("time_value", pa.int64())]))
+            with self.subTest(f"{format} incomplete after error"):
+                broken = _rows(5)
+                broken[3]["value"] = "not a float"
+                with app.test_request_context("/"):
+                    p = create_printer(format)
+                    p._batch_rows = 2
+                    p.set_fields([], [], ["value"])
+                    data = b"".join(p(iter(broken)).response)
+                self.assertEqual(p.result, -1)
+                with self.assertRaises(pa.ArrowInvalid):
+                    read(data)
+
+    def test_capture(self):
+        rows = _rows(20)
+        for format in ("json", "csv", "classic"):
+            with self.subTest(format):
+                captured = []
+                with app.test_request_context("/"):
+                    p = create_printer(None if format == "classic" else format)
+                    p._flush_bytes = 0
+                    p.capture(captured.append, 1 << 20)
+                    data = b"".join(p(iter(rows)).response)
+                    replayed = b"".join(create_printer(None if format == "classic" else format).replay(captured[0]).response)
+                self.assertEqual(captured, [data])
+                self.assertEqual(replayed, data)
+        with self.subTest("too large"):
+            captured = []
+            with app.test_request_context("/"):
+                p = create_printer("json")
+                p._flush_bytes = 0
+                p.capture(captured.append, 100)
+                b"".join(p(iter(rows)).response)
+            self.assertEqual(captured, [])
+        with self.subTest("failed"):
+            broken = _rows(5)
+            broken[3]["value"] = object()
+            captured = []
+            with app.test_request_context("/"):
+                p = create_printer("json")
+                p.capture(captured.append, 1 << 20)
+                b"".join(p(iter(broken)).response)
+            self.assertEqual(captured, [])
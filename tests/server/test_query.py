@@ -2,20 +2,37 @@
 
 # standard library
 import unittest
+from unittest.mock import patch
 import base64
+from datetime import date
+from decimal import Decimal
+
+import orjson
+from sqlalchemy import create_engine, text
 
 # from flask.testing import FlaskClient
 from delphi.epidata.server._common import app
 from delphi.epidata.server._query import (
     date_string,
     to_condition,
+    filter_values,
     filter_strings,
     filter_integers,
     filter_dates,
     filter_geo_sets,
     filter_source_signal_sets,
     filter_time_set,
+    parse_row,
+    RowParser,
+    iter_parsed_rows,
+    filter_after,
+    encode_cursor,
+    decode_cursor,
+    execute_query,
+    QueryBuilder,
+    choose_as_of_strategy,
 )
+from delphi.epidata.server._exceptions import ValidationFailedException
 from delphi.epidata.server._params import (
     GeoSet,
     TimeSet,
@@ -27,6 +44,21 @@ from delphi.epidata.acquisition.covidcast.test_utils import FIPS, MSA
 __test_target__ = "delphi.epidata.server._query"
 
 
+class _Row(tuple):
+    """minimal stand-in for a sqlalchemy Row, accessible by position and by key"""
+
+    def __new__(cls, values: dict):
+        row = super().__new__(cls, values.values())
+        row._keys = list(values)
+        return row
+
+    def keys(self):
+        return self._keys
+
+    def __getitem__(self, key):
+        return super().__getitem__(self._keys.index(key) if isinstance(key, str) else key)
+
+
 class UnitTests(unittest.TestCase):
     """Basic unit tests."""
 
@@ -56,12 +88,12 @@ class UnitTests(unittest.TestCase):
         self.assertEqual(filter_strings("a", ["1"], "a", params), "(a = :a_0)")
         self.assertEqual(params, {"a_0": "1"})
         params = {}
-        self.assertEqual(filter_strings("a", ["1", "2"], "a", params), "(a = :a_0 OR a = :a_1)")
+        self.assertEqual(filter_strings("a", ["1", "2"], "a", params), "(a IN (:a_0, :a_1))")
         self.assertEqual(params, {"a_0": "1", "a_1": "2"})
         params = {}
         self.assertEqual(
             filter_strings("a", ["1", "2", ("1", "4")], "a", params),
-            "(a = :a_0 OR a = :a_1 OR a BETWEEN :a_2 AND :a_2_2)",
+            "(a IN (:a_0, :a_1) OR a BETWEEN :a_2 AND :a_2_2)",
         )
         self.assertEqual(params, {"a_0": "1", "a_1": "2", "a_2": "1", "a_2_2": "4"})
 
@@ -73,14 +105,34 @@ class UnitTests(unittest.TestCase):
         self.assertEqual(filter_integers("a", [1], "a", params), "(a = :a_0)")
         self.assertEqual(params, {"a_0": 1})
         params = {}
-        self.assertEqual(filter_integers("a", [1, 2], "a", params), "(a = :a_0 OR a = :a_1)")
-        self.assertEqual(params, {"a_0": 1, "a_1": 2})
+        self.assertEqual(filter_integers("a", [1, 3], "a", params), "(a IN (:a_0, :a_1))")
+        self.assertEqual(params, {"a_0": 1, "a_1": 3})
+        params = {}
+        self.assertEqual(filter_integers("a", [1, 2], "a", params), "(a BETWEEN :a_0 AND :a_0_2)")
+        self.assertEqual(params, {"a_0": 1, "a_0_2": 2})
         params = {}
         self.assertEqual(
             filter_integers("a", [1, 2, (1, 4)], "a", params),
-            "(a = :a_0 OR a = :a_1 OR a BETWEEN :a_2 AND :a_2_2)",
+            "(a BETWEEN :a_0 AND :a_0_2)",
         )
-        self.assertEqual(params, {"a_0": 1, "a_1": 2, "a_2": 1, "a_2_2": 4})
+        self.assertEqual(params, {"a_0": 1, "a_0_2": 4})
+        params = {}
+        self.assertEqual(
+            filter_integers("a", [9, 1, 3, (5, 6), 2, 20], "a", params),
+            "(a IN (:a_0, :a_1) OR a BETWEEN :a_2 AND :a_2_2 OR a BETWEEN :a_3 AND :a_3_2)",
+        )
+        self.assertEqual(params, {"a_0": 9, "a_1": 20, "a_2": 1, "a_2_2": 3, "a_3": 5, "a_3_2": 6})
+
+    def test_filter_values_chunks(self):
+        params = {}
+        self.assertEqual(
+            filter_values("a", ["1", "2", "3", "4", "5"], "a", params, max_in_list_size=2),
+            "(a IN (:a_0, :a_1) OR a IN (:a_2, :a_3) OR a = :a_4)",
+        )
+        self.assertEqual(params, {"a_0": "1", "a_1": "2", "a_2": "3", "a_3": "4", "a_4": "5"})
+        params = {}
+        self.assertEqual(filter_values("a", ["1", "2", "1"], "a", params), "(a IN (:a_0, :a_1))")
+        self.assertEqual(params, {"a_0": "1", "a_1": "2"})
 
     def test_filter_dates(self):
         params = {}
@@ -101,7 +153,7 @@ class UnitTests(unittest.TestCase):
         params = {}
         self.assertEqual(
             filter_dates("a", [20200101, 20200103], "a", params),
-            "(a = :a_0 OR a = :a_1)",
+            "(a IN (:a_0, :a_1))",
         )
         self.assertEqual(params, {"a_0": "2020-01-01", "a_1": "2020-01-03"})
         params = {}
@@ -119,7 +171,7 @@ class UnitTests(unittest.TestCase):
         params = {}
         self.assertEqual(
             filter_dates("a", [20200101, 20200103, (20200105, 20200107)], "a", params),
-            "(a = :a_0 OR a = :a_1 OR a BETWEEN :a_2 AND :a_2_2)",
+            "(a IN (:a_0, :a_1) OR a BETWEEN :a_2 AND :a_2_2)",
         )
         self.assertEqual(
             params,
@@ -154,7 +206,7 @@ class UnitTests(unittest.TestCase):
             params = {}
             self.assertEqual(
                 filter_geo_sets("t", "v", [GeoSet("fips", [FIPS[0], FIPS[1]])], "p", params),
-                "((t = :p_0t AND (v = :p_0t_0 OR v = :p_0t_1)))",
+                "((t = :p_0t AND (v IN (:p_0t_0, :p_0t_1))))",
             )
             self.assertEqual(params, {"p_0t": "fips", "p_0t_0": FIPS[0], "p_0t_1": FIPS[1]})
         with self.subTest("multiple pairs"):
@@ -210,7 +262,7 @@ class UnitTests(unittest.TestCase):
             params = {}
             self.assertEqual(
                 filter_source_signal_sets("t", "v", [SourceSignalSet("src1", ["sig1", "sig2"])], "p", params),
-                "((t = :p_0t AND (v = :p_0t_0 OR v = :p_0t_1)))",
+                "((t = :p_0t AND (v IN (:p_0t_0, :p_0t_1))))",
             )
             self.assertEqual(params, {"p_0t": "src1", "p_0t_0": "sig1", "p_0t_1": "sig2"})
         with self.subTest("multiple pairs"):
@@ -269,7 +321,7 @@ class UnitTests(unittest.TestCase):
             params = {}
             self.assertEqual(
                 filter_time_set("t", "v", TimeSet("day", [20201201, 20201203]), "p", params),
-                "((t = :p_0t AND (v = :p_0t_0 OR v = :p_0t_1)))",
+                "((t = :p_0t AND (v IN (:p_0t_0, :p_0t_1))))",
             )
             self.assertEqual(params, {"p_0t": "day", "p_0t_0": 20201201, "p_0t_1": 20201203})
         with self.subTest("range"):
@@ -297,6 +349,137 @@ class UnitTests(unittest.TestCase):
             params = {}
             self.assertEqual(
                 filter_time_set("t", "v", TimeSet("day", [20200101, 20200103, (20200105, 20200107)]), "p", params),
-                "((t = :p_0t AND (v = :p_0t_0 OR v = :p_0t_1 OR v BETWEEN :p_0t_2 AND :p_0t_2_2)))",
+                "((t = :p_0t AND (v IN (:p_0t_0, :p_0t_1) OR v BETWEEN :p_0t_2 AND :p_0t_2_2)))",
             )
             self.assertEqual(params, {"p_0t": "day", "p_0t_0": 20200101, "p_0t_1": 20200103, 'p_0t_2': 20200105, 'p_0t_2_2': 20200107})           
+
+    def test_row_parser(self):
+        fields_string = ["s", "d", "missing_s"]
+        fields_int = ["i", "missing_i"]
+        fields_float = ["f"]
+        # rows as returned by drivers that do not convert dates and decimals themselves
+        rows = [
+            _Row(dict(s=s, d=d, i=i, f=f))
+            for s, d, i, f in (("a", date(2020, 1, 2), None, None), (None, "2020-01-03", Decimal(4), "1.5"), ("c", None, 5, 2))
+        ]
+        with self.subTest("matches parse_row"):
+            parser = RowParser(rows[0].keys(), fields_string, fields_int, fields_float)
+            for row in rows:
+                parsed = parser(row)
+                self.assertEqual(parsed, parse_row(row, fields_string, fields_int, fields_float))
+                self.assertEqual(list(parsed), ["s", "d", "missing_s", "i", "missing_i", "f"])
+        with self.subTest("converted values"):
+            parsed = RowParser(rows[0].keys(), fields_string, fields_int, fields_float).parse_batch(rows)
+            self.assertEqual([r["d"] for r in parsed], ["2020-01-02", "2020-01-03", None])
+            self.assertEqual([r["i"] for r in parsed], [None, 4, 5])
+            self.assertEqual([type(r["i"]) for r in parsed], [type(None), int, int])
+            self.assertEqual([r["f"] for r in parsed], [None, 1.5, 2.0])
+            self.assertEqual([type(r["f"]) for r in parsed], [type(None), float, float])
+            self.assertTrue(all(r["missing_s"] is None and r["missing_i"] is None for r in parsed))
+        with self.subTest("no fields"):
+            self.assertEqual(RowParser(rows[0].keys())(rows[0]), {})
+
+    def test_iter_parsed_rows(self):
+        conn = create_engine("sqlite://").connect()
+        conn.execute(text("CREATE TABLE t (v INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (:v)"), [dict(v=v) for v in range(5)])
+        result = conn.execute(text("SELECT v FROM t ORDER BY v"))
+        parsed = list(iter_parsed_rows(result, fields_int=["v"], batch_size=2))
+        self.assertEqual([p for p, _ in parsed], [dict(v=v) for v in range(5)])
+        self.assertEqual([row["v"] for _, row in parsed], list(range(5)))
+
+    def test_filter_after(self):
+        with self.subTest("sql"):
+            params = {}
+            self.assertEqual(
+                filter_after(["a", "b", "c"], ["x", 1, 2], "p", params),
+                "(a >= :p_0 AND (a > :p_0 OR (a = :p_0 AND (b > :p_1 OR (b = :p_1 AND c > :p_2)))))",
+            )
+            self.assertEqual(params, {"p_0": "x", "p_1": 1, "p_2": 2})
+        with self.subTest("seek"):
+            conn = create_engine("sqlite://").connect()
+            conn.execute(text("CREATE TABLE t (a TEXT, b INTEGER, c INTEGER)"))
+            keys = [(a, b, c) for a in "xyz" for b in range(3) for c in range(3)]
+            conn.execute(text("INSERT INTO t VALUES (:a, :b, :c)"), [dict(a=a, b=b, c=c) for a, b, c in keys])
+            for i, key in enumerate(keys):
+                params = {}
+                condition = filter_after(["a", "b", "c"], key, "p", params)
+                rows = conn.execute(text(f"SELECT a, b, c FROM t WHERE {condition} ORDER BY a, b, c"), **params).fetchall()
+                self.assertEqual([tuple(r) for r in rows], keys[i + 1 :])
+
+    def test_cursor(self):
+        fields = ["source", "signal", "time_value"]
+        cursor = encode_cursor(fields, ["src", "sig", 20200101])
+        self.assertEqual(decode_cursor(cursor, fields), ["src", "sig", 20200101])
+        with self.subTest("query builder"):
+            q = QueryBuilder("t", "t").set_sort_order(*fields)
+            q.apply_cursor_filter(cursor)
+            self.assertEqual(q.conditions, [filter_after(["t.source", "t.signal", "t.time_value"], ["src", "sig", 20200101], "cursor", {})])
+            self.assertEqual(q.params, {"cursor_0": "src", "cursor_1": "sig", "cursor_2": 20200101})
+        with app.test_request_context("/"):
+            for invalid in ("abc", encode_cursor(fields[:2], ["src", "sig"]), encode_cursor(fields, ["src", "sig", [1]])):
+                with self.subTest(invalid=invalid):
+                    with self.assertRaises(ValidationFailedException):
+                        decode_cursor(invalid, fields)
+
+    def test_execute_query_cursor(self):
+        conn = create_engine("sqlite://").connect()
+        conn.execute(text("CREATE TABLE t (signal TEXT, time_value INTEGER, value REAL)"))
+        conn.execute(text("INSERT INTO t VALUES (:signal, :time_value, :value)"), [dict(signal=s, time_value=t, value=t * 0.5) for s in ("a", "b") for t in range(5)])
+
+        def page(cursor=None):
+            q = QueryBuilder("t", "t").set_sort_order("signal", "time_value")
+            q.set_fields(["signal"], ["time_value"], ["value"])
+            q.apply_cursor_filter(cursor)
+            with app.test_request_context("/"):
+                r = execute_query(str(q), q.params, ["signal"], ["time_value"], ["value"], cursor_fields=q.sort_fields)
+                return orjson.loads(b"".join(r.response))
+
+        with patch("delphi.epidata.server._query.db", conn), patch("delphi.epidata.server._printer.MAX_RESULTS", 4):
+            rows, cursor = [], None
+            while True:
+                response = page(cursor)
+                rows.extend(response["epidata"])
+                if response["result"] != 2:
+                    break
+                self.assertEqual(len(response["epidata"]), 4)
+                cursor = response["cursor"]
+        self.assertEqual([(r["signal"], r["time_value"]) for r in rows], [(s, t) for s in ("a", "b") for t in range(5)])
+
+    def test_as_of_strategies(self):
+        conn = create_engine("sqlite://").connect()
+        conn.execute(text("CREATE TABLE t (signal_key_id INTEGER, geo_key_id INTEGER, source TEXT, signal TEXT, time_type TEXT, time_value INTEGER, geo_type TEXT, geo_value TEXT, issue INTEGER, value REAL)"))
+        rows = [
+            dict(signal_key_id=s, geo_key_id=g, source="src", signal=f"sig{s}", time_type="day", time_value=t, geo_type="state", geo_value=f"g{g}", issue=issue, value=s + g + t + issue)
+            for s in (1, 2)
+            for g in (1, 2, 3)
+            for t in (20200101, 20200102)
+            for issue in range(20200101 + (g % 2), 20200106, 2)
+        ]
+        conn.execute(text("INSERT INTO t VALUES (:signal_key_id, :geo_key_id, :source, :signal, :time_type, :time_value, :geo_type, :geo_value, :issue, :value)"), rows)
+
+        def query(strategy: str, as_of: int):
+            q = QueryBuilder("latest", "t").set_sort_order("signal", "time_value", "geo_value")
+            q.set_fields(["signal", "geo_value"], ["time_value", "issue"], ["value"])
+            q.where(signal="sig1")
+            q.apply_as_of_filter("t", as_of, strategy)
+            return [tuple(r) for r in conn.execute(text(str(q)), **q.params)]
+
+        for as_of in (20200100, 20200102, 20200104, 20200110):
+            expected = sorted(
+                max(((r["signal"], r["time_value"], r["geo_value"], r["issue"], r["value"]) for r in rows if r["signal"] == "sig1" and r["issue"] <= as_of and (r["time_value"], r["geo_value"]) == key), key=lambda r: r[3])
+                for key in {(r["time_value"], r["geo_value"]) for r in rows if r["issue"] <= as_of}
+            )
+            for strategy in ("join", "window", "seek"):
+                with self.subTest(strategy=strategy, as_of=as_of):
+                    self.assertEqual([(r[0], r[2], r[1], r[3], r[4]) for r in query(strategy, as_of)], expected)
+
+        with self.subTest("choose"):
+            # dma values are not validated
+            signals = [SourceSignalSet("src", ["sig1", "sig2"])]
+            days = TimeSet("day", [(20200101, 20200130)])
+            self.assertEqual(choose_as_of_strategy(signals, [GeoSet("dma", ["500", "501"])], days), "seek")
+            self.assertEqual(choose_as_of_strategy(signals, [GeoSet("dma", [str(v) for v in range(500, 1000)])], days), "join")
+            self.assertEqual(choose_as_of_strategy(signals, [GeoSet("county", True)], days), "window")
+            with patch("delphi.epidata.server._query.COVIDCAST_AS_OF_STRATEGY", "join"):
+                self.assertEqual(choose_as_of_strategy(signals, [GeoSet("dma", ["500"])], days), "join")
@@ -2,7 +2,7 @@ import unittest
 from datetime import date
 from epiweeks import Week
 
-from delphi.epidata.server.utils.dates import time_value_to_day, day_to_time_value, shift_day_value, time_value_to_iso, days_in_range, weeks_in_range, week_to_time_value, time_value_to_week, time_values_to_ranges
+from delphi.epidata.server.utils.dates import time_value_to_day, day_to_time_value, shift_day_value, shift_week_value, shift_day_values, shift_week_values, time_value_to_iso, time_values_to_iso, days_in_range, weeks_in_range, week_to_time_value, time_value_to_week, time_values_to_ranges
 
 
 class UnitTests(unittest.TestCase):
@@ -17,10 +17,31 @@ class UnitTests(unittest.TestCase):
     def test_shift_day_value(self):
         self.assertEqual(shift_day_value(20201010, -3), 20201007)
         self.assertEqual(shift_day_value(20201010, -12), 20200928)
+        # outside of the precomputed calendar
+        self.assertEqual(shift_day_value(20000102, -3), 19991230)
+        self.assertEqual(shift_day_value(20401230, 3), 20410102)
+        self.assertEqual(shift_day_value(19500101, 1), 19500102)
+        with self.assertRaises(ValueError):
+            shift_day_value(20200230, 1)
+
+    def test_shift_week_value(self):
+        self.assertEqual(shift_week_value(202052, 2), 202101)
+        self.assertEqual(shift_week_value(202101, -1), 202053)
+        self.assertEqual(shift_week_value(200001, -1), 199952)
+
+    def test_shift_values(self):
+        self.assertEqual(shift_day_values([20201010, 20210301, 20000101, 19991231], -3).tolist(), [20201007, 20210226, 19991229, 19991228])
+        self.assertEqual(shift_day_values([20201010], 0).tolist(), [20201010])
+        self.assertEqual(shift_week_values([202052, 202101, 204052], 2).tolist(), [202101, 202103, 204102])
 
     def test_time_value_to_iso(self):
         self.assertEqual(time_value_to_iso(20201010), "2020-10-10")
         self.assertEqual(time_value_to_iso(20190201), "2019-02-01")
+        self.assertEqual(time_value_to_iso(19500201), "1950-02-01")
+
+    def test_time_values_to_iso(self):
+        self.assertEqual(time_values_to_iso([20201010, 20190201, 19500201]), ["2020-10-10", "2019-02-01", "1950-02-01"])
+        self.assertEqual(time_values_to_iso([]), [])
 
     def test_days_in_range(self):
         self.assertEqual(days_in_range((20201010, 20201010)), 1)